@@ -1,24 +1,121 @@
+import functools
 import os
 
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./medapp.db")
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "false").lower() == "true"
+# per worker process: budget workers x (size + overflow) <= max_connections
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+
+ALEMBIC_INI = os.path.join(
+    os.path.dirname(__file__), os.pardir, os.pardir, "alembic.ini"
+)
 
 connect_args = {"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
 
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
+_url = make_url(DATABASE_URL)
+# in-memory SQLite keeps one connection per thread (SingletonThreadPool), which
+# takes no size settings; every other database gets a QueuePool
+pool_args = (
+    {}
+    if _url.get_backend_name() == "sqlite" and _url.database in (None, "", ":memory:")
+    else {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW}
+)
+
+engine = create_engine(DATABASE_URL, connect_args=connect_args, **pool_args)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# A worker forked from a preloaded parent (gunicorn --preload) opens its own
+# connections instead of sharing the parent's sockets.
+os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
+
+def warm_pool(size: int = DB_POOL_SIZE) -> None:
+    """Open `size` pooled connections now, not on the first requests."""
+    connections = []
+    try:
+        for _ in range(min(size, DB_POOL_SIZE)):
+            connections.append(engine.connect())
+    finally:
+        for conn in connections:
+            conn.close()
+
 
 def get_db():
+    """The request's unit of work.
+
+    Endpoints add and flush their changes (audit entries included) without
+    committing; they are committed together once the endpoint and the
+    serialization of its response have succeeded, and rolled back if either
+    raises. Rows flushed in the request stay loaded for the response, so
+    nothing is refreshed after the commit.
+    """
     db = SessionLocal()
     try:
         yield db
+        db.commit()
     finally:
         db.close()
+
+
+def _alembic_config():
+    from alembic.config import Config
+
+    return Config(os.path.abspath(ALEMBIC_INI))
+
+
+def run_migrations(revision: str = "head") -> None:
+    """Upgrade the database to `revision` (what `alembic upgrade` does)."""
+    from alembic import command
+
+    cfg = _alembic_config()
+    cfg.attributes["configure_logger"] = False
+    command.upgrade(cfg, revision)
+
+
+@functools.lru_cache(maxsize=None)
+def _head_revisions() -> frozenset[str]:
+    from alembic.script import ScriptDirectory
+
+    return frozenset(ScriptDirectory.from_config(_alembic_config()).get_heads())
+
+
+def verify_schema_version() -> None:
+    """Raise RuntimeError if the database is not at the latest migration.
+
+    One read of the ``alembic_version`` table, compared against the head
+    revision on disk (read once per process).
+    """
+    from alembic.runtime.migration import MigrationContext
+
+    heads = _head_revisions()
+    with engine.connect() as conn:
+        current = set(MigrationContext.configure(conn).get_current_heads())
+    if current != heads:
+        raise RuntimeError(
+            f"Database schema is at {sorted(current) or 'no revision'}, "
+            f"expected {sorted(heads)}. Run `alembic upgrade head`."
+        )
+
+
+def check_schema_version() -> None:
+    """Fail fast if the database is not at the latest migration.
+
+    This is the only schema work done on worker startup; nothing touches the
+    database when the app is imported. Migrations themselves are applied out
+    of band with ``alembic upgrade head`` (or on startup when
+    DB_AUTO_MIGRATE=true, for local development).
+    """
+    if DB_AUTO_MIGRATE:
+        run_migrations()
+        return
+    verify_schema_version()
@@ -1,35 +1,90 @@
+import asyncio
 import os
+from contextlib import asynccontextmanager
 
 from dotenv import load_dotenv
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi import Limiter, _rate_limit_exceeded_handler
+from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
-from slowapi.middleware import SlowAPIMiddleware
-from slowapi.util import get_remote_address
+from sqlalchemy.orm import configure_mappers
 
-from app.config.database import engine
-from app.models import Base
-from app.routers import admin, auth, doctors, files, lab, patients
+from app.config.database import check_schema_version, engine, warm_pool
+from app.routers import (
+    admin,
+    auth,
+    doctors,
+    events,
+    files,
+    health,
+    lab,
+    metrics,
+    patients,
+)
+from app.utils import crypto
+from app.utils.auth import pwd_context
+from app.utils.events import EVENTS_FANOUT, listen as listen_for_events
+from app.utils.metrics import instrument_engine
+from app.utils.ratelimit import RateLimitMiddleware, limiter
+from app.utils.scheduler import SCHEDULER_ENABLED, run_scheduler
+from app.utils.timing import TimingMiddleware
 
 load_dotenv()
 
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
 
-# Create all database tables
-Base.metadata.create_all(bind=engine)
+
+def preload() -> None:
+    """Set-up shared by every worker: done once in the gunicorn master before
+    it forks them (see gunicorn.conf.py), or at startup otherwise.
+
+    Configures the ORM mappers, which would otherwise happen on the first
+    query, loads the encryption key, so a bad key stops the server at startup
+    instead of failing requests, and builds the password hashing context.
+    None of this happens on import, which stays cheap for tests and tools.
+    """
+    configure_mappers()
+    crypto.load_keys()
+    pwd_context()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema changes are applied by `alembic upgrade head`; workers only
+    # check that the database is at the expected revision.
+    check_schema_version()
+    preload()
+    # connections cannot be inherited from the master; open this worker's
+    await asyncio.to_thread(warm_pool)
+    # Housekeeping jobs (assignment expiry, cleanup, scrubbing); every worker
+    # starts the loop, one of them is elected to run the jobs.
+    tasks = []
+    if SCHEDULER_ENABLED:
+        tasks.append(asyncio.create_task(run_scheduler()))
+    # with EVENTS_FANOUT=postgres, events from every worker arrive by NOTIFY
+    if EVENTS_FANOUT == "postgres":
+        tasks.append(asyncio.create_task(listen_for_events()))
+    yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    engine.dispose()
+
 
 app = FastAPI(
     title="MedConnect API",
     description="Medical Records & Appointment Booking System",
     version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
-# Rate limiting
-limiter = Limiter(key_func=get_remote_address)
+# Rate limiting: token buckets per user (or per IP when anonymous) in storage
+# shared by all workers; see app/utils/ratelimit.py
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-app.add_middleware(SlowAPIMiddleware)
+app.add_middleware(RateLimitMiddleware)
 
 # CORS - allow Next.js dev server
 app.add_middleware(
@@ -40,12 +95,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-request spans, Server-Timing header and /metrics histograms. Added last
+# so it wraps the other middleware and times the whole request.
+instrument_engine(engine)
+app.add_middleware(TimingMiddleware)
+
 app.include_router(auth.router)
 app.include_router(patients.router)
 app.include_router(doctors.router)
 app.include_router(admin.router)
 app.include_router(lab.router)
 app.include_router(files.router)
+app.include_router(events.router)
+app.include_router(metrics.router)
+app.include_router(health.router)
 
 
 @app.get("/", tags=["root"])
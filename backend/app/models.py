@@ -1,8 +1,19 @@
 import enum
 from datetime import datetime
 
-from sqlalchemy import Column, DateTime, Enum, ForeignKey, Integer, String, Text
-from sqlalchemy.orm import relationship
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    Enum,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    text,
+)
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.types import TypeDecorator
 
 from app.config.database import Base
@@ -10,7 +21,13 @@ from app.utils import crypto
 
 
 class EncryptedText(TypeDecorator):
-    """Transparently encrypts/decrypts text columns using AES-256-GCM."""
+    """Transparently encrypts/decrypts text columns using AES-256-GCM.
+
+    Columns of this type are declared `deferred`: they are only fetched, and
+    decrypted, when first accessed or when a query asks for them with
+    `undefer`. Lists that return them must undefer them, or each row costs a
+    query of its own.
+    """
 
     impl = Text
     cache_ok = True
@@ -53,6 +70,9 @@ class User(Base):
     specialty = Column(String, nullable=True)  # for doctors
     phone = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # bumped whenever an appointment or lab assignment in this user's lists
+    # changes; see app/utils/sync.py
+    sync_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     # relationships
     appointments_as_patient = relationship(
@@ -82,15 +102,33 @@ class User(Base):
 
 class Appointment(Base):
     __tablename__ = "appointments"
+    __table_args__ = (
+        Index("ix_appointments_doctor_id_date", "doctor_id", "date"),
+        Index("ix_appointments_patient_id_updated_at", "patient_id", "updated_at"),
+        Index("ix_appointments_doctor_id_updated_at", "doctor_id", "updated_at"),
+        # one live booking per slot; see app/utils/appointments.py
+        Index(
+            "uq_appointments_doctor_id_date_time_slot",
+            "doctor_id",
+            "date",
+            "time_slot",
+            unique=True,
+            postgresql_where=text("status != 'cancelled'"),
+            sqlite_where=text("status != 'cancelled'"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    patient_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    patient_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     doctor_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     date = Column(String, nullable=False)  # "YYYY-MM-DD"
     time_slot = Column(String, nullable=False)  # "09:00 AM"
     status = Column(Enum(AppointmentStatus), default=AppointmentStatus.pending)
-    notes = Column(EncryptedText, nullable=True)
+    notes = deferred(Column(EncryptedText, nullable=True))
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # bumped by every change, for optimistic concurrency
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     patient = relationship(
         "User", foreign_keys=[patient_id], back_populates="appointments_as_patient"
@@ -102,16 +140,18 @@ class Appointment(Base):
         "MedicalRecord", back_populates="appointment", uselist=False
     )
 
+    __mapper_args__ = {"version_id_col": version}
+
 
 class MedicalRecord(Base):
     __tablename__ = "medical_records"
 
     id = Column(Integer, primary_key=True, index=True)
-    patient_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    patient_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     appointment_id = Column(
         Integer, ForeignKey("appointments.id"), nullable=True, unique=True
     )
-    summary = Column(EncryptedText, nullable=True)
+    summary = deferred(Column(EncryptedText, nullable=True))
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -132,11 +172,14 @@ class Report(Base):
     __tablename__ = "reports"
 
     id = Column(Integer, primary_key=True, index=True)
-    record_id = Column(Integer, ForeignKey("medical_records.id"), nullable=False)
+    record_id = Column(
+        Integer, ForeignKey("medical_records.id"), nullable=False, index=True
+    )
     doctor_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    content = Column(EncryptedText, nullable=False)
-    diagnosis = Column(EncryptedText, nullable=True)
-    prescription = Column(EncryptedText, nullable=True)
+    # loaded together on first access
+    content = deferred(Column(EncryptedText, nullable=False), group="text")
+    diagnosis = deferred(Column(EncryptedText, nullable=True), group="text")
+    prescription = deferred(Column(EncryptedText, nullable=True), group="text")
     created_at = Column(DateTime, default=datetime.utcnow)
 
     record = relationship("MedicalRecord", back_populates="reports")
@@ -145,6 +188,21 @@ class Report(Base):
 
 class LabUploadAssignment(Base):
     __tablename__ = "lab_upload_assignments"
+    # work queue order; see app/utils/workqueue.py
+    __table_args__ = (
+        Index(
+            "ix_lab_upload_assignments_queue",
+            "status",
+            "priority",
+            "due_at",
+            "created_at",
+        ),
+        Index(
+            "ix_lab_upload_assignments_lab_user_id_updated_at",
+            "lab_user_id",
+            "updated_at",
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     record_id = Column(
@@ -152,15 +210,22 @@ class LabUploadAssignment(Base):
     )
     patient_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     doctor_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
-    lab_user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    # NULL: open to every lab user through the work queue
+    lab_user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
     status = Column(
         Enum(LabUploadAssignmentStatus),
         nullable=False,
         default=LabUploadAssignmentStatus.assigned,
     )
+    priority = Column(Integer, nullable=False, default=0, server_default="0")
+    due_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     expires_at = Column(DateTime, nullable=True)
     consumed_at = Column(DateTime, nullable=True)
+    # current holder of the work item, until lease_expires_at
+    claimed_by_user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
 
     record = relationship("MedicalRecord", back_populates="lab_upload_assignments")
     patient = relationship("User", foreign_keys=[patient_id])
@@ -174,6 +239,7 @@ class LabUploadAssignment(Base):
         foreign_keys=[lab_user_id],
         back_populates="lab_upload_assignments_as_lab",
     )
+    claimed_by = relationship("User", foreign_keys=[claimed_by_user_id])
     test_result_file = relationship(
         "TestResultFile", back_populates="assignment", uselist=False
     )
@@ -198,8 +264,11 @@ class TestResultFile(Base):
     storage_path = Column(String, nullable=False)
     hash_algo = Column(String, nullable=False, default="sha256")
     hash_hex = Column(String, nullable=False)
+    # content-addressed storage; NULL for files stored before deduplication
+    blob_id = Column(Integer, ForeignKey("file_blobs.id"), nullable=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    blob = relationship("FileBlob", back_populates="files")
     assignment = relationship("LabUploadAssignment", back_populates="test_result_file")
     record = relationship("MedicalRecord", back_populates="test_result_files")
     patient = relationship("User", foreign_keys=[patient_id])
@@ -210,6 +279,63 @@ class TestResultFile(Base):
     )
 
 
+class FileBlob(Base):
+    """Encrypted content shared by every TestResultFile with the same bytes.
+
+    The content is encrypted under its own random data key, which is stored
+    only wrapped with a per-patient key (see BlobKey). `ref_count` counts the
+    TestResultFile rows pointing here; unreferenced blobs are removed by
+    `blobstore.collect_garbage`.
+    """
+
+    __tablename__ = "file_blobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), nullable=False, unique=True)
+    size_bytes = Column(Integer, nullable=False)
+    storage_path = Column(String, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0, server_default="0")
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # last time a reference was added or dropped; GC waits a grace period
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    keys = relationship("BlobKey", back_populates="blob", cascade="all, delete-orphan")
+    files = relationship("TestResultFile", back_populates="blob")
+
+
+class BlobKey(Base):
+    """A blob's data key, wrapped with the key of one patient who has it."""
+
+    __tablename__ = "blob_keys"
+
+    blob_id = Column(
+        Integer, ForeignKey("file_blobs.id", ondelete="CASCADE"), primary_key=True
+    )
+    patient_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    wrapped_key = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    blob = relationship("FileBlob", back_populates="keys")
+
+
+class FileVerification(Base):
+    """Last full integrity check of a stored file, keyed by its storage path.
+
+    `version` is the storage backend's token for the file (mtime and size, or
+    the S3 ETag) when it was checked; a different token means the result no
+    longer applies. See `integrity`.
+    """
+
+    __tablename__ = "file_verifications"
+
+    storage_path = Column(String, primary_key=True)
+    version = Column(String, nullable=False)
+    ok = Column(Boolean, nullable=False)
+    verified_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
 class AuditLog(Base):
     __tablename__ = "audit_logs"
 
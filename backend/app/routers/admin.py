@@ -1,24 +1,94 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Request
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from sqlalchemy import func
 from sqlalchemy.orm import Session
 
 from app import models, schemas
-from app.config.database import get_db
-from app.utils import audit, auth
+from app.config.database import SessionLocal, get_db
+from app.utils import audit, auth, cache, provisioning, serialization
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
 require_admin = auth.require_role("admin")
 
+FIELDS_HELP = "Comma-separated fields of each item to return; default all"
+
 
 @router.get("/users", response_model=List[schemas.UserOut])
 def list_users(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(require_admin),
 ):
-    return db.query(models.User).all()
+    return serialization.json_list(schemas.UserOut, db.query(models.User).all())
+
+
+async def _read_body(request: Request, max_bytes: int) -> bytes:
+    """The request body, or a 413 as soon as it is known to be over `max_bytes`."""
+    too_large = HTTPException(
+        status_code=413, detail=f"At most {max_bytes} bytes per import"
+    )
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > max_bytes:
+        raise too_large
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_bytes:
+            raise too_large
+    return bytes(body)
+
+
+@router.post("/users/import")
+async def import_users(
+    request: Request,
+    current_user: models.User = Depends(require_admin),
+):
+    """Create accounts from a CSV (`text/csv`) or NDJSON
+    (`application/x-ndjson`) body with the fields of /auth/register.
+
+    The response is NDJSON, streamed as the import runs: `{done, total,
+    created}` after each batch, then `{total, created, skipped, errors}`.
+    Skipped rows are not fatal; see app/utils/provisioning.py.
+    """
+    media_type = request.headers.get("content-type", "").split(";")[0].strip()
+    fmt = provisioning.MEDIA_TYPES.get(media_type)
+    if fmt is None:
+        raise HTTPException(
+            status_code=415, detail="Send the rows as text/csv or application/x-ndjson"
+        )
+    try:
+        rows, errors = await run_in_threadpool(
+            provisioning.parse,
+            await _read_body(request, provisioning.IMPORT_MAX_BYTES),
+            fmt,
+        )
+    except (UnicodeDecodeError, ValueError) as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    if len(rows) + len(errors) > provisioning.IMPORT_MAX_ROWS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {provisioning.IMPORT_MAX_ROWS} rows per import",
+        )
+
+    actor_id = current_user.id
+    ip_address = request.client.host if request.client else None
+
+    def progress():
+        # outlives the request's session, which is closed once streaming starts
+        db = SessionLocal()
+        try:
+            for item in provisioning.import_users(
+                db, rows, errors, actor_id=actor_id, ip_address=ip_address
+            ):
+                yield orjson.dumps(item) + b"\n"
+        finally:
+            db.close()
+
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
 
 
 @router.delete("/users/{user_id}", status_code=204)
@@ -42,28 +112,55 @@ def delete_user(
         details=f"deleted_email={user.email} role={user.role}",
         ip_address=request.client.host if request.client else None,
     )
+    tags = [f"users:{user.role.value}", "stats"]
+    if user.role == models.RoleEnum.patient:
+        doctor_ids = (
+            db.query(models.Appointment.doctor_id)
+            .filter(models.Appointment.patient_id == user.id)
+            .distinct()
+        )
+        tags += [f"patients_of:{doctor_id}" for (doctor_id,) in doctor_ids]
+    cache.invalidate(db, *tags)
     db.delete(user)
-    db.commit()
+    db.flush()
 
 
 @router.get("/appointments", response_model=List[schemas.AppointmentOut])
 def all_appointments(
     skip: int = 0,
     limit: int = 50,
+    fields: Optional[str] = Query(None, description=FIELDS_HELP),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(require_admin),
 ):
-    return db.query(models.Appointment).offset(skip).limit(limit).all()
+    wanted = serialization.list_fields(schemas.AppointmentOut, fields)
+    appts = (
+        db.query(models.Appointment)
+        .options(*serialization.appointment_options(wanted))
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+    return serialization.json_list(schemas.AppointmentOut, appts, fields=wanted)
 
 
 @router.get("/records", response_model=List[schemas.MedicalRecordOut])
 def all_records(
     skip: int = 0,
     limit: int = 50,
+    fields: Optional[str] = Query(None, description=FIELDS_HELP),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(require_admin),
 ):
-    return db.query(models.MedicalRecord).offset(skip).limit(limit).all()
+    wanted = serialization.list_fields(schemas.MedicalRecordOut, fields)
+    records = (
+        db.query(models.MedicalRecord)
+        .options(*serialization.record_options(wanted))
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+    return serialization.json_list(schemas.MedicalRecordOut, records, fields=wanted)
 
 
 @router.get("/audit-logs/verify")
@@ -75,7 +172,7 @@ def verify_audit_chain(
     return {"valid": valid, "first_broken_id": broken_id}
 
 
-@router.get("/audit-logs")
+@router.get("/audit-logs", response_model=schemas.AuditLogPage)
 def list_audit_logs(
     skip: int = 0,
     limit: int = 50,
@@ -88,23 +185,10 @@ def list_audit_logs(
         q = q.filter(models.AuditLog.action == action)
     total = q.count()
     logs = q.offset(skip).limit(limit).all()
-    return {
-        "total": total,
-        "items": [
-            {
-                "id": l.id,
-                "user_id": l.user_id,
-                "action": l.action,
-                "resource_type": l.resource_type,
-                "resource_id": l.resource_id,
-                "details": l.details,
-                "ip_address": l.ip_address,
-                "timestamp": l.timestamp.isoformat(),
-                "row_hash": l.row_hash,
-            }
-            for l in logs
-        ],
-    }
+    page = schemas.AuditLogPage.model_validate(
+        {"total": total, "items": logs}, from_attributes=True
+    )
+    return serialization.json_model(page)
 
 
 @router.get("/stats")
@@ -112,24 +196,41 @@ def system_stats(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(require_admin),
 ):
-    appt_counts: dict[str, int] = dict(
-        db.query(models.Appointment.status, func.count())
-        .group_by(models.Appointment.status)
-        .all()
+    """Row counts across the system.
+
+    User and appointment counts are current; the other counts may lag by up
+    to the cache TTL, since their write paths do not invalidate the cache.
+    """
+
+    def stats():
+        appt_counts: dict[str, int] = dict(
+            db.query(models.Appointment.status, func.count())
+            .group_by(models.Appointment.status)
+            .all()
+        )
+        return ORJSONResponse(
+            {
+                "users": {
+                    role.value: db.query(models.User)
+                    .filter(models.User.role == role)
+                    .count()
+                    for role in models.RoleEnum
+                },
+                "appointments": {
+                    "total": db.query(models.Appointment).count(),
+                    "pending": appt_counts.get("pending", 0),
+                    "confirmed": appt_counts.get("confirmed", 0),
+                    "cancelled": appt_counts.get("cancelled", 0),
+                },
+                "records": db.query(models.MedicalRecord).count(),
+                "reports": db.query(models.Report).count(),
+                "lab_assignments": db.query(models.LabUploadAssignment).count(),
+                "audit_logs": db.query(models.AuditLog).count(),
+            }
+        )
+
+    return cache.cached(
+        "admin.system_stats",
+        stats,
+        tags=["stats", *(f"users:{role.value}" for role in models.RoleEnum)],
     )
-    return {
-        "users": {
-            role.value: db.query(models.User).filter(models.User.role == role).count()
-            for role in models.RoleEnum
-        },
-        "appointments": {
-            "total": db.query(models.Appointment).count(),
-            "pending": appt_counts.get("pending", 0),
-            "confirmed": appt_counts.get("confirmed", 0),
-            "cancelled": appt_counts.get("cancelled", 0),
-        },
-        "records": db.query(models.MedicalRecord).count(),
-        "reports": db.query(models.Report).count(),
-        "lab_assignments": db.query(models.LabUploadAssignment).count(),
-        "audit_logs": db.query(models.AuditLog).count(),
-    }
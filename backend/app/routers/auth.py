@@ -8,7 +8,13 @@ from sqlalchemy.orm import Session
 
 from app import models, schemas
 from app.config.database import get_db
-from app.utils import audit, auth
+from app.utils import audit, auth, cache
+from app.utils.ratelimit import (
+    RATE_LIMIT_LOGIN,
+    RATE_LIMIT_REGISTER,
+    client_ip,
+    limiter,
+)
 
 
 load_dotenv()
@@ -18,6 +24,7 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 
 
 @router.post("/register", response_model=schemas.UserOut, status_code=201)
+@limiter.limit(RATE_LIMIT_REGISTER, key_func=client_ip)
 def register(
     payload: schemas.UserRegister, request: Request, db: Session = Depends(get_db)
 ):
@@ -34,14 +41,13 @@ def register(
         phone=payload.phone,
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    cache.invalidate(db, f"users:{user.role.value}")
+    db.flush()
 
     # auto-create medical record for patients
     if user.role == models.RoleEnum.patient:
         record = models.MedicalRecord(patient_id=user.id, summary="Initial record")
         db.add(record)
-        db.commit()
 
     audit.log(
         db,
@@ -56,6 +62,8 @@ def register(
 
 
 @router.post("/login")
+# per IP, so password guessing across many accounts shares one budget
+@limiter.limit(RATE_LIMIT_LOGIN, key_func=client_ip)
 def login(
     payload: schemas.UserLogin,
     request: Request,
@@ -64,11 +72,13 @@ def login(
 ):
     user = db.query(models.User).filter(models.User.email == payload.email).first()
     if not user or not auth.verify_password(payload.password, user.hashed_password):
+        # committed now: the request's own commit is skipped when it raises
         audit.log(
             db,
             "auth.login_failed",
             details=f"email={payload.email}",
             ip_address=request.client.host if request.client else None,
+            commit=True,
         )
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
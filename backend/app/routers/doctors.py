@@ -1,51 +1,77 @@
-from datetime import datetime
-from typing import List
+from datetime import date, datetime
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 
 from app import models, schemas
 from app.config.database import get_db
-from app.utils import audit, auth
+from app.utils import appointments, audit, auth, cache, events, serialization, sync
 
 router = APIRouter(prefix="/doctors", tags=["doctors"])
 
 require_doctor = auth.require_role("doctor")
 
+FIELDS_HELP = "Comma-separated fields of each item to return; default all"
+
 
 @router.get("/appointments", response_model=List[schemas.AppointmentOut])
 def my_appointments(
+    request: Request,
+    updated_since: Optional[datetime] = Query(
+        None, description="Only rows changed after this X-Sync-Watermark"
+    ),
+    fields: Optional[str] = Query(None, description=FIELDS_HELP),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(require_doctor),
 ):
-    return (
-        db.query(models.Appointment)
-        .filter(models.Appointment.doctor_id == current_user.id)
+    wanted = serialization.list_fields(schemas.AppointmentOut, fields)
+    cached = sync.not_modified(request, current_user, wanted)
+    if cached:
+        return cached
+    next_since = sync.watermark()
+    appts = (
+        sync.changed_since(
+            db.query(models.Appointment)
+            .options(*serialization.appointment_options(wanted))
+            .filter(models.Appointment.doctor_id == current_user.id),
+            models.Appointment.updated_at,
+            updated_since,
+        )
         .order_by(models.Appointment.date.asc())
         .all()
     )
+    return sync.list_response(
+        current_user, schemas.AppointmentOut, appts, next_since, wanted
+    )
 
 
 @router.patch("/appointments/{appt_id}/confirm", response_model=schemas.AppointmentOut)
 def confirm_appointment(
     appt_id: int,
     request: Request,
+    version: Optional[int] = Query(
+        None, description="Only if the appointment is still at this version"
+    ),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(require_doctor),
 ):
-    appt = (
-        db.query(models.Appointment)
-        .filter(
-            models.Appointment.id == appt_id,
-            models.Appointment.doctor_id == current_user.id,
-        )
-        .first()
+    appt = appointments.transition(
+        db,
+        appt_id,
+        models.AppointmentStatus.confirmed,
+        models.Appointment.doctor_id == current_user.id,
+        version=version,
+    )
+    cache.invalidate(db, "stats")
+    events.publish(
+        db,
+        [appt.patient_id, appt.doctor_id],
+        "appointment.confirmed",
+        id=appt.id,
+        status=appt.status.value,
     )
-    if not appt:
-        raise HTTPException(status_code=404, detail="Appointment not found")
-    appt.status = models.AppointmentStatus.confirmed
-    db.commit()
-    db.refresh(appt)
     audit.log(
         db,
         "appointment.confirmed",
@@ -82,8 +108,7 @@ def create_patient_record(
 
     record = models.MedicalRecord(patient_id=patient_id, summary=payload.summary)
     db.add(record)
-    db.commit()
-    db.refresh(record)
+    db.flush()
     return record
 
 
@@ -93,9 +118,11 @@ def create_patient_record(
 def patient_records(
     patient_id: int,
     request: Request,
+    fields: Optional[str] = Query(None, description=FIELDS_HELP),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(require_doctor),
 ):
+    wanted = serialization.list_fields(schemas.MedicalRecordOut, fields)
     # Doctor can only view records of patients who have an appointment with them
     has_appointment = (
         db.query(models.Appointment)
@@ -119,10 +146,11 @@ def patient_records(
     )
     records = (
         db.query(models.MedicalRecord)
+        .options(*serialization.record_options(wanted))
         .filter(models.MedicalRecord.patient_id == patient_id)
         .all()
     )
-    return records
+    return serialization.json_list(schemas.MedicalRecordOut, records, fields=wanted)
 
 
 @router.post(
@@ -164,8 +192,7 @@ def append_report(
         prescription=payload.prescription,
     )
     db.add(report)
-    db.commit()
-    db.refresh(report)
+    db.flush()
     audit.log(
         db,
         "report.created",
@@ -178,17 +205,13 @@ def append_report(
     return report
 
 
-@router.post(
-    "/records/{record_id}/lab-assignments",
-    response_model=schemas.LabUploadAssignmentOut,
-    status_code=201,
-)
-def create_lab_assignment(
+def _create_lab_assignments(
+    db: Session,
     record_id: int,
-    payload: schemas.LabUploadAssignmentCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_doctor),
-):
+    doctor: models.User,
+    payloads: List[schemas.LabUploadAssignmentCreate],
+) -> List[models.LabUploadAssignment]:
+    """Check access to the record once, then create the assignments together."""
     record = (
         db.query(models.MedicalRecord)
         .filter(models.MedicalRecord.id == record_id)
@@ -201,7 +224,7 @@ def create_lab_assignment(
     has_appointment = (
         db.query(models.Appointment)
         .filter(
-            models.Appointment.doctor_id == current_user.id,
+            models.Appointment.doctor_id == doctor.id,
             models.Appointment.patient_id == record.patient_id,
         )
         .first()
@@ -209,27 +232,66 @@ def create_lab_assignment(
     if not has_appointment:
         raise HTTPException(status_code=403, detail="No appointment with this patient")
 
-    lab_user = (
-        db.query(models.User).filter(models.User.id == payload.lab_user_id).first()
-    )
-    if not lab_user or lab_user.role != models.RoleEnum.lab:
+    lab_user_ids = {p.lab_user_id for p in payloads if p.lab_user_id is not None}
+    found = {
+        user_id
+        for (user_id,) in db.query(models.User.id).filter(
+            models.User.id.in_(lab_user_ids),
+            models.User.role == models.RoleEnum.lab,
+        )
+    }
+    if found != lab_user_ids:
         raise HTTPException(status_code=404, detail="Lab uploader not found")
 
-    if payload.expires_at and payload.expires_at <= datetime.utcnow():
+    now = datetime.utcnow()
+    if any(p.expires_at and p.expires_at <= now for p in payloads):
         raise HTTPException(status_code=400, detail="expires_at must be in the future")
 
-    assignment = models.LabUploadAssignment(
-        record_id=record_id,
-        patient_id=record.patient_id,
-        doctor_id=current_user.id,
-        lab_user_id=payload.lab_user_id,
-        status=models.LabUploadAssignmentStatus.assigned,
-        expires_at=payload.expires_at,
-    )
-    db.add(assignment)
-    db.commit()
-    db.refresh(assignment)
-    return assignment
+    assignments = [
+        models.LabUploadAssignment(
+            record_id=record_id,
+            patient_id=record.patient_id,
+            doctor_id=doctor.id,
+            lab_user_id=payload.lab_user_id,
+            status=models.LabUploadAssignmentStatus.assigned,
+            expires_at=payload.expires_at,
+            priority=payload.priority,
+            due_at=payload.due_at,
+        )
+        for payload in payloads
+    ]
+    db.add_all(assignments)
+    db.flush()
+    return assignments
+
+
+@router.post(
+    "/records/{record_id}/lab-assignments",
+    response_model=schemas.LabUploadAssignmentOut,
+    status_code=201,
+)
+def create_lab_assignment(
+    record_id: int,
+    payload: schemas.LabUploadAssignmentCreate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(require_doctor),
+):
+    return _create_lab_assignments(db, record_id, current_user, [payload])[0]
+
+
+@router.post(
+    "/records/{record_id}/lab-assignments/bulk",
+    response_model=List[schemas.LabUploadAssignmentOut],
+    status_code=201,
+)
+def create_lab_assignments(
+    record_id: int,
+    payload: schemas.LabUploadAssignmentBulkCreate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(require_doctor),
+):
+    """Create several assignments for a record (e.g. a panel of tests) at once."""
+    return _create_lab_assignments(db, record_id, current_user, payload.assignments)
 
 
 @router.get(
@@ -261,12 +323,13 @@ def list_lab_assignments(
     if not has_appointment:
         raise HTTPException(status_code=403, detail="No appointment with this patient")
 
-    return (
+    assignments = (
         db.query(models.LabUploadAssignment)
         .filter(models.LabUploadAssignment.record_id == record_id)
         .order_by(models.LabUploadAssignment.created_at.desc())
         .all()
     )
+    return serialization.json_list(schemas.LabUploadAssignmentOut, assignments)
 
 
 @router.get(
@@ -297,12 +360,13 @@ def list_test_files(
     if not has_appointment:
         raise HTTPException(status_code=403, detail="No appointment with this patient")
 
-    return (
+    files = (
         db.query(models.TestResultFile)
         .filter(models.TestResultFile.record_id == record_id)
         .order_by(models.TestResultFile.created_at.desc())
         .all()
     )
+    return serialization.json_list(schemas.TestResultFileOut, files)
 
 
 @router.get("/lab-users", response_model=List[schemas.UserOut])
@@ -311,19 +375,156 @@ def list_lab_users(
     current_user: models.User = Depends(require_doctor),
 ):
     """Return all lab users so the doctor can pick one when creating an assignment."""
-    return db.query(models.User).filter(models.User.role == models.RoleEnum.lab).all()
+    return cache.cached(
+        "doctors.lab_users",
+        lambda: serialization.json_list(
+            schemas.UserOut,
+            db.query(models.User).filter(models.User.role == models.RoleEnum.lab),
+        ),
+        tags=["users:lab"],
+    )
 
 
-@router.get("/patients", response_model=List[schemas.UserOut])
+@router.get("/patients", response_model=schemas.DoctorPatientPage)
 def my_patients(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=200),
+    sort: str = Query("last_visit", pattern="^(last_visit|name)$"),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(require_doctor),
 ):
-    """List all patients who have ever booked an appointment with this doctor."""
-    appts = (
-        db.query(models.Appointment)
-        .filter(models.Appointment.doctor_id == current_user.id)
-        .all()
+    """List all patients who have ever booked an appointment with this doctor.
+
+    Each patient comes with their number of past visits (appointments not
+    cancelled, dated before today), the last of those and the next upcoming
+    appointment, all aggregated in SQL. `sort=last_visit` puts the most
+    recently seen first; `sort=name` is alphabetical.
+    """
+    today = date.today().isoformat()
+
+    def patients():
+        appt = models.Appointment
+        kept = appt.status != models.AppointmentStatus.cancelled
+        stats = (
+            select(
+                appt.patient_id,
+                func.count().filter(kept, appt.date < today).label("visit_count"),
+                func.max(appt.date).filter(kept, appt.date < today).label("last_visit"),
+                func.min(appt.date)
+                .filter(kept, appt.date >= today)
+                .label("next_appointment"),
+            )
+            .where(appt.doctor_id == current_user.id)
+            .group_by(appt.patient_id)
+            .subquery()
+        )
+        total = db.query(func.count()).select_from(stats).scalar()
+        order = (
+            [models.User.name]
+            if sort == "name"
+            else [stats.c.last_visit.desc().nulls_last(), models.User.name]
+        )
+        rows = (
+            db.query(
+                *(
+                    getattr(models.User, field)
+                    for field in schemas.UserOut.model_fields
+                ),
+                stats.c.visit_count,
+                stats.c.last_visit,
+                stats.c.next_appointment,
+            )
+            .join(stats, stats.c.patient_id == models.User.id)
+            .order_by(*order, models.User.id)
+            .offset(skip)
+            .limit(limit)
+            .all()
+        )
+        page = schemas.DoctorPatientPage.model_validate(
+            {"total": total, "items": rows}, from_attributes=True
+        )
+        return serialization.json_model(page)
+
+    return cache.cached(
+        "doctors.my_patients",
+        patients,
+        tags=[f"patients_of:{current_user.id}"],
+        scope=current_user.id,
+        params={"skip": skip, "limit": limit, "sort": sort, "today": today},
     )
-    patient_ids = list({a.patient_id for a in appts})
-    return db.query(models.User).filter(models.User.id.in_(patient_ids)).all()
+
+
+@router.get("/dashboard", response_model=schemas.DoctorDashboard)
+def dashboard(
+    request: Request,
+    fields: Optional[str] = Query(
+        None,
+        description="Comma-separated sections (`records`) or item fields "
+        "(`appointments.status`) to return; default all",
+    ),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(require_doctor),
+):
+    """Everything the doctor dashboard shows, in one request.
+
+    Each section is one query plus one per nested relationship, however many
+    patients and records there are.
+    """
+    wanted = serialization.field_mask(schemas.DoctorDashboard, fields)
+    data = {}
+    if "appointments" in wanted:
+        data["appointments"] = (
+            db.query(models.Appointment)
+            .options(*serialization.appointment_options(wanted["appointments"]))
+            .filter(models.Appointment.doctor_id == current_user.id)
+            .order_by(models.Appointment.date.asc())
+            .all()
+        )
+    if "patients" in wanted:
+        data["patients"] = (
+            db.query(models.User)
+            .filter(
+                models.User.id.in_(
+                    db.query(models.Appointment.patient_id).filter(
+                        models.Appointment.doctor_id == current_user.id
+                    )
+                )
+            )
+            .all()
+        )
+    if "records" in wanted:
+        # the same rule as patient_records, for all patients at once
+        records = (
+            db.query(models.MedicalRecord)
+            .options(*serialization.record_options(wanted["records"]))
+            .filter(
+                models.MedicalRecord.patient_id.in_(
+                    db.query(models.Appointment.patient_id).filter(
+                        models.Appointment.doctor_id == current_user.id,
+                        models.Appointment.status != models.AppointmentStatus.cancelled,
+                    )
+                )
+            )
+            .order_by(models.MedicalRecord.patient_id, models.MedicalRecord.id)
+            .all()
+        )
+        data["records"] = records
+        patient_ids = sorted({r.patient_id for r in records})
+        if patient_ids:
+            audit.log(
+                db,
+                "records.viewed",
+                user_id=current_user.id,
+                resource_type="patient",
+                details="patient_ids=" + ",".join(map(str, patient_ids)),
+                ip_address=request.client.host if request.client else None,
+            )
+    if "lab_assignments" in wanted:
+        data["lab_assignments"] = (
+            db.query(models.LabUploadAssignment)
+            .filter(models.LabUploadAssignment.doctor_id == current_user.id)
+            .order_by(models.LabUploadAssignment.created_at.desc())
+            .all()
+        )
+    schema = serialization.subset(schemas.DoctorDashboard, wanted)
+    return serialization.json_model(schema.model_validate(data, from_attributes=True))
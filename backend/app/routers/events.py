@@ -0,0 +1,49 @@
+import asyncio
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+
+from app import models
+from app.utils import auth, events
+
+router = APIRouter(tags=["events"])
+
+# comment lines keep proxies from closing an idle stream
+HEARTBEAT_SECONDS = 15
+
+
+@router.get(
+    "/events",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/event-stream": {}}}},
+)
+async def event_stream(current_user: models.User = Depends(auth.get_current_user)):
+    """Server-sent events about the current user's appointments and lab work.
+
+    Each message is named after what happened (`appointment.booked`,
+    `appointment.confirmed`, `appointment.cancelled`, `lab_assignment.uploaded`)
+    and carries the ids and new status as JSON data. A `resync` event means
+    events were dropped because the client fell behind: refetch the lists.
+    """
+
+    async def stream():
+        subscription = events.subscribe(current_user.id)
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    frame = await asyncio.wait_for(
+                        subscription.queue.get(), HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield frame if frame is not None else "event: resync\ndata: {}\n\n"
+        finally:
+            events.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,24 +1,62 @@
-import hashlib
-import os
-import tempfile
+import re
+from typing import Iterator, Optional
+from urllib.parse import quote
 
+from cryptography.exceptions import InvalidTag
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
-from fastapi.responses import FileResponse
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from starlette.background import BackgroundTask
 
 from app import models
 from app.config.database import get_db
-from app.utils import audit, auth, crypto
+from app.utils import audit, auth, blobstore, crypto, integrity
+from app.utils.storage import get_storage
 
 router = APIRouter(prefix="/files", tags=["files"])
 
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+def _parse_range(header: Optional[str], size: int) -> Optional[tuple[int, int]]:
+    """The plaintext [start, stop) asked for by a single-range Range header.
+
+    Headers this does not handle (several ranges, other units) are ignored,
+    which serves the whole file as RFC 9110 allows.
+    """
+    match = _RANGE.fullmatch(header.strip()) if header else None
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first:
+        start, stop = int(first), min(int(last) + 1, size) if last else size
+    else:
+        start, stop = max(size - int(last), 0), size
+    if start >= stop:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, stop
+
+
+def _content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
 
 @router.get("/{file_id}/download")
 def download_file(
     file_id: int,
     request: Request,
-    verify_hash: bool = Query(False),
+    verify_hash: bool = Query(
+        False,
+        description="Answer 409 instead of streaming a file whose last "
+        "integrity check failed. Full downloads are hash-checked while they "
+        "stream either way, unless the file was verified recently.",
+    ),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
@@ -57,17 +95,26 @@ def download_file(
         case _:
             raise HTTPException(status_code=403, detail="Access denied")
 
-    if not os.path.exists(f.storage_path):
+    storage = get_storage()
+    version = storage.version(f.storage_path)
+    if version is None:
         raise HTTPException(status_code=404, detail="File missing on server")
 
-    if verify_hash:
-        # Hash check must run on the encrypted bytes (as stored), matching what was hashed on upload
-        h = hashlib.sha256()
-        with open(f.storage_path, "rb") as src:
-            for chunk in iter(lambda: src.read(1024 * 1024), b""):
-                h.update(chunk)
-        if f.hash_algo.lower() == "sha256" and h.hexdigest() != f.hash_hex:
-            raise HTTPException(status_code=409, detail="File integrity check failed")
+    verified = integrity.lookup(db, f.storage_path, version)
+    if verify_hash and verified is not None and not verified.ok:
+        raise HTTPException(status_code=409, detail="File integrity check failed")
+
+    byte_range = _parse_range(request.headers.get("range"), f.size_bytes)
+    start, stop = byte_range or (0, f.size_bytes)
+    # full downloads check the plaintext hash as they stream, unless this
+    # version of the file passed recently
+    expected_hash = (
+        f.hash_hex
+        if byte_range is None
+        and f.hash_algo.lower() == "sha256"
+        and (verified is None or not verified.ok)
+        else None
+    )
 
     audit.log(
         db,
@@ -79,16 +126,43 @@ def download_file(
         ip_address=request.client.host if request.client else None,
     )
 
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".dec")
-    tmp.close()
+    # deduplicated files are encrypted under the blob's own key
+    key = blobstore.data_key(db, f.blob, f.patient_id) if f.blob_id else None
+    src = storage.open_read(f.storage_path)
+    chunks = integrity.checked(
+        crypto.iter_decrypt(src, key, start, stop),
+        f.storage_path,
+        version,
+        expected_hash,
+    )
     try:
-        crypto.decrypt_file(f.storage_path, tmp.name)
-        return FileResponse(
-            path=tmp.name,
-            media_type=f.content_type or "application/octet-stream",
-            filename=f.original_filename,
-            background=BackgroundTask(os.unlink, tmp.name),
-        )
-    except Exception:
-        os.unlink(tmp.name)
+        # decrypt the first chunk now, so a bad key or file is still an error
+        # status rather than a truncated response
+        first = next(chunks, b"")
+    except integrity.FileCorrupted:
+        src.close()
+        raise HTTPException(status_code=409, detail="File integrity check failed")
+    except (InvalidTag, ValueError):
+        src.close()
         raise HTTPException(status_code=500, detail="Failed to decrypt file")
+
+    def body() -> Iterator[bytes]:
+        try:
+            yield first
+            yield from chunks
+        finally:
+            src.close()
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": _content_disposition(f.original_filename),
+        "Content-Length": str(stop - start),
+    }
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{stop - 1}/{f.size_bytes}"
+    return StreamingResponse(
+        body(),
+        status_code=206 if byte_range else 200,
+        media_type=f.content_type or "application/octet-stream",
+        headers=headers,
+    )
@@ -0,0 +1,51 @@
+"""Liveness and readiness probes.
+
+`/health/live` only shows that the worker answers: it touches nothing else,
+so an orchestrator restarts the process when it hangs but not when the
+database is down. `/health/ready` checks what requests need, a database
+connection at the expected schema revision and a usable encryption key, and
+answers 503 while any is missing so traffic goes to other instances.
+Neither is rate limited.
+"""
+
+import logging
+
+from fastapi import APIRouter
+from fastapi.responses import ORJSONResponse
+
+from app.config.database import verify_schema_version
+from app.utils import crypto
+from app.utils.ratelimit import limiter
+
+router = APIRouter(prefix="/health", tags=["health"])
+
+logger = logging.getLogger(__name__)
+
+READINESS_CHECKS = {
+    "database": verify_schema_version,
+    "encryption_key": crypto.load_keys,
+}
+
+
+@router.get("/live")
+@limiter.exempt
+async def live():
+    return {"status": "ok"}
+
+
+@router.get("/ready")
+@limiter.exempt
+def ready():
+    checks = {}
+    for name, check in READINESS_CHECKS.items():
+        try:
+            check()
+            checks[name] = "ok"
+        except Exception:
+            logger.exception("readiness check %s failed", name)
+            checks[name] = "failed"
+    ok = all(result == "ok" for result in checks.values())
+    return ORJSONResponse(
+        {"status": "ready" if ok else "unavailable", "checks": checks},
+        status_code=200 if ok else 503,
+    )
@@ -1,146 +1,457 @@
-import hashlib
 import os
-import uuid
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, File, HTTPException, Request, UploadFile
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, or_
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from app import models, schemas
 from app.config.database import get_db
-from app.utils import audit, auth, crypto
+from app.utils import (
+    audit,
+    auth,
+    blobstore,
+    events,
+    serialization,
+    sync,
+    uploads,
+    workqueue,
+)
 
 router = APIRouter(prefix="/lab", tags=["lab"])
 
 require_lab = auth.require_role("lab")
 
-
-def _upload_base_dir() -> str:
-    return os.getenv(
-        "UPLOAD_DIR", os.path.join(os.path.dirname(__file__), "..", "storage")
-    )
+# most files (and assignments) accepted in one batch request
+MAX_BATCH = 50
 
 
 @router.get("/assignments", response_model=list[schemas.LabUploadAssignmentOut])
 def my_assignments(
+    request: Request,
+    updated_since: datetime | None = Query(
+        None, description="Only rows changed after this X-Sync-Watermark"
+    ),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(require_lab),
 ):
-    return (
-        db.query(models.LabUploadAssignment)
-        .filter(models.LabUploadAssignment.lab_user_id == current_user.id)
+    cached = sync.not_modified(request, current_user)
+    if cached:
+        return cached
+    next_since = sync.watermark()
+    assignments = (
+        sync.changed_since(
+            db.query(models.LabUploadAssignment).filter(
+                or_(
+                    models.LabUploadAssignment.lab_user_id == current_user.id,
+                    models.LabUploadAssignment.claimed_by_user_id == current_user.id,
+                )
+            ),
+            models.LabUploadAssignment.updated_at,
+            updated_since,
+        )
         .order_by(models.LabUploadAssignment.created_at.desc())
         .all()
     )
+    return sync.list_response(
+        current_user, schemas.LabUploadAssignmentOut, assignments, next_since
+    )
 
 
-@router.post(
-    "/assignments/{assignment_id}/upload",
-    response_model=schemas.TestResultFileOut,
-    status_code=201,
+@router.get("/queue", response_model=list[schemas.LabUploadAssignmentOut])
+def work_queue(
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(require_lab),
+):
+    """Open assignments this lab user could claim next, in queue order."""
+    assignments = workqueue.peek(db, current_user.id, limit)
+    return serialization.json_list(schemas.LabUploadAssignmentOut, assignments)
+
+
+@router.post("/queue/claim", response_model=list[schemas.LabUploadAssignmentOut])
+def claim_work(
+    limit: int = Query(1, ge=1, le=MAX_BATCH),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(require_lab),
+):
+    """Claim up to `limit` assignments, leased for LAB_LEASE_SECONDS.
+
+    Concurrent claims never hand out the same assignment. Renew the lease
+    with PUT /lab/assignments/{id}/lease while working on it; an assignment
+    whose lease runs out goes back to the queue.
+    """
+    assignments = workqueue.claim(db, current_user.id, limit)
+    return serialization.json_list(schemas.LabUploadAssignmentOut, assignments)
+
+
+@router.put(
+    "/assignments/{assignment_id}/lease",
+    response_model=schemas.LabUploadAssignmentOut,
 )
-def upload_test_result(
+def renew_lease(
     assignment_id: int,
-    request: Request,
-    file: UploadFile = File(...),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(require_lab),
 ):
-    assignment = (
-        db.query(models.LabUploadAssignment)
-        .filter(models.LabUploadAssignment.id == assignment_id)
-        .first()
-    )
-    if not assignment:
-        raise HTTPException(status_code=404, detail="Assignment not found")
+    if not workqueue.renew(db, assignment_id, current_user.id):
+        raise HTTPException(status_code=409, detail="Lease expired or not held")
+    return db.get(models.LabUploadAssignment, assignment_id)
 
-    if assignment.lab_user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not allowed for this assignment")
 
-    if assignment.status != models.LabUploadAssignmentStatus.assigned:
-        raise HTTPException(
-            status_code=409, detail="Assignment is not available for upload"
+@router.delete("/assignments/{assignment_id}/lease", status_code=204)
+def release_lease(
+    assignment_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(require_lab),
+):
+    if not workqueue.release(db, assignment_id, current_user.id):
+        raise HTTPException(status_code=409, detail="Lease not held")
+
+
+@router.get("/dashboard", response_model=schemas.LabDashboard)
+def dashboard(
+    fields: str | None = Query(
+        None,
+        description="Comma-separated sections (`queue`) or item fields "
+        "(`assignments.status`) to return; default all",
+    ),
+    queue_limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(require_lab),
+):
+    """This lab user's assignments, the head of the work queue and counts."""
+    wanted = serialization.field_mask(schemas.LabDashboard, fields)
+    mine = or_(
+        models.LabUploadAssignment.lab_user_id == current_user.id,
+        models.LabUploadAssignment.claimed_by_user_id == current_user.id,
+    )
+    data = {}
+    if "assignments" in wanted:
+        data["assignments"] = (
+            db.query(models.LabUploadAssignment)
+            .filter(mine)
+            .order_by(models.LabUploadAssignment.created_at.desc())
+            .all()
         )
+    if "queue" in wanted:
+        data["queue"] = workqueue.peek(db, current_user.id, queue_limit)
+    if "status_counts" in wanted:
+        data["status_counts"] = {
+            status.value: count
+            for status, count in db.query(
+                models.LabUploadAssignment.status, func.count()
+            )
+            .filter(mine)
+            .group_by(models.LabUploadAssignment.status)
+        }
+    return serialization.json_model(
+        schemas.LabDashboard.model_validate(data, from_attributes=True),
+        include=wanted,
+    )
+
 
+def _open_assignments(
+    db: Session, assignment_ids: list[int], lab_user: models.User
+) -> list[models.LabUploadAssignment]:
+    """Load and check the assignments to upload to, in the order given."""
+    found = {
+        a.id: a
+        for a in db.query(models.LabUploadAssignment).filter(
+            models.LabUploadAssignment.id.in_(assignment_ids)
+        )
+    }
     now = datetime.utcnow()
-    if assignment.expires_at and assignment.expires_at <= now:
-        assignment.status = models.LabUploadAssignmentStatus.expired
-        db.commit()
-        raise HTTPException(status_code=409, detail="Assignment expired")
-
-    original_filename = file.filename or "upload"
-    content_type = file.content_type
-
-    base_dir = os.path.abspath(_upload_base_dir())
-    dest_dir = os.path.join(
-        base_dir,
-        f"patient_{assignment.patient_id}",
-        f"record_{assignment.record_id}",
-        f"test_{assignment.id}",
-    )
-    os.makedirs(dest_dir, exist_ok=True)
+    assignments = []
+    for assignment_id in assignment_ids:
+        assignment = found.get(assignment_id)
+        if not assignment:
+            raise HTTPException(
+                status_code=404, detail=f"Assignment {assignment_id} not found"
+            )
+        if not workqueue.may_upload(assignment, lab_user.id):
+            raise HTTPException(
+                status_code=403,
+                detail=f"Not allowed for assignment {assignment_id}",
+            )
+        if assignment.status != models.LabUploadAssignmentStatus.assigned:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Assignment {assignment_id} is not available for upload",
+            )
+        if assignment.expires_at and assignment.expires_at <= now:
+            # its status is set to expired by the scheduler's expire_assignments
+            raise HTTPException(
+                status_code=409, detail=f"Assignment {assignment_id} expired"
+            )
+        assignments.append(assignment)
+
+    # Don't hold a pooled connection (idle in transaction) while the files
+    # stream in. Closing detaches the loaded objects without expiring them.
+    db.close()
+    return assignments
 
-    final_name = str(uuid.uuid4())
-    final_path = os.path.join(dest_dir, final_name)
-    tmp_path = final_path + ".tmp"
 
-    h = hashlib.sha256()
-    size_bytes = 0
+def _record_uploads(
+    db: Session,
+    uploaded: list[tuple[models.TestResultFile, bytes | None, str | None]],
+    ip_address: str | None,
+) -> list[models.TestResultFile]:
+    """Store the blobs, then insert the file rows, take references on the
+    blobs, consume the assignments and audit them, all committed by get_db.
 
+    `uploaded` holds (file row, data key, storage key) per file, with a
+    storage key only for newly written content. Until its blob is stored
+    the file under a storage key belongs to nobody and is deleted on
+    failure; after that it is the blob's.
+    """
+    assignments = []
+    blobs = []
     try:
-        with open(tmp_path, "wb") as out:
-            while True:
-                chunk = file.file.read(1024 * 1024)
-                if not chunk:
-                    break
-                out.write(chunk)
-                h.update(chunk)
-                size_bytes += len(chunk)
-        os.replace(tmp_path, final_path)
-        crypto.encrypt_file(final_path, final_path + ".enc")
-        os.replace(final_path + ".enc", final_path)
-    except Exception:
-        try:
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
-        except Exception:
-            pass
+        for test_file, dek, storage_key in uploaded:
+            assignment = db.get(models.LabUploadAssignment, test_file.assignment_id)
+            if assignment.status != models.LabUploadAssignmentStatus.assigned:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Assignment {assignment.id} is not available for upload",
+                )
+            if not workqueue.may_upload(assignment, test_file.uploaded_by_user_id):
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Assignment {assignment.id} was claimed by someone else",
+                )
+            assignments.append(assignment)
+            blobs.append(
+                blobstore.store(
+                    db,
+                    test_file.hash_hex,
+                    test_file.size_bytes,
+                    assignment.patient_id,
+                    dek,
+                    storage_key,
+                )
+            )
+    except BaseException:
+        for _, _, storage_key in uploaded[len(blobs) :]:
+            blobstore.discard(storage_key)
         raise
 
-    test_file = models.TestResultFile(
+    now = datetime.utcnow()
+    for (test_file, _, _), assignment, blob in zip(uploaded, assignments, blobs):
+        test_file.blob_id = blob.id
+        test_file.storage_path = blob.storage_path
+        db.add(test_file)
+        assignment.status = models.LabUploadAssignmentStatus.uploaded
+        assignment.consumed_at = now
+        assignment.lease_expires_at = None
+    files = [test_file for test_file, _, _ in uploaded]
+    try:
+        db.flush()
+    except IntegrityError:
+        raise HTTPException(
+            status_code=409, detail="Assignment already has an uploaded file"
+        )
+    for blob in blobs:
+        blobstore.add_reference(db, blob.id)
+    for test_file, assignment in zip(files, assignments):
+        events.publish(
+            db,
+            [
+                assignment.doctor_id,
+                assignment.patient_id,
+                test_file.uploaded_by_user_id,
+            ],
+            "lab_assignment.uploaded",
+            id=assignment.id,
+            status=assignment.status.value,
+            record_id=assignment.record_id,
+            file_id=test_file.id,
+        )
+    if len(files) == 1:
+        audit.log(
+            db,
+            "file.uploaded",
+            user_id=files[0].uploaded_by_user_id,
+            resource_type="test_result_file",
+            resource_id=files[0].id,
+            details=f"assignment_id={assignments[0].id} "
+            f"patient_id={assignments[0].patient_id}",
+            ip_address=ip_address,
+        )
+    else:
+        audit.log(
+            db,
+            "file.batch_uploaded",
+            user_id=files[0].uploaded_by_user_id,
+            resource_type="test_result_file",
+            details=" ".join(
+                f"file_id={f.id}:assignment_id={a.id}:patient_id={a.patient_id}"
+                for f, a in zip(files, assignments)
+            ),
+            ip_address=ip_address,
+        )
+    return files
+
+
+def _new_test_file(
+    assignment: models.LabUploadAssignment,
+    uploaded_by_user_id: int,
+    filename: str | None,
+    content_type: str | None,
+    size_bytes: int,
+    hash_hex: str,
+) -> models.TestResultFile:
+    return models.TestResultFile(
         assignment_id=assignment.id,
         record_id=assignment.record_id,
         patient_id=assignment.patient_id,
-        uploaded_by_user_id=current_user.id,
-        original_filename=original_filename,
+        uploaded_by_user_id=uploaded_by_user_id,
+        original_filename=filename or "upload",
         content_type=content_type,
         size_bytes=size_bytes,
-        storage_path=final_path,
         hash_algo="sha256",
-        hash_hex=h.hexdigest(),
+        hash_hex=hash_hex,
     )
 
-    db.add(test_file)
-    assignment.status = models.LabUploadAssignmentStatus.uploaded
-    assignment.consumed_at = now
 
-    try:
-        db.commit()
-    except IntegrityError:
-        db.rollback()
-        raise HTTPException(
-            status_code=409, detail="This assignment already has an uploaded file"
+@router.post(
+    "/assignments/{assignment_id}/upload",
+    response_model=schemas.TestResultFileOut,
+    status_code=201,
+    openapi_extra={
+        "parameters": [
+            {
+                "name": "X-Content-SHA256",
+                "in": "header",
+                "required": False,
+                "description": "Hex SHA-256 of the file. If this content is "
+                "already stored, the upload is only hashed and checked against "
+                "it instead of being encrypted and written again.",
+                "schema": {"type": "string"},
+            }
+        ],
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["file"],
+                        "properties": {"file": {"type": "string", "format": "binary"}},
+                    }
+                }
+            },
+        },
+    },
+)
+async def upload_test_result(
+    assignment_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(require_lab),
+):
+    # The body is read here rather than declared as `UploadFile`, so the file
+    # is encrypted as it streams in instead of being spooled to disk first.
+    # Database work is sync and runs in the threadpool; the assignment is
+    # checked again when the upload is recorded.
+    (assignment,) = await run_in_threadpool(
+        _open_assignments, db, [assignment_id], current_user
+    )
+
+    upload = uploads.MultipartUpload(request, "file")
+    await upload.start()
+
+    claimed_hash = (request.headers.get("x-content-sha256") or "").lower() or None
+    known = claimed_hash is not None and (
+        await run_in_threadpool(blobstore.find_blob, db, claimed_hash)
+    )
+    if known:
+        # duplicate content: hash it to prove the client has it, store nothing
+        dek = storage_key = None
+        size_bytes, hash_hex = await uploads.hash_upload(upload)
+        if hash_hex != claimed_hash:
+            raise HTTPException(
+                status_code=422, detail="File does not match X-Content-SHA256"
+            )
+    else:
+        dek = os.urandom(32)
+        storage_key = blobstore.new_key()
+        size_bytes, hash_hex = await uploads.save_encrypted(
+            upload, storage_key, key=dek
         )
 
-    db.refresh(test_file)
-    audit.log(
+    test_file = _new_test_file(
+        assignment,
+        current_user.id,
+        upload.filename,
+        upload.content_type,
+        size_bytes,
+        hash_hex,
+    )
+    await run_in_threadpool(
+        _record_uploads,
         db,
-        "file.uploaded",
-        user_id=current_user.id,
-        resource_type="test_result_file",
-        resource_id=test_file.id,
-        details=f"assignment_id={assignment_id} patient_id={assignment.patient_id}",
-        ip_address=request.client.host if request.client else None,
+        [(test_file, dek, storage_key)],
+        request.client.host if request.client else None,
     )
     return test_file
+
+
+@router.post(
+    "/assignments/upload",
+    response_model=list[schemas.TestResultFileOut],
+    status_code=201,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["file"],
+                        "properties": {
+                            "file": {
+                                "type": "array",
+                                "items": {"type": "string", "format": "binary"},
+                            }
+                        },
+                    }
+                }
+            },
+        },
+    },
+)
+async def upload_test_results(
+    request: Request,
+    assignment_id: list[int] = Query(..., max_length=MAX_BATCH),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(require_lab),
+):
+    """Upload one file per `assignment_id`, as `file` parts in the same order.
+
+    The files are encrypted and stored while the body streams in, and all of
+    them are recorded in one transaction with a single audit entry; if any
+    fails, none is kept.
+    """
+    if len(set(assignment_id)) != len(assignment_id):
+        raise HTTPException(status_code=422, detail="Duplicate assignment_id")
+    assignments = await run_in_threadpool(
+        _open_assignments, db, assignment_id, current_user
+    )
+
+    upload = uploads.MultipartUpload(request, "file")
+    await upload.start()
+    keys = [(blobstore.new_key(), os.urandom(32)) for _ in assignments]
+    saved = await uploads.save_encrypted_many(upload, keys)
+    uploaded = [
+        (_new_test_file(assignment, current_user.id, *file), dek, storage_key)
+        for assignment, file, (storage_key, dek) in zip(assignments, saved, keys)
+    ]
+    return await run_in_threadpool(
+        _record_uploads,
+        db,
+        uploaded,
+        request.client.host if request.client else None,
+    )
@@ -1,16 +1,20 @@
+from datetime import datetime
 from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from app import models, schemas
 from app.config.database import get_db
-from app.utils import audit, auth
+from app.utils import appointments, audit, auth, cache, events, serialization, sync
 
 router = APIRouter(prefix="/patients", tags=["patients"])
 
 require_patient = auth.require_role("patient")
 
+FIELDS_HELP = "Comma-separated fields of each item to return; default all"
+
 
 @router.get("/doctors/search", response_model=List[schemas.UserOut])
 def search_doctors(
@@ -19,12 +23,20 @@ def search_doctors(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
-    query = db.query(models.User).filter(models.User.role == models.RoleEnum.doctor)
-    if name:
-        query = query.filter(models.User.name.ilike(f"%{name}%"))
-    if specialty:
-        query = query.filter(models.User.specialty.ilike(f"%{specialty}%"))
-    return query.all()
+    def search():
+        query = db.query(models.User).filter(models.User.role == models.RoleEnum.doctor)
+        if name:
+            query = query.filter(models.User.name.ilike(f"%{name}%"))
+        if specialty:
+            query = query.filter(models.User.specialty.ilike(f"%{specialty}%"))
+        return serialization.json_list(schemas.UserOut, query.all())
+
+    return cache.cached(
+        "patients.search_doctors",
+        search,
+        tags=["users:doctor"],
+        params={"name": name, "specialty": specialty},
+    )
 
 
 @router.post("/appointments", response_model=schemas.AppointmentOut, status_code=201)
@@ -45,20 +57,6 @@ def book_appointment(
     if not doctor:
         raise HTTPException(status_code=404, detail="Doctor not found")
 
-    # Check slot conflict
-    conflict = (
-        db.query(models.Appointment)
-        .filter(
-            models.Appointment.doctor_id == payload.doctor_id,
-            models.Appointment.date == payload.date,
-            models.Appointment.time_slot == payload.time_slot,
-            models.Appointment.status != models.AppointmentStatus.cancelled,
-        )
-        .first()
-    )
-    if conflict:
-        raise HTTPException(status_code=409, detail="This time slot is already booked")
-
     appt = models.Appointment(
         patient_id=current_user.id,
         doctor_id=payload.doctor_id,
@@ -67,8 +65,21 @@ def book_appointment(
         notes=payload.notes,
     )
     db.add(appt)
-    db.commit()
-    db.refresh(appt)
+    try:
+        db.flush()
+    except IntegrityError:
+        # the slot's unique index: someone else holds it, or just took it
+        raise HTTPException(status_code=409, detail="This time slot is already booked")
+    cache.invalidate(db, f"patients_of:{appt.doctor_id}", "stats")
+    events.publish(
+        db,
+        [appt.patient_id, appt.doctor_id],
+        "appointment.booked",
+        id=appt.id,
+        status=appt.status.value,
+        date=appt.date,
+        time_slot=appt.time_slot,
+    )
     audit.log(
         db,
         "appointment.booked",
@@ -83,39 +94,60 @@ def book_appointment(
 
 @router.get("/appointments", response_model=List[schemas.AppointmentOut])
 def my_appointments(
+    request: Request,
+    updated_since: Optional[datetime] = Query(
+        None, description="Only rows changed after this X-Sync-Watermark"
+    ),
+    fields: Optional[str] = Query(None, description=FIELDS_HELP),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(require_patient),
 ):
-    return (
-        db.query(models.Appointment)
-        .filter(models.Appointment.patient_id == current_user.id)
+    wanted = serialization.list_fields(schemas.AppointmentOut, fields)
+    cached = sync.not_modified(request, current_user, wanted)
+    if cached:
+        return cached
+    next_since = sync.watermark()
+    appts = (
+        sync.changed_since(
+            db.query(models.Appointment)
+            .options(*serialization.appointment_options(wanted))
+            .filter(models.Appointment.patient_id == current_user.id),
+            models.Appointment.updated_at,
+            updated_since,
+        )
         .order_by(models.Appointment.date.desc())
         .all()
     )
+    return sync.list_response(
+        current_user, schemas.AppointmentOut, appts, next_since, wanted
+    )
 
 
 @router.patch("/appointments/{appt_id}/cancel", response_model=schemas.AppointmentOut)
 def cancel_appointment(
     appt_id: int,
     request: Request,
+    version: Optional[int] = Query(
+        None, description="Only if the appointment is still at this version"
+    ),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(require_patient),
 ):
-    appt = (
-        db.query(models.Appointment)
-        .filter(
-            models.Appointment.id == appt_id,
-            models.Appointment.patient_id == current_user.id,
-        )
-        .first()
+    appt = appointments.transition(
+        db,
+        appt_id,
+        models.AppointmentStatus.cancelled,
+        models.Appointment.patient_id == current_user.id,
+        version=version,
+    )
+    cache.invalidate(db, f"patients_of:{appt.doctor_id}", "stats")
+    events.publish(
+        db,
+        [appt.patient_id, appt.doctor_id],
+        "appointment.cancelled",
+        id=appt.id,
+        status=appt.status.value,
     )
-    if not appt:
-        raise HTTPException(status_code=404, detail="Appointment not found")
-    if appt.status == models.AppointmentStatus.cancelled:
-        raise HTTPException(status_code=400, detail="Already cancelled")
-    appt.status = models.AppointmentStatus.cancelled
-    db.commit()
-    db.refresh(appt)
     audit.log(
         db,
         "appointment.cancelled",
@@ -130,9 +162,11 @@ def cancel_appointment(
 @router.get("/records", response_model=List[schemas.MedicalRecordOut])
 def my_records(
     request: Request,
+    fields: Optional[str] = Query(None, description=FIELDS_HELP),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(require_patient),
 ):
+    wanted = serialization.list_fields(schemas.MedicalRecordOut, fields)
     audit.log(
         db,
         "records.viewed",
@@ -141,11 +175,13 @@ def my_records(
         resource_id=current_user.id,
         ip_address=request.client.host if request.client else None,
     )
-    return (
+    records = (
         db.query(models.MedicalRecord)
+        .options(*serialization.record_options(wanted))
         .filter(models.MedicalRecord.patient_id == current_user.id)
         .all()
     )
+    return serialization.json_list(schemas.MedicalRecordOut, records, fields=wanted)
 
 
 @router.get(
@@ -167,7 +203,7 @@ def my_record_test_files(
     if not record:
         raise HTTPException(status_code=404, detail="Medical record not found")
 
-    return (
+    files = (
         db.query(models.TestResultFile)
         .filter(
             models.TestResultFile.record_id == record_id,
@@ -176,3 +212,45 @@ def my_record_test_files(
         .order_by(models.TestResultFile.created_at.desc())
         .all()
     )
+    return serialization.json_list(schemas.TestResultFileOut, files)
+
+
+@router.get("/dashboard", response_model=schemas.PatientDashboard)
+def dashboard(
+    request: Request,
+    fields: Optional[str] = Query(
+        None,
+        description="Comma-separated sections (`records`) or item fields "
+        "(`appointments.status`) to return; default all",
+    ),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(require_patient),
+):
+    """Appointments and records with their reports and files, in one request."""
+    wanted = serialization.field_mask(schemas.PatientDashboard, fields)
+    data = {}
+    if "appointments" in wanted:
+        data["appointments"] = (
+            db.query(models.Appointment)
+            .options(*serialization.appointment_options(wanted["appointments"]))
+            .filter(models.Appointment.patient_id == current_user.id)
+            .order_by(models.Appointment.date.desc())
+            .all()
+        )
+    if "records" in wanted:
+        audit.log(
+            db,
+            "records.viewed",
+            user_id=current_user.id,
+            resource_type="patient",
+            resource_id=current_user.id,
+            ip_address=request.client.host if request.client else None,
+        )
+        data["records"] = (
+            db.query(models.MedicalRecord)
+            .options(*serialization.record_options(wanted["records"]))
+            .filter(models.MedicalRecord.patient_id == current_user.id)
+            .all()
+        )
+    schema = serialization.subset(schemas.PatientDashboard, wanted)
+    return serialization.json_model(schema.model_validate(data, from_attributes=True))
@@ -2,7 +2,7 @@ import re
 from datetime import datetime
 from typing import List, Optional
 
-from pydantic import BaseModel, EmailStr, field_validator
+from pydantic import BaseModel, EmailStr, Field, field_validator
 
 from app.models import AppointmentStatus, LabUploadAssignmentStatus, RoleEnum
 
@@ -39,6 +39,17 @@ class UserRegister(BaseModel):
         return v
 
 
+class UserImport(UserRegister):
+    """A row of an admin bulk import, which may also create lab accounts."""
+
+    @field_validator("role")
+    @classmethod
+    def role_not_restricted(cls, v: RoleEnum) -> RoleEnum:
+        if v == RoleEnum.admin:
+            raise ValueError("Cannot import admin accounts")
+        return v
+
+
 class UserLogin(BaseModel):
     email: EmailStr
     password: str
@@ -57,6 +68,17 @@ class UserOut(BaseModel):
         from_attributes = True
 
 
+class DoctorPatientOut(UserOut):
+    visit_count: int
+    last_visit: Optional[str] = None  # "YYYY-MM-DD"
+    next_appointment: Optional[str] = None
+
+
+class DoctorPatientPage(BaseModel):
+    total: int
+    items: List[DoctorPatientOut]
+
+
 # ─── Appointments ────────────────────────────────────────────────────────────
 
 
@@ -94,6 +116,8 @@ class AppointmentOut(BaseModel):
     status: AppointmentStatus
     notes: Optional[str] = None
     created_at: datetime
+    updated_at: Optional[datetime] = None
+    version: int = 1
     patient: Optional[UserOut] = None
     doctor: Optional[UserOut] = None
 
@@ -105,8 +129,15 @@ class AppointmentOut(BaseModel):
 
 
 class LabUploadAssignmentCreate(BaseModel):
-    lab_user_id: int
+    # None: open to every lab user through the work queue
+    lab_user_id: Optional[int] = None
     expires_at: Optional[datetime] = None
+    priority: int = Field(default=0, ge=-100, le=100)
+    due_at: Optional[datetime] = None
+
+
+class LabUploadAssignmentBulkCreate(BaseModel):
+    assignments: List[LabUploadAssignmentCreate] = Field(min_length=1, max_length=50)
 
 
 class LabUploadAssignmentOut(BaseModel):
@@ -114,11 +145,16 @@ class LabUploadAssignmentOut(BaseModel):
     record_id: int
     patient_id: int
     doctor_id: int
-    lab_user_id: int
+    lab_user_id: Optional[int] = None
     status: LabUploadAssignmentStatus
+    priority: int = 0
+    due_at: Optional[datetime] = None
     created_at: datetime
+    updated_at: Optional[datetime] = None
     expires_at: Optional[datetime] = None
     consumed_at: Optional[datetime] = None
+    claimed_by_user_id: Optional[int] = None
+    lease_expires_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -180,3 +216,50 @@ class MedicalRecordOut(BaseModel):
 
 class MedicalRecordCreate(BaseModel):
     summary: Optional[str] = None
+
+
+# ─── Audit Logs ──────────────────────────────────────────────────────────────
+
+
+class AuditLogOut(BaseModel):
+    id: int
+    user_id: Optional[int] = None
+    action: str
+    resource_type: Optional[str] = None
+    resource_id: Optional[int] = None
+    details: Optional[str] = None
+    ip_address: Optional[str] = None
+    timestamp: datetime
+    row_hash: str
+
+    class Config:
+        from_attributes = True
+
+
+class AuditLogPage(BaseModel):
+    total: int
+    items: List[AuditLogOut]
+
+
+# ─── Dashboards ──────────────────────────────────────────────────────────────
+# Sections are None when not asked for with `fields`.
+
+
+class DoctorDashboard(BaseModel):
+    appointments: Optional[List[AppointmentOut]] = None
+    patients: Optional[List[UserOut]] = None
+    # records of patients with an active appointment, with reports and files
+    records: Optional[List[MedicalRecordOut]] = None
+    lab_assignments: Optional[List[LabUploadAssignmentOut]] = None
+
+
+class PatientDashboard(BaseModel):
+    appointments: Optional[List[AppointmentOut]] = None
+    records: Optional[List[MedicalRecordOut]] = None
+
+
+class LabDashboard(BaseModel):
+    assignments: Optional[List[LabUploadAssignmentOut]] = None
+    # next open assignments in work queue order
+    queue: Optional[List[LabUploadAssignmentOut]] = None
+    status_counts: Optional[dict[str, int]] = None
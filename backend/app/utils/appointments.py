@@ -0,0 +1,77 @@
+"""Appointment status transitions.
+
+    pending ──confirm──▶ confirmed
+       │                     │
+       └──────cancel─────────┴──▶ cancelled
+
+A transition is a single conditional UPDATE ... RETURNING: it only matches
+the row while its status is one the transition starts from, and, when the
+client sends the version it last saw, while the version is unchanged. It bumps
+`version`. Of two requests racing to confirm and cancel the same appointment,
+one UPDATE matches and the other matches nothing and gets a 409 describing the
+row as it now is; no row lock is held while either request runs.
+
+Double bookings are prevented by the database: a partial unique index allows
+one appointment that is not cancelled per doctor, date and slot, so of two
+concurrent bookings of a slot the second INSERT fails.
+"""
+
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from app import models
+from app.utils import sync
+
+Appointment = models.Appointment
+Status = models.AppointmentStatus
+
+# target status -> statuses it can be reached from
+TRANSITIONS: dict[Status, frozenset[Status]] = {
+    Status.confirmed: frozenset({Status.pending}),
+    Status.cancelled: frozenset({Status.pending, Status.confirmed}),
+}
+
+
+def transition(
+    db: Session,
+    appt_id: int,
+    to: Status,
+    *where,
+    version: Optional[int] = None,
+) -> Appointment:
+    """Move the appointment to `to`, or raise 404 / 409.
+
+    `where` narrows the appointments the caller may change, e.g. to their own;
+    `version`, if given, must still be the appointment's version.
+    """
+    guard = [Appointment.status.in_(TRANSITIONS[to])]
+    if version is not None:
+        guard.append(Appointment.version == version)
+    appt = db.scalars(
+        update(Appointment)
+        .where(Appointment.id == appt_id, *where, *guard)
+        .values(status=to, version=Appointment.version + 1)
+        .returning(Appointment),
+        execution_options={"populate_existing": True},
+    ).one_or_none()
+    if appt is not None:
+        # a bulk UPDATE is not seen by the flush listener in sync
+        sync.bump(db, [appt.patient_id, appt.doctor_id])
+        return appt
+
+    current = db.scalars(
+        select(Appointment).where(Appointment.id == appt_id, *where),
+        execution_options={"populate_existing": True},
+    ).one_or_none()
+    if current is None:
+        raise HTTPException(status_code=404, detail="Appointment not found")
+    if current.status == to:
+        detail = f"Appointment is already {to.value}"
+    elif current.status not in TRANSITIONS[to]:
+        detail = f"A {current.status.value} appointment cannot be {to.value}"
+    else:
+        detail = f"Appointment has changed; it is now at version {current.version}"
+    raise HTTPException(status_code=409, detail=detail)
@@ -3,9 +3,14 @@ import json
 from datetime import datetime
 from typing import Optional
 
+from sqlalchemy import event, text
 from sqlalchemy.orm import Session
 
 from app import models
+from app.utils.metrics import timed
+
+# pg_advisory_xact_lock key serialising appends to the chain
+CHAIN_LOCK_ID = 0x4D6564436F6E6F
 
 
 def _compute_hash(
@@ -32,6 +37,7 @@ def _compute_hash(
     return hashlib.sha256(payload.encode()).hexdigest()
 
 
+@timed("audit")
 def log(
     db: Session,
     action: str,
@@ -41,19 +47,16 @@ def log(
     details: Optional[str] = None,
     ip_address: Optional[str] = None,
     user_agent: Optional[str] = None,
+    commit: bool = False,
 ) -> models.AuditLog:
-    last = db.query(models.AuditLog).order_by(models.AuditLog.id.desc()).first()
-    prev_hash = last.row_hash if last else None
-    timestamp = datetime.utcnow()
-    row_hash = _compute_hash(
-        timestamp.isoformat(),
-        user_id,
-        action,
-        resource_type,
-        resource_id,
-        details,
-        prev_hash,
-    )
+    """Append an entry to the hash chain when `db` commits.
+
+    The entry is written in the same transaction as the caller's changes,
+    normally the request's single commit in `get_db`, and is linked to the
+    chain only just before that commit, which is skipped if the endpoint
+    raises. commit=True commits right away: for entries that must outlive an
+    error response (a failed login), and for callers outside a request.
+    """
     entry = models.AuditLog(
         user_id=user_id,
         action=action,
@@ -62,15 +65,54 @@ def log(
         details=details,
         ip_address=ip_address,
         user_agent=user_agent,
-        timestamp=timestamp,
-        prev_hash=prev_hash,
-        row_hash=row_hash,
+        timestamp=datetime.utcnow(),
     )
-    db.add(entry)
-    db.commit()
+    if not db.in_transaction():
+        # so that a rollback before any query still drops the entry
+        db.begin()
+    db.info.setdefault("audit", []).append(entry)
+    if commit:
+        db.commit()
     return entry
 
 
+# on every Session, not only SessionLocal's, so no entry is dropped unchained
+@event.listens_for(Session, "before_commit")
+@timed("audit")
+def _chain_pending(session: Session) -> None:
+    entries = session.info.pop("audit", None)
+    if not entries:
+        return
+    if session.get_bind().dialect.name == "postgresql":
+        # one transaction at a time reads the chain's end and extends it
+        session.execute(
+            text("SELECT pg_advisory_xact_lock(:id)"), {"id": CHAIN_LOCK_ID}
+        )
+    last = (
+        session.query(models.AuditLog.row_hash)
+        .order_by(models.AuditLog.id.desc())
+        .first()
+    )
+    prev_hash = last[0] if last else None
+    for entry in entries:
+        entry.prev_hash = prev_hash
+        entry.row_hash = prev_hash = _compute_hash(
+            entry.timestamp.isoformat(),
+            entry.user_id,
+            entry.action,
+            entry.resource_type,
+            entry.resource_id,
+            entry.details,
+            entry.prev_hash,
+        )
+        session.add(entry)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_rolled_back(session: Session, previous_transaction) -> None:
+    session.info.pop("audit", None)
+
+
 def verify_chain(db: Session) -> tuple[bool, Optional[int]]:
     """Verify the entire audit log chain. Returns (is_valid, first_broken_id)."""
     logs = db.query(models.AuditLog).order_by(models.AuditLog.id.asc()).all()
@@ -1,34 +1,49 @@
+import functools
 import os
 from datetime import datetime, timedelta
 from typing import Optional
 
 from dotenv import load_dotenv
 from fastapi import Cookie, Depends, Header, HTTPException, status
-from jose import JWTError, jwt
-from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 
 from app import models
 from app.config.database import get_db
+from app.utils.metrics import timed
 
 load_dotenv()
 
 SECRET_KEY = os.getenv("SECRET_KEY", "fallback-secret")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 60))
+# cost of new hashes (2^rounds); existing hashes keep the cost they were made with
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# passlib and jose (which loads cryptography's OpenSSL backend) are imported
+# on first use rather than with the app
+@functools.lru_cache(maxsize=None)
+def pwd_context():
+    from passlib.context import CryptContext
 
+    return CryptContext(
+        schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS
+    )
+
+
+@timed("bcrypt")
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return pwd_context().hash(password)
 
 
+@timed("bcrypt")
 def verify_password(plain: str, hashed: str) -> bool:
-    return pwd_context.verify(plain, hashed)
+    return pwd_context().verify(plain, hashed)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    from jose import jwt
+
     to_encode = data.copy()
     expire = datetime.utcnow() + (
         expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -38,6 +53,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 
 
 def decode_token(token: str) -> dict:
+    from jose import JWTError, jwt
+
     try:
         return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except JWTError:
@@ -0,0 +1,263 @@
+"""Content-addressed, deduplicated storage for test result files.
+
+Each distinct plaintext is stored once, as a FileBlob, encrypted with its own
+random data key (DEK). The DEK is never stored in the clear: every patient
+who has a file with that content gets a BlobKey row holding the DEK wrapped
+with a key-encryption key (KEK) derived from the master key for that patient
+alone. Blobs are stored under random keys, so names reveal nothing about the
+content.
+
+A repeated upload therefore only costs hashing. When the client sends the
+plaintext hash in `X-Content-SHA256` and the blob exists, the upload is hashed
+without being written at all; otherwise it is encrypted under a fresh key that
+becomes the new blob, or is deleted once the hash turns out to be known.
+"""
+
+import base64
+import functools
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from fastapi import HTTPException
+from sqlalchemy import delete, event, func, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import ORMExecuteState, Session
+
+from app import models
+from app.config.database import SessionLocal
+from app.utils import crypto
+from app.utils.storage import get_storage
+
+GC_GRACE = timedelta(hours=1)
+
+
+def new_key() -> str:
+    """A fresh storage key for content that may become a blob."""
+    name = uuid.uuid4().hex
+    return f"blobs/{name[:2]}/{name}"
+
+
+# ─── Key wrapping ────────────────────────────────────────────────────────────
+
+
+@functools.lru_cache(maxsize=4096)
+def _patient_kek(patient_id: int) -> bytes:
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=f"medconnect:blob-kek:patient:{patient_id}".encode(),
+    ).derive(crypto._get_key())
+
+
+def wrap_key(dek: bytes, patient_id: int, sha256_hex: str) -> str:
+    # the hash is bound as AAD so a wrapped key cannot be moved to another blob
+    nonce = os.urandom(12)
+    wrapped = crypto._aesgcm(_patient_kek(patient_id)).encrypt(
+        nonce, dek, sha256_hex.encode()
+    )
+    return base64.urlsafe_b64encode(nonce + wrapped).decode()
+
+
+def unwrap_key(wrapped_key: str, patient_id: int, sha256_hex: str) -> bytes:
+    data = base64.urlsafe_b64decode(wrapped_key)
+    return crypto._aesgcm(_patient_kek(patient_id)).decrypt(
+        data[:12], data[12:], sha256_hex.encode()
+    )
+
+
+def data_key(db: Session, blob: models.FileBlob, patient_id: int) -> bytes:
+    """The DEK of `blob`, unwrapped with `patient_id`'s key."""
+    key = db.get(models.BlobKey, (blob.id, patient_id))
+    if key is None:
+        raise HTTPException(status_code=404, detail="File key missing")
+    return unwrap_key(key.wrapped_key, patient_id, blob.sha256)
+
+
+def any_data_key(db: Session, blob: models.FileBlob) -> bytes:
+    """The DEK of `blob`, unwrapped with the key of any patient who has it."""
+    key = db.scalars(
+        select(models.BlobKey).where(models.BlobKey.blob_id == blob.id).limit(1)
+    ).first()
+    if key is None:
+        raise HTTPException(status_code=404, detail="File key missing")
+    return unwrap_key(key.wrapped_key, key.patient_id, blob.sha256)
+
+
+def _ensure_key(db: Session, blob: models.FileBlob, patient_id: int) -> None:
+    if db.get(models.BlobKey, (blob.id, patient_id)) is not None:
+        return
+    dek = any_data_key(db, blob)
+    db.add(
+        models.BlobKey(
+            blob_id=blob.id,
+            patient_id=patient_id,
+            wrapped_key=wrap_key(dek, patient_id, blob.sha256),
+        )
+    )
+
+
+# ─── Blobs ───────────────────────────────────────────────────────────────────
+
+
+def find_blob(db: Session, sha256_hex: str) -> Optional[models.FileBlob]:
+    return db.scalars(
+        select(models.FileBlob).where(models.FileBlob.sha256 == sha256_hex.lower())
+    ).first()
+
+
+def discard(storage_key: Optional[str]) -> None:
+    if storage_key is not None:
+        get_storage().delete(storage_key)
+
+
+def store(
+    db: Session,
+    sha256_hex: str,
+    size_bytes: int,
+    patient_id: int,
+    dek: Optional[bytes] = None,
+    storage_key: Optional[str] = None,
+) -> models.FileBlob:
+    """Return the blob for this content, creating it from `storage_key`.
+
+    `storage_key` is a stored file (from `new_key()`) encrypted under `dek`;
+    it becomes the blob if the content is new and is deleted otherwise.
+    Without it the blob must already exist. The blob row, the patient's key
+    and a fresh GC grace period are committed in a session of their own, so
+    the caller's unit of work is left alone and adds the reference when it
+    commits. A blob left unreferenced by a failed caller is collected after
+    GC_GRACE.
+    """
+    blob_db = SessionLocal()
+    try:
+        blob_id = _store(blob_db, sha256_hex, size_bytes, patient_id, dek, storage_key)
+    finally:
+        blob_db.close()
+    return db.get(models.FileBlob, blob_id)
+
+
+def _store(
+    db: Session,
+    sha256_hex: str,
+    size_bytes: int,
+    patient_id: int,
+    dek: Optional[bytes],
+    storage_key: Optional[str],
+) -> int:
+    blob = find_blob(db, sha256_hex)
+    if blob is None and storage_key is not None:
+        blob = models.FileBlob(
+            sha256=sha256_hex,
+            size_bytes=size_bytes,
+            storage_path=storage_key,
+            ref_count=0,
+        )
+        db.add(blob)
+        try:
+            db.flush()
+        except IntegrityError:
+            # the same content was stored concurrently; use that blob
+            db.rollback()
+            blob = find_blob(db, sha256_hex)
+        else:
+            db.add(
+                models.BlobKey(
+                    blob_id=blob.id,
+                    patient_id=patient_id,
+                    wrapped_key=wrap_key(dek, patient_id, sha256_hex),
+                )
+            )
+            db.commit()
+            return blob.id
+
+    discard(storage_key)
+    if blob is None:
+        raise HTTPException(status_code=409, detail="Stored content not found")
+    _ensure_key(db, blob, patient_id)
+    # refresh the GC grace period before the reference is added
+    blob.updated_at = datetime.utcnow()
+    db.commit()
+    return blob.id
+
+
+def add_reference(db: Session, blob_id: int) -> None:
+    """Count one more TestResultFile pointing at the blob (caller commits)."""
+    result = db.execute(
+        update(models.FileBlob)
+        .where(models.FileBlob.id == blob_id)
+        .values(ref_count=models.FileBlob.ref_count + 1, updated_at=datetime.utcnow())
+    )
+    if result.rowcount != 1:
+        raise HTTPException(status_code=409, detail="Stored content was removed")
+
+
+# References are dropped by every ORM delete of a TestResultFile: one by one
+# (Session.delete, delete-orphan cascades) or in bulk (delete(TestResultFile),
+# Query.delete()). Rows removed with textual SQL keep their blobs alive.
+
+
+def _release(connection, blob_id: int, count: int = 1) -> None:
+    connection.execute(
+        update(models.FileBlob)
+        .where(models.FileBlob.id == blob_id)
+        .values(
+            ref_count=models.FileBlob.ref_count - count, updated_at=datetime.utcnow()
+        )
+    )
+
+
+@event.listens_for(models.TestResultFile, "after_delete")
+def _release_blob(mapper, connection, target: models.TestResultFile) -> None:
+    if target.blob_id is not None:
+        _release(connection, target.blob_id)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _release_blobs_bulk(state: ORMExecuteState) -> None:
+    # bulk deletes skip after_delete; count the rows they are about to remove
+    if not state.is_delete or state.bind_mapper is not inspect(models.TestResultFile):
+        return
+    blob_id = models.TestResultFile.blob_id
+    counts = select(blob_id, func.count()).where(blob_id.is_not(None))
+    if state.statement.whereclause is not None:
+        counts = counts.where(state.statement.whereclause)
+    for released, count in state.session.execute(
+        counts.group_by(blob_id), params=state.parameters
+    ).all():
+        _release(state.session, released, count)
+
+
+def collect_garbage(db: Session, grace: timedelta = GC_GRACE) -> int:
+    """Delete blobs unreferenced for longer than `grace`; returns how many.
+
+    Each row is deleted only if it is still unreferenced, so a concurrent
+    upload that just took a reference keeps it.
+    """
+    cutoff = datetime.utcnow() - grace
+    candidates = db.execute(
+        select(models.FileBlob.id, models.FileBlob.storage_path).where(
+            models.FileBlob.ref_count <= 0, models.FileBlob.updated_at < cutoff
+        )
+    ).all()
+    removed = 0
+    for blob_id, storage_key in candidates:
+        db.execute(delete(models.BlobKey).where(models.BlobKey.blob_id == blob_id))
+        result = db.execute(
+            delete(models.FileBlob).where(
+                models.FileBlob.id == blob_id,
+                models.FileBlob.ref_count <= 0,
+                models.FileBlob.updated_at < cutoff,
+            )
+        )
+        if result.rowcount != 1:
+            db.rollback()
+            continue
+        db.commit()
+        discard(storage_key)
+        removed += 1
+    return removed
@@ -0,0 +1,305 @@
+"""Response cache for read endpoints whose result is the same for many callers.
+
+`cached()` keys an entry by endpoint name, the caller's scope (e.g. a doctor
+id, or nothing for results every caller shares), the query parameters and
+the current version of each of the entry's tags. Write paths call
+`invalidate(db, *tags)`; once that session commits, the tags' versions are
+bumped and every entry built under the old versions is unreachable. A reader
+that computed its result before the write landed stores it under the old
+versions too, so it can never be served afterwards. Entries also expire
+after their TTL.
+
+CACHE_URL selects where entries and tag versions live:
+
+* ``sqlite:///./cache.db`` (default) – a WAL-mode SQLite file shared by every
+  worker process on the host. Beyond CACHE_MAX_ENTRIES, the entries closest
+  to expiry are dropped first.
+* ``redis://host:6379/1`` – shared by every host. Requires the ``redis``
+  package; bound memory with ``maxmemory-policy allkeys-lru``.
+* ``memory://`` – per process, LRU-bounded to CACHE_MAX_ENTRIES. An
+  invalidation only reaches the worker that made the write; the others serve
+  their entries until the TTL runs out.
+
+Lookups count as hits or misses in `medconnect_cache_requests_total`.
+"""
+
+import hashlib
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Iterable, Optional
+
+import orjson
+from dotenv import load_dotenv
+from fastapi import Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.config.database import SessionLocal
+from app.utils.metrics import Counter, register
+
+load_dotenv()
+
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+CACHE_URL = os.getenv("CACHE_URL", "sqlite:///./cache.db")
+CACHE_TTL = float(os.getenv("CACHE_TTL_SECONDS", "60"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+
+CACHE_REQUESTS = register(
+    Counter(
+        "medconnect_cache_requests_total",
+        "Cached endpoint lookups by outcome (hit, miss, error).",
+        ("name", "outcome"),
+    )
+)
+
+logger = logging.getLogger(__name__)
+
+
+# ─── Backends ────────────────────────────────────────────────────────────────
+
+
+class CacheBackend(ABC):
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]: ...
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl: float) -> None: ...
+
+    @abstractmethod
+    def versions(self, tags: list[str]) -> list[int]:
+        """Current version of each tag; 0 for a tag never invalidated."""
+
+    @abstractmethod
+    def bump(self, tags: list[str]) -> None: ...
+
+
+class MemoryBackend(CacheBackend):
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self.tags: dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def versions(self, tags):
+        with self.lock:
+            return [self.tags.get(tag, 0) for tag in tags]
+
+    def bump(self, tags):
+        with self.lock:
+            for tag in tags:
+                self.tags[tag] = self.tags.get(tag, 0) + 1
+
+
+class SQLiteBackend(CacheBackend):
+    """Entries in a local SQLite file, shared by all worker processes."""
+
+    def __init__(self, uri: str, max_entries: int):
+        # Same convention as SQLAlchemy: sqlite:///relative, sqlite:////absolute
+        self.path = uri.split("://", 1)[1][1:]
+        self.max_entries = max_entries
+        self._local = threading.local()
+        # a forked worker must not share the parent's SQLite connections
+        os.register_at_fork(after_in_child=self._forget_connections)
+
+    def _forget_connections(self) -> None:
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # the file and its tables are created by the first connection, not
+            # when the app is imported
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_entries_expires ON entries (expires)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tags ("
+                "tag TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = (
+            self._conn()
+            .execute(
+                "SELECT value FROM entries WHERE key = ? AND expires >= ?",
+                (key, time.time()),
+            )
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (key, value, expires) VALUES (?, ?, ?)",
+            (key, value, now + ttl),
+        )
+        if random.random() < 0.01:
+            # now and then, drop expired entries and trim to the bound
+            conn.execute("DELETE FROM entries WHERE expires < ?", (now,))
+            conn.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries "
+                "ORDER BY expires LIMIT max((SELECT count(*) FROM entries) - ?, 0))",
+                (self.max_entries,),
+            )
+
+    def versions(self, tags):
+        placeholders = ",".join("?" * len(tags))
+        rows = dict(
+            self._conn()
+            .execute(
+                f"SELECT tag, version FROM tags WHERE tag IN ({placeholders})", tags
+            )
+            .fetchall()
+        )
+        return [rows.get(tag, 0) for tag in tags]
+
+    def bump(self, tags):
+        self._conn().executemany(
+            "INSERT INTO tags (tag, version) VALUES (?, 1) "
+            "ON CONFLICT(tag) DO UPDATE SET version = version + 1",
+            [(tag,) for tag in tags],
+        )
+
+
+class RedisBackend(CacheBackend):
+    PREFIX = "medconnect:cache:"
+
+    def __init__(self, uri: str):
+        import redis  # optional dependency, only needed for CACHE_URL=redis://
+
+        self.client = redis.Redis.from_url(uri)
+
+    def get(self, key):
+        return self.client.get(self.PREFIX + key)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.PREFIX + key, value, px=max(1, int(ttl * 1000)))
+
+    def versions(self, tags):
+        values = self.client.mget([f"{self.PREFIX}tag:{tag}" for tag in tags])
+        return [int(v) if v is not None else 0 for v in values]
+
+    def bump(self, tags):
+        pipe = self.client.pipeline(transaction=False)
+        for tag in tags:
+            pipe.incr(f"{self.PREFIX}tag:{tag}")
+        pipe.execute()
+
+
+def _make_backend(uri: str) -> CacheBackend:
+    scheme = uri.split("://", 1)[0]
+    if scheme == "memory":
+        return MemoryBackend(CACHE_MAX_ENTRIES)
+    if scheme == "sqlite":
+        return SQLiteBackend(uri, CACHE_MAX_ENTRIES)
+    if scheme in ("redis", "rediss"):
+        return RedisBackend(uri)
+    raise ValueError(f"Unsupported CACHE_URL scheme: {scheme}")
+
+
+backend: CacheBackend = _make_backend(CACHE_URL)
+
+
+# ─── Lookups ─────────────────────────────────────────────────────────────────
+
+
+def _key(name: str, scope: Any, params: dict, versions: list[tuple[str, int]]) -> str:
+    digest = hashlib.sha256(
+        orjson.dumps([scope, params, versions], option=orjson.OPT_SORT_KEYS)
+    ).hexdigest()
+    return f"{name}:{digest}"
+
+
+def cached(
+    name: str,
+    compute: Callable[[], Response],
+    *,
+    tags: Iterable[str],
+    scope: Any = None,
+    params: Optional[dict] = None,
+    ttl: Optional[float] = None,
+) -> Response:
+    """`compute()`'s JSON response, from the cache while none of `tags` changed.
+
+    `scope` must tell apart callers who may see different results.
+    """
+    if not CACHE_ENABLED:
+        return compute()
+    tags = sorted(set(tags))
+    try:
+        key = _key(name, scope, params or {}, list(zip(tags, backend.versions(tags))))
+        body = backend.get(key)
+    except Exception:
+        logger.warning("cache lookup failed for %s", name, exc_info=True)
+        CACHE_REQUESTS.inc(name, "error")
+        return compute()
+    if body is not None:
+        CACHE_REQUESTS.inc(name, "hit")
+        return Response(body, media_type="application/json")
+
+    CACHE_REQUESTS.inc(name, "miss")
+    response = compute()
+    if response.status_code == 200:
+        try:
+            backend.set(key, response.body, CACHE_TTL if ttl is None else ttl)
+        except Exception:
+            logger.warning("cache store failed for %s", name, exc_info=True)
+    return response
+
+
+# ─── Invalidation ────────────────────────────────────────────────────────────
+
+
+def invalidate(db: Session, *tags: str) -> None:
+    """Invalidate entries tagged with any of `tags` once `db` commits."""
+    db.info.setdefault("cache_tags", set()).update(tags)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _bump_committed(session: Session) -> None:
+    tags = session.info.pop("cache_tags", None)
+    if tags and CACHE_ENABLED:
+        try:
+            backend.bump(sorted(tags))
+        except Exception:
+            logger.error("cache invalidation failed for %s", tags, exc_info=True)
+
+
+@event.listens_for(SessionLocal, "after_soft_rollback")
+def _drop_rolled_back(session: Session, previous_transaction) -> None:
+    session.info.pop("cache_tags", None)
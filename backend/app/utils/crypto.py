@@ -1,9 +1,19 @@
 import base64
+import functools
 import os
+import struct
+from typing import TYPE_CHECKING, BinaryIO, Iterator, Optional
 
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+import zstandard
+from cryptography.exceptions import InvalidTag
 
+from app.utils.metrics import current_timings, timed
 
+if TYPE_CHECKING:
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+
+@functools.lru_cache(maxsize=None)
 def _get_key() -> bytes:
     raw = os.getenv("ENCRYPTION_KEY", "")
     if not raw:
@@ -11,41 +21,285 @@ def _get_key() -> bytes:
     return base64.urlsafe_b64decode(raw)
 
 
-def encrypt_file(src_path: str, dest_path: str) -> None:
-    """Encrypt src_path with AES-256-GCM, write nonce+ciphertext to dest_path."""
-    key = _get_key()
-    nonce = os.urandom(12)
-    aesgcm = AESGCM(key)
-    with open(src_path, "rb") as f:
-        plaintext = f.read()
-    ciphertext = aesgcm.encrypt(nonce, plaintext, None)
-    with open(dest_path, "wb") as f:
-        f.write(nonce + ciphertext)
-
-
-def decrypt_file(src_path: str, dest_path: str) -> None:
-    """Decrypt AES-256-GCM file at src_path, write plaintext to dest_path."""
-    key = _get_key()
-    aesgcm = AESGCM(key)
-    with open(src_path, "rb") as f:
-        data = f.read()
+def _aesgcm(key: bytes) -> "AESGCM":
+    # imported on first use: the AEAD module loads cryptography's OpenSSL
+    # backend, which is a sizeable share of the app's import time
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+    return AESGCM(key)
+
+
+@functools.lru_cache(maxsize=None)
+def _text_cipher() -> "AESGCM":
+    return _aesgcm(_get_key())
+
+
+def load_keys() -> None:
+    """Decode the key and set up the cipher now rather than on first use,
+    failing if ENCRYPTION_KEY is missing or not a 256-bit key."""
+    if len(_get_key()) != 32:
+        raise RuntimeError("ENCRYPTION_KEY must be 32 bytes, urlsafe base64")
+    _text_cipher()
+
+
+# ─── Chunked file format ─────────────────────────────────────────────────────
+#
+# header:  MAGIC (4) | version (1) | chunk size (4, big endian) | nonce prefix (7)
+#          [| codec (1), version 2 only]
+# chunks:  AES-256-GCM(chunk) + tag, each plaintext chunk `chunk size` bytes
+#          except the last, which may be shorter (or empty)
+#
+# Chunk i is sealed with nonce = prefix | i (4 bytes) | final flag (1 byte) and
+# the header as associated data, so chunks cannot be reordered, dropped,
+# truncated or moved between files. Files can be encrypted and decrypted
+# without holding them in memory.
+#
+# Version 2 compresses chunks with the header's codec (zstd) before sealing.
+# Sealed chunks then vary in size, so each is framed by a 4 byte big endian
+# length whose top bit says whether that chunk is compressed (chunks that do
+# not shrink are stored as they are); the flag byte is appended to the
+# associated data. Version 1, with fixed-size chunks, is still written when
+# compression is off, and keeps ranged reads a single seek.
+#
+# Files written before this format are a single nonce + ciphertext blob; they
+# are recognised by the missing magic and are still readable.
+
+MAGIC = b"MCE\x01"
+FORMAT_VERSION = 1
+COMPRESSED_FORMAT_VERSION = 2
+CODEC_ZSTD = 1
+CHUNK_SIZE = 1024 * 1024
+TAG_SIZE = 16
+_HEADER = struct.Struct(">4sBI7s")
+HEADER_SIZE = _HEADER.size
+_FRAME = struct.Struct(">I")
+_COMPRESSED = 1 << 31
+
+
+def _chunk_nonce(prefix: bytes, index: int, final: bool) -> bytes:
+    return prefix + struct.pack(">IB", index, final)
+
+
+class StreamEncryptor:
+    """Incremental encryption into the chunked format.
+
+    `update()` and `finalize()` return ciphertext ready to be written out;
+    the first call also returns the header. With `compress`, chunks are
+    zstd-compressed at `level` where that makes them at least 1/16 smaller.
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = CHUNK_SIZE,
+        key: Optional[bytes] = None,
+        compress: bool = False,
+        level: int = 3,
+    ):
+        self.chunk_size = chunk_size
+        self._aesgcm = _aesgcm(key or _get_key())
+        self._prefix = os.urandom(7)
+        if compress:
+            self._compressor = zstandard.ZstdCompressor(level=level)
+            self._header = _HEADER.pack(
+                MAGIC, COMPRESSED_FORMAT_VERSION, chunk_size, self._prefix
+            ) + bytes([CODEC_ZSTD])
+        else:
+            self._compressor = None
+            self._header = _HEADER.pack(MAGIC, FORMAT_VERSION, chunk_size, self._prefix)
+        self._pending = bytearray(self._header)
+        self._buffer = bytearray()
+        self._index = 0
+
+    def _seal(self, chunk: bytes, final: bool) -> None:
+        nonce = _chunk_nonce(self._prefix, self._index, final)
+        self._index += 1
+        if self._compressor is None:
+            self._pending += self._aesgcm.encrypt(nonce, chunk, self._header)
+            return
+        packed = self._compressor.compress(chunk)
+        compressed = len(packed) <= len(chunk) - len(chunk) // 16 and len(chunk) > 0
+        if not compressed:
+            packed = chunk
+        sealed = self._aesgcm.encrypt(nonce, packed, self._header + bytes([compressed]))
+        self._pending += _FRAME.pack(len(sealed) | (_COMPRESSED if compressed else 0))
+        self._pending += sealed
+
+    def _take(self) -> bytes:
+        out = bytes(self._pending)
+        self._pending.clear()
+        return out
+
+    @timed("crypto")
+    def update(self, data: bytes) -> bytes:
+        self._buffer += data
+        # keep at least one byte back so the last chunk is sealed as final
+        while len(self._buffer) > self.chunk_size:
+            self._seal(bytes(self._buffer[: self.chunk_size]), False)
+            del self._buffer[: self.chunk_size]
+        return self._take()
+
+    @timed("crypto")
+    def finalize(self) -> bytes:
+        self._seal(bytes(self._buffer), True)
+        self._buffer.clear()
+        return self._take()
+
+
+def _iter_legacy(
+    src: BinaryIO, key: bytes, start: int = 0, stop: Optional[int] = None
+) -> Iterator[bytes]:
+    data = src.read()
     nonce, ciphertext = data[:12], data[12:]
-    plaintext = aesgcm.decrypt(nonce, ciphertext, None)
-    with open(dest_path, "wb") as f:
-        f.write(plaintext)
+    yield _aesgcm(key).decrypt(nonce, ciphertext, None)[start:stop]
+
+
+def _trim(plaintext: bytes, offset: int, start: int, stop: Optional[int]) -> bytes:
+    """The part of a chunk starting at plaintext `offset` inside [start, stop)."""
+    if start > offset or (stop is not None and stop < offset + len(plaintext)):
+        return plaintext[
+            max(start - offset, 0) : None if stop is None else stop - offset
+        ]
+    return plaintext
+
+
+def _iter_framed(
+    src: BinaryIO,
+    aesgcm: "AESGCM",
+    header: bytes,
+    prefix: bytes,
+    chunk_size: int,
+    start: int,
+    stop: Optional[int],
+) -> Iterator[bytes]:
+    """Decrypt a version 2 body, skipping whole chunks before `start` unread."""
+    decompressor = zstandard.ZstdDecompressor()
+    index = offset = 0
+    frame = src.read(_FRAME.size)
+    while True:
+        if len(frame) != _FRAME.size:
+            raise InvalidTag()  # truncated
+        (word,) = _FRAME.unpack(frame)
+        length, compressed = word & ~_COMPRESSED, bool(word & _COMPRESSED)
+        if offset + chunk_size <= start:
+            # every chunk but the last holds exactly chunk_size bytes
+            src.seek(src.tell() + length)
+            frame = src.read(_FRAME.size)
+            if not frame:
+                return
+        else:
+            sealed = src.read(length)
+            # a chunk is final when nothing follows it
+            frame = src.read(_FRAME.size)
+            final = not frame
+            plaintext = aesgcm.decrypt(
+                _chunk_nonce(prefix, index, final),
+                sealed,
+                header + bytes([compressed]),
+            )
+            if compressed:
+                plaintext = decompressor.decompress(plaintext)
+            yield _trim(plaintext, offset, start, stop)
+            if final or (stop is not None and offset + chunk_size >= stop):
+                return
+        offset += chunk_size
+        index += 1
+
+
+def iter_decrypt(
+    src: BinaryIO,
+    key: Optional[bytes] = None,
+    start: int = 0,
+    stop: Optional[int] = None,
+) -> Iterator[bytes]:
+    """Yield the plaintext of an encrypted file chunk by chunk.
+
+    With `start`/`stop` only plaintext bytes [start, stop) are returned; in
+    the chunked format `src` is seeked straight to the first chunk needed.
+    Raises InvalidTag if any chunk was modified or the file was truncated.
+    """
+    if stop is not None and stop <= start:
+        return
+    key = key or _get_key()
+    header = src.read(HEADER_SIZE)
+    magic, version, chunk_size, prefix = (
+        _HEADER.unpack(header) if len(header) == HEADER_SIZE else (None,) * 4
+    )
+    if magic == MAGIC and version == COMPRESSED_FORMAT_VERSION:
+        header += src.read(1)
+        if len(header) == HEADER_SIZE:
+            raise InvalidTag()  # truncated
+        if header[-1] != CODEC_ZSTD:
+            raise ValueError("Unsupported compression codec")
+        yield from _iter_framed(
+            src, _aesgcm(key), header, prefix, chunk_size, start, stop
+        )
+        return
+    if magic != MAGIC or version != FORMAT_VERSION:
+        src.seek(0)
+        yield from _iter_legacy(src, key, start, stop)
+        return
+
+    aesgcm = _aesgcm(key)
+    sealed_size = chunk_size + TAG_SIZE
+    index = start // chunk_size
+    if index:
+        src.seek(HEADER_SIZE + index * sealed_size)
+    offset = index * chunk_size  # plaintext offset of the current chunk
+    chunk = src.read(sealed_size)
+    while True:
+        # a chunk is final when nothing follows it
+        following = src.read(sealed_size)
+        final = not following
+        try:
+            plaintext = aesgcm.decrypt(
+                _chunk_nonce(prefix, index, final), chunk, header
+            )
+        except InvalidTag:
+            if index == 0:
+                # a legacy file whose random nonce happens to start with MAGIC
+                src.seek(0)
+                yield from _iter_legacy(src, key, start, stop)
+                return
+            raise
+        yield _trim(plaintext, offset, start, stop)
+        offset += chunk_size
+        if final or (stop is not None and offset >= stop):
+            return
+        chunk = following
+        index += 1
+
+
+def encrypt_file(src_path: str, dest_path: str) -> None:
+    """Encrypt src_path with AES-256-GCM into the chunked format at dest_path."""
+    encryptor = StreamEncryptor()
+    with open(src_path, "rb") as src, open(dest_path, "wb") as dest:
+        for chunk in iter(lambda: src.read(encryptor.chunk_size), b""):
+            dest.write(encryptor.update(chunk))
+        dest.write(encryptor.finalize())
+
+
+@timed("crypto")
+def decrypt_file(src_path: str, dest_path: str, key: Optional[bytes] = None) -> None:
+    """Decrypt the encrypted file at src_path, write plaintext to dest_path."""
+    with open(src_path, "rb") as src, open(dest_path, "wb") as dest:
+        for chunk in iter_decrypt(src, key):
+            dest.write(chunk)
 
 
+@timed("crypto")
 def encrypt_text(plaintext: str) -> str:
     """Encrypt a string with AES-256-GCM, return base64-encoded nonce+ciphertext."""
-    key = _get_key()
     nonce = os.urandom(12)
-    ciphertext = AESGCM(key).encrypt(nonce, plaintext.encode(), None)
+    ciphertext = _text_cipher().encrypt(nonce, plaintext.encode(), None)
     return base64.urlsafe_b64encode(nonce + ciphertext).decode()
 
 
+@timed("crypto")
 def decrypt_text(token: str) -> str:
     """Decrypt a base64-encoded nonce+ciphertext string."""
-    key = _get_key()
+    timings = current_timings()
+    if timings is not None:
+        timings.decryptions += 1
     data = base64.urlsafe_b64decode(token)
     nonce, ciphertext = data[:12], data[12:]
-    return AESGCM(key).decrypt(nonce, ciphertext, None).decode()
+    return _text_cipher().decrypt(nonce, ciphertext, None).decode()
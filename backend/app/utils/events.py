@@ -0,0 +1,168 @@
+"""Push notifications of appointment and lab status changes.
+
+Routers `publish()` an event on their session, addressed to the users it
+concerns; it is sent only if and when that session commits. Clients
+subscribe with GET /events (server-sent events) and refetch what changed
+instead of polling the full lists.
+
+Fan-out between workers (``EVENTS_FANOUT``):
+
+* ``local`` – events reach subscribers connected to the same worker process.
+  Enough for a single worker, and the default outside PostgreSQL.
+* ``postgres`` – the event is sent with ``pg_notify`` inside the committing
+  transaction, and every worker LISTENs on the channel and delivers it to
+  its own subscribers. Default on PostgreSQL.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from typing import Iterable, Optional
+
+import orjson
+from dotenv import load_dotenv
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from app.config.database import SessionLocal, engine
+
+load_dotenv()
+
+CHANNEL = "medconnect_events"
+EVENTS_FANOUT = os.getenv("EVENTS_FANOUT", "auto")
+if EVENTS_FANOUT == "auto":
+    EVENTS_FANOUT = "postgres" if engine.dialect.name == "postgresql" else "local"
+# events buffered per connection before it is told to resync
+SUBSCRIBER_BUFFER = 100
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """Events for one user on one connection, read from `queue` as SSE frames.
+
+    A `None` in the queue means events were dropped because the client fell
+    behind; it should refetch everything.
+    """
+
+    def __init__(self, user_id: int, loop: asyncio.AbstractEventLoop):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_BUFFER)
+
+    def _put(self, message: Optional[bytes]) -> None:
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # drop the backlog, leave a resync marker in its place
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+_subscriptions: dict[int, set[Subscription]] = {}
+_lock = threading.Lock()
+
+
+def subscribe(user_id: int) -> Subscription:
+    subscription = Subscription(user_id, asyncio.get_running_loop())
+    with _lock:
+        _subscriptions.setdefault(user_id, set()).add(subscription)
+    return subscription
+
+
+def unsubscribe(subscription: Subscription) -> None:
+    with _lock:
+        subscriptions = _subscriptions.get(subscription.user_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del _subscriptions[subscription.user_id]
+
+
+def _deliver(payload: bytes) -> None:
+    """Hand an encoded event to this worker's subscribers; thread-safe."""
+    message = orjson.loads(payload)
+    frame = b"event: %s\ndata: %s\n\n" % (
+        message["event"].encode(),
+        orjson.dumps(message["data"]),
+    )
+    with _lock:
+        targets = [
+            s for user_id in message["users"] for s in _subscriptions.get(user_id, ())
+        ]
+    for subscription in targets:
+        subscription.loop.call_soon_threadsafe(subscription._put, frame)
+
+
+def publish(db: Session, user_ids: Iterable[Optional[int]], name: str, **data) -> None:
+    """Send `name` with `data` to `user_ids` once `db` commits."""
+    users = sorted({u for u in user_ids if u is not None})
+    if users:
+        payload = orjson.dumps({"users": users, "event": name, "data": data})
+        db.info.setdefault("events", []).append(payload)
+
+
+@event.listens_for(SessionLocal, "before_commit")
+def _notify_in_transaction(session: Session) -> None:
+    if EVENTS_FANOUT == "postgres" and session.info.get("events"):
+        # delivered to listeners if and only if this transaction commits
+        for payload in session.info.pop("events"):
+            session.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": CHANNEL, "payload": payload.decode()},
+            )
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _deliver_committed(session: Session) -> None:
+    for payload in session.info.pop("events", ()):
+        _deliver(payload)
+
+
+@event.listens_for(SessionLocal, "after_soft_rollback")
+def _drop_rolled_back(session: Session, previous_transaction) -> None:
+    session.info.pop("events", None)
+
+
+# ─── PostgreSQL LISTEN ───────────────────────────────────────────────────────
+
+
+def _listen_connection():
+    conn = engine.raw_connection()
+    driver = conn.driver_connection
+    driver.autocommit = True
+    with driver.cursor() as cursor:
+        cursor.execute(f"LISTEN {CHANNEL}")
+    return conn
+
+
+async def listen() -> None:
+    """Deliver events NOTIFYed by any worker to this worker's subscribers."""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            conn = await asyncio.to_thread(_listen_connection)
+        except Exception:
+            logger.exception("could not LISTEN for events, retrying")
+            await asyncio.sleep(5)
+            continue
+        driver = conn.driver_connection
+        fd = driver.fileno()
+        readable = asyncio.Event()
+        loop.add_reader(fd, readable.set)
+        try:
+            while True:
+                await readable.wait()
+                readable.clear()
+                driver.poll()
+                while driver.notifies:
+                    _deliver(driver.notifies.pop(0).payload.encode())
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("event listener connection lost, reconnecting")
+        finally:
+            loop.remove_reader(fd)
+            conn.invalidate()
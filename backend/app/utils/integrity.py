@@ -0,0 +1,248 @@
+"""Integrity checks of stored files.
+
+Every chunk is authenticated by AES-GCM as it is decrypted, so a modified,
+reordered or truncated file fails at the chunk that was touched. On top of
+that, full downloads hash the plaintext as it streams and compare it with the
+SHA-256 recorded at upload, in the same pass. The result is stored in
+file_verifications against the file's storage version, and downloads of a
+version verified within VERIFY_MAX_AGE skip the hashing.
+
+`scrub()` re-verifies stored files in the background, least recently
+verified first, reading at most SCRUB_BYTES_PER_SEC.
+"""
+
+import hashlib
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import BinaryIO, Iterator, Optional
+
+from cryptography.exceptions import InvalidTag
+from dotenv import load_dotenv
+from sqlalchemy import null, or_, select, union_all
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import models
+from app.config.database import SessionLocal
+from app.utils import blobstore, crypto
+from app.utils.storage import get_storage
+
+load_dotenv()
+
+VERIFY_MAX_AGE = timedelta(hours=float(os.getenv("VERIFY_MAX_AGE_HOURS", "168")))
+SCRUB_BYTES_PER_SEC = int(os.getenv("SCRUB_BYTES_PER_SEC", str(8 * 1024 * 1024)))
+
+logger = logging.getLogger(__name__)
+
+
+class FileCorrupted(Exception):
+    """The decrypted file does not match its recorded hash."""
+
+
+def lookup(
+    db: Session, storage_path: str, version: str
+) -> Optional[models.FileVerification]:
+    """The verification of this version of the file, if it is recent enough."""
+    row = db.get(models.FileVerification, storage_path)
+    if (
+        row is None
+        or row.version != version
+        or row.verified_at < datetime.utcnow() - VERIFY_MAX_AGE
+    ):
+        return None
+    return row
+
+
+def record(storage_path: str, version: str, ok: bool) -> None:
+    """Store a verification result.
+
+    Uses its own session: downloads call this at the end of the response
+    stream, after the request's session is closed.
+    """
+    if not ok:
+        logger.error(
+            "integrity check failed for %s (version %s)", storage_path, version
+        )
+    db = SessionLocal()
+    try:
+        db.merge(
+            models.FileVerification(
+                storage_path=storage_path,
+                version=version,
+                ok=ok,
+                verified_at=datetime.utcnow(),
+            )
+        )
+        db.commit()
+    except IntegrityError:
+        # another worker recorded the same file first
+        db.rollback()
+    finally:
+        db.close()
+
+
+def checked(
+    chunks: Iterator[bytes],
+    storage_path: str,
+    version: str,
+    expected_sha256: Optional[str],
+) -> Iterator[bytes]:
+    """Pass decrypted chunks through, recording whether the file is intact.
+
+    With `expected_sha256` the plaintext is hashed on the way and the last
+    chunk is held back until the hash matches, so a client never receives
+    a complete body that failed the check; FileCorrupted is raised instead.
+    Without it only the per-chunk AEAD tags are checked, and only a failure
+    is recorded.
+    """
+    digest = hashlib.sha256() if expected_sha256 else None
+    pending = None
+    try:
+        for chunk in chunks:
+            if digest is None:
+                yield chunk
+                continue
+            if pending is not None:
+                yield pending
+            digest.update(chunk)
+            pending = chunk
+    except InvalidTag:
+        record(storage_path, version, False)
+        raise
+    if digest is None:
+        return
+    ok = digest.hexdigest() == expected_sha256
+    record(storage_path, version, ok)
+    if not ok:
+        raise FileCorrupted(storage_path)
+    if pending is not None:
+        yield pending
+
+
+# ─── Scrubber ────────────────────────────────────────────────────────────────
+
+
+class _Budget:
+    """Paces reads to `bytes_per_sec` by sleeping once ahead of schedule."""
+
+    def __init__(self, bytes_per_sec: int):
+        self.bytes_per_sec = bytes_per_sec
+        self.started = time.monotonic()
+        self.spent = 0
+
+    def spend(self, n: int) -> None:
+        self.spent += n
+        ahead = self.spent / self.bytes_per_sec - (time.monotonic() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+class _PacedReader:
+    def __init__(self, src: BinaryIO, budget: _Budget):
+        self.src, self.budget = src, budget
+
+    def read(self, n: int = -1) -> bytes:
+        data = self.src.read(n)
+        self.budget.spend(len(data))
+        return data
+
+    def seek(self, pos: int, whence: int = 0) -> int:
+        return self.src.seek(pos, whence)
+
+    def tell(self) -> int:
+        return self.src.tell()
+
+
+def _due(db: Session, limit: int) -> list:
+    """Stored files not verified within VERIFY_MAX_AGE, oldest check first."""
+    files = union_all(
+        select(
+            models.FileBlob.storage_path,
+            models.FileBlob.sha256,
+            models.FileBlob.id.label("blob_id"),
+        ),
+        select(
+            models.TestResultFile.storage_path,
+            models.TestResultFile.hash_hex,
+            null(),
+        ).where(
+            models.TestResultFile.blob_id.is_(None),
+            models.TestResultFile.hash_algo == "sha256",
+        ),
+    ).subquery()
+    verified_at = models.FileVerification.verified_at
+    return db.execute(
+        select(files)
+        .outerjoin(
+            models.FileVerification,
+            models.FileVerification.storage_path == files.c.storage_path,
+        )
+        .where(
+            or_(verified_at.is_(None), verified_at < datetime.utcnow() - VERIFY_MAX_AGE)
+        )
+        .order_by(verified_at.is_not(None), verified_at)
+        .limit(limit)
+    ).all()
+
+
+def verify(
+    db: Session,
+    storage_path: str,
+    expected_sha256: str,
+    blob_id: Optional[int] = None,
+    budget: Optional[_Budget] = None,
+) -> bool:
+    """Decrypt and hash one stored file, record and return whether it is intact."""
+    storage = get_storage()
+    version = storage.version(storage_path)
+    if version is None:
+        record(storage_path, "missing", False)
+        return False
+    key = (
+        blobstore.any_data_key(db, db.get(models.FileBlob, blob_id))
+        if blob_id
+        else None
+    )
+    with storage.open_read(storage_path) as src:
+        reader = _PacedReader(src, budget) if budget else src
+        try:
+            for _ in checked(
+                crypto.iter_decrypt(reader, key), storage_path, version, expected_sha256
+            ):
+                pass
+        except (InvalidTag, FileCorrupted):
+            return False
+    return True
+
+
+def scrub(
+    db: Session,
+    bytes_per_sec: int = SCRUB_BYTES_PER_SEC,
+    max_seconds: Optional[float] = None,
+    batch_size: int = 100,
+) -> tuple[int, int]:
+    """Verify files that are due, until none are left or `max_seconds` pass.
+
+    Returns (files checked, files that failed).
+    """
+    budget = _Budget(bytes_per_sec)
+    deadline = None if max_seconds is None else time.monotonic() + max_seconds
+    checked_count = failed = 0
+    seen = set()
+    while deadline is None or time.monotonic() < deadline:
+        # a file whose result could not be recorded stays due; check it once
+        due = [row for row in _due(db, batch_size) if row[0] not in seen]
+        if not due:
+            break
+        for storage_path, sha256, blob_id in due:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            seen.add(storage_path)
+            checked_count += 1
+            if not verify(db, storage_path, sha256, blob_id, budget):
+                failed += 1
+            # hand the connection back while the next file is read
+            db.rollback()
+    return checked_count, failed
@@ -0,0 +1,432 @@
+"""Per-request timing spans and Prometheus-style metrics.
+
+Each request gets a `RequestTimings` object stored in a context variable.
+Code that wants to be accounted for wraps itself in `span("name")`; database
+time and query counts are collected from SQLAlchemy engine events. Sync
+endpoints run in a threadpool with a copy of the context, so they see (and
+mutate) the same `RequestTimings` object as the middleware.
+
+Metric values live in process memory, unless METRICS_DIR is set (as
+gunicorn.conf.py does for several workers). Then each process keeps its
+values in a memory-mapped file in that directory, and /metrics, whichever
+worker serves it, adds up the files of all of them. Files of exited workers
+are kept, so counters do not go backwards when a worker is replaced.
+"""
+
+import functools
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+load_dotenv()
+
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: dict[str, float] = {}
+        self.queries = 0
+        self.commits = 0
+        # encrypted column values decrypted, see models.EncryptedText
+        self.decryptions = 0
+        # threads that did work for this request, for the sampling profiler
+        self.threads: set[int] = {threading.get_ident()}
+
+    def add(self, name: str, seconds: float) -> None:
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+        self.threads.add(threading.get_ident())
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current.get()
+
+
+def start_request() -> tuple[RequestTimings, object]:
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def end_request(token) -> None:
+    _current.reset(token)
+
+
+@contextmanager
+def span(name: str):
+    """Add the time spent in the block to the current request's `name` span."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+def timed(name: str):
+    """Decorator form of `span`."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Count queries and time spent in the database driver per request."""
+
+    # The start time is kept on the statement's execution context: one that
+    # fails never reaches after_cursor_execute, and is dropped with it.
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = context._query_started
+        timings = _current.get()
+        if timings is not None:
+            timings.queries += 1
+            timings.add("db", time.perf_counter() - started)
+
+    @event.listens_for(engine, "commit")
+    def _commit(conn):
+        timings = _current.get()
+        if timings is not None:
+            timings.commits += 1
+
+
+# ─── Shared values ───────────────────────────────────────────────────────────
+#
+# file:   used bytes (8) | entries...
+# entry:  key length (4) | key (JSON [metric, [label values], sample index]),
+#         padded so that the value is 8-byte aligned | value (float64)
+#
+# Only the owning process writes its file. A new entry is written in full
+# before the used length is advanced past it, so readers never see half an
+# entry.
+
+_USED = struct.Struct("<Q")
+_KEY_LENGTH = struct.Struct("<I")
+_VALUE = struct.Struct("<d")
+
+
+def _entries(buf) -> Iterator[tuple[bytes, int, float]]:
+    """(key, value offset, value) of every entry in a values file."""
+    if len(buf) < _USED.size:
+        return
+    used = min(_USED.unpack_from(buf, 0)[0], len(buf))
+    pos = _USED.size
+    while pos < used:
+        (length,) = _KEY_LENGTH.unpack_from(buf, pos)
+        key = bytes(buf[pos + _KEY_LENGTH.size : pos + _KEY_LENGTH.size + length])
+        pos = (pos + _KEY_LENGTH.size + length + 7) & ~7
+        yield key, pos, _VALUE.unpack_from(buf, pos)[0]
+        pos += _VALUE.size
+
+
+class _ValuesFile:
+    """This process's metric values, in METRICS_DIR/<pid>.metrics."""
+
+    INITIAL_SIZE = 1 << 16
+
+    def __init__(self, directory: str):
+        path = os.path.join(directory, f"{os.getpid()}.metrics")
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = os.fstat(self.fd).st_size
+        if size < self.INITIAL_SIZE:
+            size = self.INITIAL_SIZE
+            os.ftruncate(self.fd, size)
+        self.map = mmap.mmap(self.fd, size)
+        self.offsets: dict[tuple, int] = {}
+        self.used = _USED.size
+        for key, offset, _ in _entries(self.map):
+            name, labels, index = json.loads(key)
+            self.offsets[(name, tuple(labels), index)] = offset
+            self.used = offset + _VALUE.size
+        self.lock = threading.Lock()
+
+    def add(self, key: tuple, amount: float) -> None:
+        with self.lock:
+            offset = self.offsets.get(key)
+            if offset is None:
+                offset = self._append(key)
+            (value,) = _VALUE.unpack_from(self.map, offset)
+            _VALUE.pack_into(self.map, offset, value + amount)
+
+    def _append(self, key: tuple) -> int:
+        name, labels, index = key
+        encoded = json.dumps([name, list(labels), index]).encode()
+        offset = (self.used + _KEY_LENGTH.size + len(encoded) + 7) & ~7
+        end = offset + _VALUE.size
+        if end > len(self.map):
+            size = len(self.map)
+            while size < end:
+                size *= 2
+            os.ftruncate(self.fd, size)
+            self.map.resize(size)
+        _KEY_LENGTH.pack_into(self.map, self.used, len(encoded))
+        start = self.used + _KEY_LENGTH.size
+        self.map[start : start + len(encoded)] = encoded
+        _VALUE.pack_into(self.map, offset, 0.0)
+        _USED.pack_into(self.map, 0, end)
+        self.used = end
+        self.offsets[key] = offset
+        return offset
+
+
+_values_file: Optional[_ValuesFile] = None
+_values_file_lock = threading.Lock()
+
+
+def _shared_add(key: tuple, amount: float) -> None:
+    global _values_file
+    if _values_file is None:
+        with _values_file_lock:
+            if _values_file is None:
+                _values_file = _ValuesFile(METRICS_DIR)
+    _values_file.add(key, amount)
+
+
+def _forget_values_file() -> None:
+    # a forked child writes a file of its own, under its own pid
+    global _values_file
+    _values_file = None
+
+
+os.register_at_fork(after_in_child=_forget_values_file)
+
+
+def _collect_shared() -> dict[str, dict[tuple, dict[int, float]]]:
+    """metric -> label values -> sample index -> sum over every process."""
+    totals: dict[str, dict[tuple, dict[int, float]]] = {}
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.metrics")):
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            continue
+        for key, _, value in _entries(data):
+            name, labels, index = json.loads(key)
+            samples = totals.setdefault(name, {}).setdefault(tuple(labels), {})
+            samples[index] = samples.get(index, 0.0) + value
+    return totals
+
+
+def clear_shared_dir() -> None:
+    """Remove the values of a previous run; for the process manager at start."""
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.metrics")):
+        os.remove(path)
+
+
+# ─── Metric registry ─────────────────────────────────────────────────────────
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1.0) -> None:
+        if METRICS_DIR:
+            _shared_add((self.name, label_values, 0), amount)
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self, shared: Optional[dict] = None) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        if shared is not None:
+            items = [(k, v.get(0, 0.0)) for k, v in shared.get(self.name, {}).items()]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        for label_values, value in sorted(items):
+            lines.append(
+                f"{self.name}{_format_labels(self.labels, label_values)} {value:g}"
+            )
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DURATION_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values: dict[tuple, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, *label_values, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        if METRICS_DIR:
+            _shared_add((self.name, label_values, index), 1)
+            _shared_add((self.name, label_values, len(self.buckets) + 1), value)
+            return
+        with self._lock:
+            row = self._values.get(label_values)
+            if row is None:
+                row = self._values[label_values] = [0.0] * (len(self.buckets) + 2)
+            row[index] += 1
+            row[-1] += value
+
+    def render(self, shared: Optional[dict] = None) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        if shared is not None:
+            width = len(self.buckets) + 2
+            items = [
+                (k, [v.get(i, 0.0) for i in range(width)])
+                for k, v in shared.get(self.name, {}).items()
+            ]
+        else:
+            with self._lock:
+                items = [(k, list(v)) for k, v in self._values.items()]
+        for label_values, row in sorted(items):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), row):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                labels = _format_labels(self.labels, label_values, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative:g}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {row[-1]:g}")
+            lines.append(f"{self.name}_count{labels} {cumulative:g}")
+        return lines
+
+
+REGISTRY: list = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+def render_prometheus() -> str:
+    shared = _collect_shared() if METRICS_DIR else None
+    lines: list[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render(shared))
+    return "\n".join(lines) + "\n"
+
+
+REQUESTS = register(
+    Counter(
+        "medconnect_http_requests_total",
+        "HTTP requests by route and status code.",
+        ("method", "route", "status"),
+    )
+)
+REQUEST_DURATION = register(
+    Histogram(
+        "medconnect_http_request_duration_seconds",
+        "Time until the response started, per route.",
+        ("method", "route"),
+    )
+)
+REQUEST_QUERIES = register(
+    Histogram(
+        "medconnect_http_request_db_queries",
+        "Database queries issued per request.",
+        ("method", "route"),
+        buckets=COUNT_BUCKETS,
+    )
+)
+REQUEST_COMMITS = register(
+    Histogram(
+        "medconnect_http_request_db_commits",
+        "Database commits per request.",
+        ("method", "route"),
+        buckets=COUNT_BUCKETS,
+    )
+)
+REQUEST_DECRYPTIONS = register(
+    Histogram(
+        "medconnect_http_request_decryptions",
+        "Encrypted column values decrypted per request.",
+        ("method", "route"),
+        buckets=(*COUNT_BUCKETS, 500, 1000, 5000),
+    )
+)
+REQUEST_SPANS = register(
+    Histogram(
+        "medconnect_http_request_span_seconds",
+        "Time per request spent in db, crypto, bcrypt, audit, ...",
+        ("method", "route", "span"),
+    )
+)
+
+
+def observe_request(
+    method: str, route: str, status: int, timings: RequestTimings, total: float
+) -> None:
+    REQUESTS.inc(method, route, status)
+    REQUEST_DURATION.observe(method, route, value=total)
+    REQUEST_QUERIES.observe(method, route, value=timings.queries)
+    REQUEST_COMMITS.observe(method, route, value=timings.commits)
+    REQUEST_DECRYPTIONS.observe(method, route, value=timings.decryptions)
+    for name, seconds in timings.spans.items():
+        REQUEST_SPANS.observe(method, route, name, value=seconds)
+
+
+def server_timing_header(timings: RequestTimings, total: float) -> str:
+    entries = []
+    for name, seconds in sorted(timings.spans.items()):
+        entry = f"{name};dur={seconds * 1000:.1f}"
+        if name == "db":
+            entry += f';desc="{timings.queries} queries, {timings.commits} commits"'
+        elif name == "crypto" and timings.decryptions:
+            entry += f';desc="{timings.decryptions} decryptions"'
+        entries.append(entry)
+    entries.append(f"app;dur={total * 1000:.1f}")
+    return ", ".join(entries)
@@ -0,0 +1,100 @@
+"""Opt-in sampling profiler for slow requests.
+
+Enabled by setting PROFILE_SLOW_MS. While requests are in flight a daemon
+thread samples the stacks of the threads working on them every
+PROFILE_INTERVAL_MS. When a request takes longer than the threshold its
+samples are written to PROFILE_DIR in the "folded" format understood by
+flamegraph.pl, speedscope and inferno (`frame;frame;frame count` per line).
+"""
+
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from app.utils.metrics import RequestTimings
+
+load_dotenv()
+
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+
+def _folded_stack(frame) -> str:
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(
+            f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+        )
+        frame = frame.f_back
+    return ";".join(reversed(frames))
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float, out_dir: str):
+        self.interval = interval
+        self.out_dir = out_dir
+        self._active: dict[int, tuple[RequestTimings, Counter]] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="request-sampler", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while True:
+            with self._lock:
+                active = list(self._active.values())
+            if not active:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            frames = sys._current_frames()
+            for timings, samples in active:
+                for thread_id in list(timings.threads):
+                    frame = frames.get(thread_id)
+                    if frame is not None and thread_id != own:
+                        samples[_folded_stack(frame)] += 1
+            time.sleep(self.interval)
+
+    def start(self, timings: RequestTimings) -> None:
+        with self._lock:
+            self._active[id(timings)] = (timings, Counter())
+        self._ensure_thread()
+        self._wakeup.set()
+
+    def stop(self, timings: RequestTimings) -> Counter:
+        with self._lock:
+            _, samples = self._active.pop(id(timings), (None, Counter()))
+        return samples
+
+    def dump(self, samples: Counter, method: str, route: str, duration: float) -> str:
+        os.makedirs(self.out_dir, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        name = f"{stamp}-{method}-{slug}-{duration * 1000:.0f}ms.folded"
+        path = os.path.join(self.out_dir, name)
+        with open(path, "w") as out:
+            for stack, count in samples.most_common():
+                out.write(f"{stack} {count}\n")
+        return path
+
+
+profiler: Optional[SamplingProfiler] = (
+    SamplingProfiler(PROFILE_INTERVAL_MS / 1000, PROFILE_DIR)
+    if PROFILE_SLOW_MS > 0
+    else None
+)
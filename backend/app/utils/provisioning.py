@@ -0,0 +1,227 @@
+"""Bulk provisioning of user accounts, for POST /admin/users/import and
+import_users.py.
+
+Rows are CSV with a header row, or NDJSON, with the fields of
+/auth/register; lab accounts may be imported, admin accounts may not. All
+rows are validated before anything is written. Invalid rows, repeats of an
+email earlier in the file and emails already registered are skipped and
+reported with their line numbers.
+
+Passwords are hashed by IMPORT_HASH_WORKERS processes, while the rows already
+hashed are inserted in batches of IMPORT_BATCH_SIZE: one multi-row INSERT for
+the users, one for the initial medical records of the patients among them.
+Each batch commits on its own and is followed by a progress report, so an
+interrupted import keeps the batches it finished and can be rerun with the
+same file. A single audit entry sums up the import.
+"""
+
+import csv
+import io
+import multiprocessing
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, NamedTuple, Optional
+
+import orjson
+from dotenv import load_dotenv
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from app import models, schemas
+from app.utils import audit, auth, cache
+
+load_dotenv()
+
+IMPORT_HASH_WORKERS = int(os.getenv("IMPORT_HASH_WORKERS", "0")) or os.cpu_count() or 1
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", "50000"))
+# the body is parsed in memory; refused before it is read past this
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Content-Type -> format
+MEDIA_TYPES = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+
+class ImportRow(NamedTuple):
+    line: int
+    user: schemas.UserImport
+
+
+def _error(line: int, message: str) -> dict:
+    return {"line": line, "error": message}
+
+
+def _describe(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(map(str, e['loc'])) or 'row'}: {e['msg']}" for e in exc.errors()
+    )
+
+
+def _raw_rows(data: bytes, fmt: str) -> Iterator[tuple[int, object]]:
+    text = data.decode("utf-8-sig")
+    if fmt == "csv":
+        reader = csv.DictReader(io.StringIO(text))
+        if not reader.fieldnames or "email" not in reader.fieldnames:
+            raise ValueError("CSV must start with a header row naming its columns")
+        for row in reader:
+            # blank cells are missing values; cells past the header are ignored
+            yield reader.line_num, {
+                k: v for k, v in row.items() if k is not None and v != ""
+            }
+    else:
+        for line, chunk in enumerate(text.splitlines(), 1):
+            if chunk.strip():
+                try:
+                    yield line, orjson.loads(chunk)
+                except orjson.JSONDecodeError:
+                    yield line, None
+
+
+def parse(data: bytes, fmt: str) -> tuple[list[ImportRow], list[dict]]:
+    """The valid rows of a CSV or NDJSON file, and errors for the others.
+
+    Raises ValueError if the file is not in `fmt` at all.
+    """
+    rows: list[ImportRow] = []
+    errors: list[dict] = []
+    seen: set[str] = set()
+    for line, raw in _raw_rows(data, fmt):
+        if not isinstance(raw, dict):
+            errors.append(_error(line, "not a JSON object"))
+            continue
+        try:
+            user = schemas.UserImport.model_validate(raw)
+        except ValidationError as exc:
+            errors.append(_error(line, _describe(exc)))
+            continue
+        if user.email in seen:
+            errors.append(_error(line, "Email repeated in this file"))
+            continue
+        seen.add(user.email)
+        rows.append(ImportRow(line, user))
+    return rows, errors
+
+
+def _hash_all(passwords: list[str], workers: int) -> Iterator[str]:
+    """Hashes of `passwords` in order, computed ahead by a process pool."""
+    if workers <= 1 or len(passwords) <= 1:
+        yield from map(auth.hash_password, passwords)
+        return
+    # spawn: forking a threaded server can copy locks held by other threads
+    pool = ProcessPoolExecutor(
+        min(workers, len(passwords)), mp_context=multiprocessing.get_context("spawn")
+    )
+    try:
+        yield from pool.map(
+            auth.hash_password,
+            passwords,
+            chunksize=max(1, min(16, len(passwords) // (workers * 4))),
+        )
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+def _existing(db: Session, emails: list[str]) -> set[str]:
+    found: set[str] = set()
+    for i in range(0, len(emails), 500):
+        found.update(
+            db.scalars(
+                select(models.User.email).where(
+                    models.User.email.in_(emails[i : i + 500])
+                )
+            )
+        )
+    return found
+
+
+def import_users(
+    db: Session,
+    rows: list[ImportRow],
+    errors: list[dict],
+    *,
+    actor_id: Optional[int] = None,
+    ip_address: Optional[str] = None,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    workers: int = IMPORT_HASH_WORKERS,
+) -> Iterator[dict]:
+    """Create the users of `rows`, yielding progress after each batch.
+
+    `errors` are the rows `parse` rejected. The last item yielded is the
+    summary, with every skipped row.
+    """
+    total = len(rows) + len(errors)
+    registered = _existing(db, [r.user.email for r in rows])
+    errors = errors + [
+        _error(r.line, "Email already registered")
+        for r in rows
+        if r.user.email in registered
+    ]
+    todo = [r for r in rows if r.user.email not in registered]
+    created: Counter[str] = Counter()
+    hashes = _hash_all([r.user.password for r in todo], workers)
+
+    try:
+        for start in range(0, len(todo), batch_size):
+            batch = [r.user for r in todo[start : start + batch_size]]
+            users = [
+                {
+                    "name": u.name,
+                    "email": u.email,
+                    "hashed_password": next(hashes),
+                    "role": u.role,
+                    "specialty": u.specialty,
+                    "phone": u.phone,
+                }
+                for u in batch
+            ]
+            ids = db.scalars(
+                insert(models.User).returning(
+                    models.User.id, sort_by_parameter_order=True
+                ),
+                users,
+            ).all()
+            records = [
+                {"patient_id": user_id, "summary": "Initial record"}
+                for user_id, u in zip(ids, batch)
+                if u.role == models.RoleEnum.patient
+            ]
+            if records:
+                db.execute(insert(models.MedicalRecord), records)
+            roles = {u.role.value for u in batch}
+            cache.invalidate(db, "stats", *(f"users:{role}" for role in roles))
+            db.commit()
+            created.update(u.role.value for u in batch)
+            yield {
+                "done": len(errors) + sum(created.values()),
+                "total": total,
+                "created": sum(created.values()),
+            }
+    finally:
+        hashes.close()
+        db.rollback()
+        if created:
+            audit.log(
+                db,
+                "user.bulk_import",
+                user_id=actor_id,
+                resource_type="user",
+                details=" ".join(
+                    [f"created={sum(created.values())}", f"skipped={len(errors)}"]
+                    + [f"{role}={n}" for role, n in sorted(created.items())]
+                ),
+                ip_address=ip_address,
+                commit=True,
+            )
+
+    yield {
+        "total": total,
+        "created": sum(created.values()),
+        "skipped": len(errors),
+        "errors": sorted(errors, key=lambda e: e["line"]),
+    }
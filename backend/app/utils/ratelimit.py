@@ -0,0 +1,457 @@
+"""Rate limiting: token-bucket strategy and shared storage for slowapi.
+
+RATE_LIMIT_STORAGE_URI selects where buckets live:
+
+* ``sqlite:///./ratelimit.db`` (default) – a WAL-mode SQLite file shared by
+  every worker process on the host.
+* ``redis://host:6379/0`` – shared by every host; buckets are updated by a Lua
+  script so refill-and-take is atomic. Requires the ``redis`` package.
+* ``memory://`` – per process; each worker enforces its own limits.
+
+Limits are written as usual ("100/minute") and read as a token bucket:
+capacity = amount, refilled continuously at amount/period, so a client can
+burst up to the full amount and is then held to the average rate.
+"""
+
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+import anyio
+from dotenv import load_dotenv
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from limits import RateLimitItem, parse_many
+from limits.storage import MemoryStorage, RedisStorage, Storage
+from limits.strategies import STRATEGIES, RateLimiter
+from limits.util import WindowStats
+from slowapi import Limiter
+from slowapi.middleware import _find_route_handler, _should_exempt
+from slowapi.util import get_remote_address
+
+from app.utils.auth import ALGORITHM, SECRET_KEY
+
+load_dotenv()
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_STORAGE_URI = os.getenv("RATE_LIMIT_STORAGE_URI", "sqlite:///./ratelimit.db")
+RATE_LIMIT_DEFAULT = os.getenv("RATE_LIMIT_DEFAULT", "300/minute")
+RATE_LIMIT_LOGIN = os.getenv("RATE_LIMIT_LOGIN", "10/minute")
+RATE_LIMIT_REGISTER = os.getenv("RATE_LIMIT_REGISTER", "5/minute")
+
+
+# ─── Token bucket ────────────────────────────────────────────────────────────
+
+
+class TokenBucketSupport(ABC):
+    """Storages that can atomically refill and take from a token bucket."""
+
+    @abstractmethod
+    def acquire_tokens(
+        self, key: str, capacity: int, rate: float, cost: int
+    ) -> tuple[bool, float]:
+        """Refill `key` at `rate` tokens/s up to `capacity` and take `cost`.
+
+        Returns (allowed, tokens left). Nothing is taken when not allowed.
+        """
+
+    @abstractmethod
+    def peek_tokens(self, key: str, capacity: int, rate: float) -> float:
+        """Tokens currently available in `key`, without taking any."""
+
+    @abstractmethod
+    def clear_bucket(self, key: str) -> None: ...
+
+
+def _refill(tokens: float, updated: float, now: float, capacity: int, rate: float):
+    return min(capacity, tokens + max(0.0, now - updated) * rate)
+
+
+class TokenBucketRateLimiter(RateLimiter):
+    def __init__(self, storage: Storage):
+        if not isinstance(storage, TokenBucketSupport):
+            raise TypeError(
+                f"{type(storage).__name__} does not support the token-bucket strategy"
+            )
+        super().__init__(storage)
+
+    @staticmethod
+    def _params(item: RateLimitItem) -> tuple[int, float]:
+        return item.amount, item.amount / item.get_expiry()
+
+    def hit(self, item: RateLimitItem, *identifiers: str, cost: int = 1) -> bool:
+        capacity, rate = self._params(item)
+        allowed, _ = self.storage.acquire_tokens(
+            item.key_for(*identifiers), capacity, rate, cost
+        )
+        return allowed
+
+    def test(self, item: RateLimitItem, *identifiers: str, cost: int = 1) -> bool:
+        capacity, rate = self._params(item)
+        return (
+            self.storage.peek_tokens(item.key_for(*identifiers), capacity, rate) >= cost
+        )
+
+    def get_window_stats(self, item: RateLimitItem, *identifiers: str) -> WindowStats:
+        capacity, rate = self._params(item)
+        tokens = self.storage.peek_tokens(item.key_for(*identifiers), capacity, rate)
+        # "reset" = when the bucket is full again
+        return WindowStats(time.time() + (capacity - tokens) / rate, math.floor(tokens))
+
+    def clear(self, item: RateLimitItem, *identifiers: str) -> None:
+        self.storage.clear_bucket(item.key_for(*identifiers))
+
+
+STRATEGIES["token-bucket"] = TokenBucketRateLimiter
+
+
+# ─── Storages ────────────────────────────────────────────────────────────────
+
+
+class MemoryBucketStorage(MemoryStorage, TokenBucketSupport):
+    """limits' in-memory storage plus token buckets (one process only)."""
+
+    STORAGE_SCHEME = ["memory"]
+
+    def __init__(self, uri: str | None = None, **options):
+        super().__init__(uri, **options)
+        self.buckets: dict[str, tuple[float, float]] = {}
+        self.bucket_lock = threading.Lock()
+        self._since_prune = 0
+
+    def _prune(self, now: float) -> None:
+        # Full buckets carry no state worth keeping; bound memory by IP churn.
+        self.buckets = {
+            k: (tokens, updated, capacity, rate)
+            for k, (tokens, updated, capacity, rate) in self.buckets.items()
+            if _refill(tokens, updated, now, capacity, rate) < capacity
+        }
+
+    def acquire_tokens(self, key, capacity, rate, cost):
+        now = time.time()
+        with self.bucket_lock:
+            tokens, updated, *_ = self.buckets.get(key, (capacity, now))
+            tokens = _refill(tokens, updated, now, capacity, rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self.buckets[key] = (tokens, now, capacity, rate)
+            self._since_prune += 1
+            if self._since_prune >= 10_000:
+                self._since_prune = 0
+                self._prune(now)
+        return allowed, tokens
+
+    def peek_tokens(self, key, capacity, rate):
+        now = time.time()
+        with self.bucket_lock:
+            tokens, updated, *_ = self.buckets.get(key, (capacity, now))
+        return _refill(tokens, updated, now, capacity, rate)
+
+    def clear_bucket(self, key):
+        with self.bucket_lock:
+            self.buckets.pop(key, None)
+
+    def reset(self):
+        with self.bucket_lock:
+            self.buckets.clear()
+        return super().reset()
+
+
+class SQLiteStorage(Storage, TokenBucketSupport):
+    """Rate-limit state in a local SQLite file, shared by all worker processes.
+
+    Each bucket update runs in its own ``BEGIN IMMEDIATE`` transaction, which
+    serialises writers across processes. WAL with synchronous=NORMAL keeps a
+    commit to a page write without an fsync.
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, **options):
+        # Same convention as SQLAlchemy: sqlite:///relative, sqlite:////absolute
+        self.path = uri.split("://", 1)[1][1:] or ":memory:"
+        self._local = threading.local()
+        # a forked worker must not share the parent's SQLite connections
+        os.register_at_fork(after_in_child=self._forget_connections)
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _forget_connections(self) -> None:
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # the file and its tables are created by the first connection, not
+            # when the app is imported (and every :memory: connection is empty)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, "
+                "full_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS counters ("
+                "key TEXT PRIMARY KEY, value INTEGER NOT NULL, expires REAL NOT NULL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    class _Transaction:
+        def __init__(self, conn: sqlite3.Connection):
+            self.conn = conn
+
+        def __enter__(self):
+            self.conn.execute("BEGIN IMMEDIATE")
+            return self.conn
+
+        def __exit__(self, exc_type, exc, tb):
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+    def _tx(self) -> "_Transaction":
+        return self._Transaction(self._conn())
+
+    # token bucket
+
+    def acquire_tokens(self, key, capacity, rate, cost):
+        now = time.time()
+        with self._tx() as db:
+            row = db.execute(
+                "SELECT tokens, updated FROM buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens = _refill(*(row or (capacity, now)), now, capacity, rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            db.execute(
+                "INSERT INTO buckets (key, tokens, updated, full_at) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET "
+                "tokens = excluded.tokens, updated = excluded.updated, "
+                "full_at = excluded.full_at",
+                (key, tokens, now, now + (capacity - tokens) / rate),
+            )
+            if random.random() < 0.001:
+                # now and then, drop buckets that have refilled completely
+                db.execute("DELETE FROM buckets WHERE full_at < ?", (now,))
+        return allowed, tokens
+
+    def peek_tokens(self, key, capacity, rate):
+        now = time.time()
+        row = (
+            self._conn()
+            .execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,))
+            .fetchone()
+        )
+        return _refill(*(row or (capacity, now)), now, capacity, rate)
+
+    def clear_bucket(self, key):
+        self._conn().execute("DELETE FROM buckets WHERE key = ?", (key,))
+
+    # limits' Storage API (fixed-window counters)
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        now = time.time()
+        with self._tx() as db:
+            db.execute(
+                "DELETE FROM counters WHERE key = ? AND expires <= ?", (key, now)
+            )
+            db.execute(
+                "INSERT INTO counters (key, value, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+                (key, amount, now + expiry),
+            )
+            return db.execute(
+                "SELECT value FROM counters WHERE key = ?", (key,)
+            ).fetchone()[0]
+
+    def get(self, key: str) -> int:
+        row = (
+            self._conn()
+            .execute(
+                "SELECT value FROM counters WHERE key = ? AND expires > ?",
+                (key, time.time()),
+            )
+            .fetchone()
+        )
+        return row[0] if row else 0
+
+    def get_expiry(self, key: str) -> float:
+        row = (
+            self._conn()
+            .execute("SELECT expires FROM counters WHERE key = ?", (key,))
+            .fetchone()
+        )
+        return row[0] if row else time.time()
+
+    def check(self) -> bool:
+        try:
+            self._conn().execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> int | None:
+        with self._tx() as db:
+            count = db.execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+            count += db.execute("SELECT COUNT(*) FROM counters").fetchone()[0]
+            db.execute("DELETE FROM buckets")
+            db.execute("DELETE FROM counters")
+        return count
+
+    def clear(self, key: str) -> None:
+        with self._tx() as db:
+            db.execute("DELETE FROM counters WHERE key = ?", (key,))
+            db.execute("DELETE FROM buckets WHERE key = ?", (key,))
+
+
+_REDIS_TOKEN_BUCKET = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local take = tonumber(ARGV[4])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= cost then
+  allowed = 1
+  if take == 1 then tokens = tokens - cost end
+end
+if take == 1 then
+  redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+  redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+end
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisBucketStorage(RedisStorage, TokenBucketSupport):
+    """limits' Redis storage plus token buckets, evaluated server-side.
+
+    Uses the Redis server clock, so buckets are consistent across hosts.
+    """
+
+    STORAGE_SCHEME = ["redis", "rediss", "redis+unix"]
+
+    def __init__(self, uri: str, **options):
+        super().__init__(uri, **options)
+        self.lua_token_bucket = self.get_connection().register_script(
+            _REDIS_TOKEN_BUCKET
+        )
+
+    def _bucket(self, key, capacity, rate, cost, take):
+        allowed, tokens = self.lua_token_bucket(
+            [self.prefixed_key(key)], [capacity, rate, cost, int(take)]
+        )
+        return bool(allowed), float(tokens)
+
+    def acquire_tokens(self, key, capacity, rate, cost):
+        return self._bucket(key, capacity, rate, cost, True)
+
+    def peek_tokens(self, key, capacity, rate):
+        return self._bucket(key, capacity, rate, 0, False)[1]
+
+    def clear_bucket(self, key):
+        self.get_connection().delete(self.prefixed_key(key))
+
+
+# ─── Limiter ─────────────────────────────────────────────────────────────────
+
+
+def client_ip(request: Request) -> str:
+    return f"ip:{get_remote_address(request)}"
+
+
+def principal_key(request: Request) -> str:
+    """Bucket per user when the request carries a valid token, else per IP.
+
+    Only the JWT signature is checked; no database lookup happens here.
+    """
+    token = request.cookies.get("access_token")
+    authorization = request.headers.get("authorization", "")
+    if not token and authorization.startswith("Bearer "):
+        token = authorization.split(" ", 1)[1]
+    if token:
+        from jose import JWTError, jwt
+
+        try:
+            sub = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+        except JWTError:
+            sub = None
+        if sub is not None:
+            return f"user:{sub}"
+    return client_ip(request)
+
+
+# per-route budgets (`limiter.limit`); RATE_LIMIT_DEFAULT is applied to every
+# other route by RateLimitMiddleware
+limiter = Limiter(
+    key_func=principal_key,
+    strategy="token-bucket",
+    storage_uri=RATE_LIMIT_STORAGE_URI,
+    enabled=RATE_LIMIT_ENABLED,
+)
+
+
+class RateLimitMiddleware:
+    """Apply the application-wide limit to routes without their own budget.
+
+    Pure-ASGI replacement for slowapi's SlowAPIMiddleware (BaseHTTPMiddleware
+    costs ~0.8 ms a request) and SlowAPIASGIMiddleware (re-sends the response
+    start message for every body chunk, which breaks streamed responses).
+    Routes decorated with `limiter.limit` are checked by the decorator.
+
+    The buckets are taken through the limiter's strategy (`limiter.limiter`).
+    With any storage but memory:// that is I/O (SQLite waits up to 5 s for its
+    write lock when workers contend), so it runs in a worker thread rather
+    than on the event loop.
+    """
+
+    def __init__(self, app, limits: str = RATE_LIMIT_DEFAULT):
+        self.app = app
+        self.limits = parse_many(limits)
+
+    def _exceeded(self, strategy: RateLimiter, key: str) -> RateLimitItem | None:
+        """The first limit `key` is over, taking a token from each up to it."""
+        for item in self.limits:
+            if not strategy.hit(item, key, "global"):
+                return item
+        return None
+
+    async def __call__(self, scope, receive, send):
+        app = scope.get("app")
+        limiter = app.state.limiter if app is not None else None
+        if scope["type"] != "http" or limiter is None or not limiter.enabled:
+            await self.app(scope, receive, send)
+            return
+        handler = _find_route_handler(app.routes, scope)
+        if _should_exempt(limiter, handler):
+            await self.app(scope, receive, send)
+            return
+
+        strategy = limiter.limiter
+        key = principal_key(Request(scope, receive))
+        if isinstance(strategy.storage, MemoryStorage):
+            exceeded = self._exceeded(strategy, key)
+        else:
+            exceeded = await anyio.to_thread.run_sync(self._exceeded, strategy, key)
+        if exceeded is not None:
+            response = JSONResponse(
+                {"error": f"Rate limit exceeded: {exceeded}"}, status_code=429
+            )
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
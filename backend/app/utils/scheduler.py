@@ -0,0 +1,269 @@
+"""In-process scheduler for periodic housekeeping jobs.
+
+Every worker runs the scheduler loop, but only the leader runs jobs, so each
+job runs once per interval however many workers there are. On PostgreSQL the
+leader is whoever holds a session-level advisory lock, kept on a dedicated
+connection: if the leader dies its connection closes, the lock is released
+and another worker takes over on its next tick. SQLite has no advisory
+locks and all its workers share one host, so there an exclusive `flock` on a
+lock file derived from the database path plays the same role.
+
+Jobs are plain functions taking a Session, registered with `@job(...)`; each
+runs in a worker thread with its own session and reports its duration and
+outcome to /metrics. Those threads are counted apart from the threadpool that
+serves sync endpoints, so a long job (a scrub runs for up to SCRUB_MAX_SECONDS)
+never takes one of the requests' threads.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+import anyio
+from dotenv import load_dotenv
+from sqlalchemy import text, update
+from sqlalchemy.orm import Session
+
+from app import models
+from app.config.database import DATABASE_URL, SessionLocal, engine
+from app.utils import blobstore, integrity, sync
+from app.utils.metrics import Counter, Histogram, register
+from app.utils.storage import get_storage
+
+load_dotenv()
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+SCHEDULER_TICK = float(os.getenv("SCHEDULER_TICK_SECONDS", "5"))
+# arbitrary constant shared by all workers: "MedConnect" as a 64-bit int
+ADVISORY_LOCK_ID = 0x4D6564436F6E6E
+
+logger = logging.getLogger(__name__)
+
+JOB_DURATION = register(
+    Histogram(
+        "medconnect_scheduler_job_duration_seconds",
+        "Run time of scheduled jobs.",
+        ("job",),
+        buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 60.0, 300.0, 900.0),
+    )
+)
+JOB_RUNS = register(
+    Counter(
+        "medconnect_scheduler_job_runs_total",
+        "Scheduled job runs by outcome (ok, error).",
+        ("job", "outcome"),
+    )
+)
+JOB_ITEMS = register(
+    Counter(
+        "medconnect_scheduler_job_items_total",
+        "Rows or files each job acted on.",
+        ("job",),
+    )
+)
+
+
+class Job:
+    def __init__(self, name: str, interval: float, fn: Callable[[Session], int]):
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self.next_run = 0.0
+        self.running = False
+
+    def run(self) -> None:
+        started = time.perf_counter()
+        db = SessionLocal()
+        try:
+            items = self.fn(db) or 0
+        except Exception:
+            db.rollback()
+            JOB_RUNS.inc(self.name, "error")
+            logger.exception("scheduled job %s failed", self.name)
+        else:
+            JOB_RUNS.inc(self.name, "ok")
+            JOB_ITEMS.inc(self.name, amount=items)
+        finally:
+            db.close()
+            JOB_DURATION.observe(self.name, value=time.perf_counter() - started)
+
+
+JOBS: list[Job] = []
+
+
+def job(name: str, interval: float):
+    """Register `fn(db) -> items acted on` to run every `interval` seconds."""
+
+    def decorator(fn):
+        JOBS.append(Job(name, interval, fn))
+        return fn
+
+    return decorator
+
+
+# ─── Leader election ─────────────────────────────────────────────────────────
+
+
+class _AdvisoryLock:
+    """pg_try_advisory_lock held on a pooled connection kept checked out for as
+    long as this worker leads, so it takes one of the pool's slots.
+
+    The connection is in autocommit mode: neither taking the lock nor the
+    liveness check on later ticks leaves it idle in a transaction.
+    """
+
+    def __init__(self):
+        self._conn = None
+
+    def acquire(self) -> bool:
+        if self._conn is not None:
+            try:
+                self._conn.execute(text("SELECT 1"))
+                return True
+            except Exception:
+                # connection lost, and the lock with it
+                self.release()
+        conn = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        try:
+            held = conn.execute(
+                text("SELECT pg_try_advisory_lock(:id)"), {"id": ADVISORY_LOCK_ID}
+            ).scalar()
+        except Exception:
+            conn.close()
+            raise
+        if held:
+            self._conn = conn
+        else:
+            conn.close()
+        return bool(held)
+
+    def release(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.invalidate()  # drop the session, releasing the lock
+            finally:
+                self._conn = None
+
+
+class _FileLock:
+    """Exclusive flock on a per-database lock file in the temp directory."""
+
+    def __init__(self):
+        digest = hashlib.sha256(DATABASE_URL.encode()).hexdigest()[:16]
+        self.path = os.path.join(
+            tempfile.gettempdir(), f"medconnect-scheduler-{digest}.lock"
+        )
+        self._fd: Optional[int] = None
+
+    def acquire(self) -> bool:
+        import fcntl
+
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def _leader_lock():
+    if engine.dialect.name == "postgresql":
+        return _AdvisoryLock()
+    return _FileLock()
+
+
+# ─── Loop ────────────────────────────────────────────────────────────────────
+
+
+async def _run(job: Job, limiter: anyio.CapacityLimiter) -> None:
+    try:
+        await anyio.to_thread.run_sync(job.run, limiter=limiter)
+    finally:
+        job.running = False
+        job.next_run = time.monotonic() + job.interval
+
+
+async def run_scheduler() -> None:
+    lock = _leader_lock()
+    # one thread per job and one for the election, none from the default limiter
+    limiter = anyio.CapacityLimiter(len(JOBS) + 1)
+    tasks: set[asyncio.Task] = set()
+    try:
+        while True:
+            try:
+                leader = await anyio.to_thread.run_sync(lock.acquire, limiter=limiter)
+            except Exception:
+                logger.exception("scheduler leader election failed")
+                leader = False
+            if leader:
+                now = time.monotonic()
+                for j in JOBS:
+                    if not j.running and now >= j.next_run:
+                        j.running = True
+                        task = asyncio.create_task(_run(j, limiter))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+            await asyncio.sleep(SCHEDULER_TICK)
+    finally:
+        for task in tasks:
+            task.cancel()
+        lock.release()
+
+
+# ─── Jobs ────────────────────────────────────────────────────────────────────
+
+
+@job("expire_assignments", interval=60)
+def expire_assignments(db: Session) -> int:
+    """Mark every assignment past its `expires_at` expired, in one UPDATE."""
+    expired = db.execute(
+        update(models.LabUploadAssignment)
+        .where(
+            models.LabUploadAssignment.status
+            == models.LabUploadAssignmentStatus.assigned,
+            models.LabUploadAssignment.expires_at <= datetime.utcnow(),
+        )
+        .values(status=models.LabUploadAssignmentStatus.expired)
+        .returning(
+            models.LabUploadAssignment.lab_user_id,
+            models.LabUploadAssignment.claimed_by_user_id,
+        )
+    ).all()
+    sync.bump(db, (user_id for row in expired for user_id in row))
+    db.commit()
+    return len(expired)
+
+
+@job("clean_incomplete_uploads", interval=3600)
+def clean_incomplete_uploads(db: Session) -> int:
+    """Remove upload temp files and multipart uploads abandoned over an hour ago."""
+    return get_storage().clean_incomplete(timedelta(hours=1))
+
+
+@job("collect_blobs", interval=3600)
+def collect_blobs(db: Session) -> int:
+    return blobstore.collect_garbage(db)
+
+
+@job("scrub_files", interval=float(os.getenv("SCRUB_INTERVAL_SECONDS", "3600")))
+def scrub_files(db: Session) -> int:
+    """Re-verify stored files for at most SCRUB_MAX_SECONDS per run (0: off)."""
+    max_seconds = float(os.getenv("SCRUB_MAX_SECONDS", "600"))
+    if max_seconds <= 0:
+        return 0
+    checked, _ = integrity.scrub(db, max_seconds=max_seconds)
+    return checked
@@ -0,0 +1,228 @@
+"""Fast JSON path for list responses.
+
+Returning ORM rows with `response_model=List[X]` makes FastAPI validate them,
+dump every model to a dict, walk the dicts again with `jsonable_encoder` and
+finally encode with the stdlib `json`. `json_list` builds the models once with
+a prebuilt `TypeAdapter` and lets pydantic-core write the JSON bytes directly.
+Routes keep their `response_model` so the OpenAPI schema is unchanged; FastAPI
+skips response processing when a `Response` is returned.
+
+`field_mask` and `list_fields` parse `fields=` query parameters, and
+`subset` restricts a schema to the fields asked for. Validating ORM rows with
+the subset reads only those attributes, so deferred columns that were not
+asked for (the encrypted ones, see `models.EncryptedText`) are never loaded
+or decrypted. Routers check `includes` to decide what to eager-load.
+"""
+
+import functools
+from typing import Any, Iterable, List, Optional, Union, get_args, get_origin
+
+from fastapi import HTTPException, Response
+from pydantic import BaseModel, ConfigDict, TypeAdapter, create_model
+from sqlalchemy.orm import selectinload, undefer
+
+from app import models, schemas
+
+_LIST_ADAPTERS: dict[type, TypeAdapter] = {
+    schema: TypeAdapter(List[schema])
+    for schema in (
+        schemas.UserOut,
+        schemas.AppointmentOut,
+        schemas.LabUploadAssignmentOut,
+        schemas.TestResultFileOut,
+        schemas.MedicalRecordOut,
+        schemas.AuditLogOut,
+    )
+}
+
+
+# how many `fields=` subsets (and their list adapters) are kept built
+SUBSET_CACHE_SIZE = 256
+
+
+def list_adapter(schema: type) -> TypeAdapter:
+    adapter = _LIST_ADAPTERS.get(schema)
+    return adapter if adapter is not None else _subset_adapter(schema)
+
+
+@functools.lru_cache(maxsize=SUBSET_CACHE_SIZE)
+def _subset_adapter(schema: type) -> TypeAdapter:
+    return TypeAdapter(List[schema])
+
+
+def dump_list(schema: type, rows: Iterable[Any]) -> bytes:
+    adapter = list_adapter(schema)
+    return adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+
+
+def json_list(
+    schema: type,
+    rows: Iterable[Any],
+    status_code: int = 200,
+    fields: Optional[frozenset] = None,
+) -> Response:
+    """Serialize ORM rows as a JSON array of `schema`, or of its `fields`."""
+    return Response(
+        dump_list(subset(schema, fields), rows),
+        status_code=status_code,
+        media_type="application/json",
+    )
+
+
+def json_model(model: Any, status_code: int = 200, include: Any = None) -> Response:
+    """Serialize an already-built pydantic model, optionally only `include`."""
+    return Response(
+        model.model_dump_json(include=include),
+        status_code=status_code,
+        media_type="application/json",
+    )
+
+
+def field_mask(schema: type, fields: Optional[str]) -> dict:
+    """Parse a `fields` query parameter into a pydantic `include` mask.
+
+    `fields` is a comma-separated list of `schema`'s sections (`records`) or
+    of fields of a list section's items (`appointments.id`); empty means
+    every section. Unknown names are a 422.
+    """
+    sections = schema.model_fields
+    if not fields:
+        return {name: True for name in sections}
+    mask: dict = {}
+    for item in filter(None, (f.strip() for f in fields.split(","))):
+        section, _, field = item.partition(".")
+        if section not in sections:
+            raise HTTPException(status_code=422, detail=f"Unknown field '{item}'")
+        if not field:
+            mask[section] = True
+            continue
+        item_model = _item_model(sections[section].annotation)
+        if item_model is None or field not in item_model.model_fields:
+            raise HTTPException(status_code=422, detail=f"Unknown field '{item}'")
+        if mask.get(section) is not True:
+            mask.setdefault(section, {"__all__": set()})["__all__"].add(field)
+    return mask
+
+
+def _item_model(annotation: Any) -> Optional[type]:
+    """The pydantic model inside Optional[List[Model]], if any."""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation
+    for arg in get_args(annotation):
+        model = _item_model(arg)
+        if model is not None:
+            return model
+    return None
+
+
+def list_fields(schema: type, fields: Optional[str]) -> Optional[frozenset]:
+    """Parse a `fields` query parameter of a list of `schema`: comma-separated
+    field names, None when absent. Unknown names are a 422."""
+    if not fields:
+        return None
+    names = frozenset(filter(None, (f.strip() for f in fields.split(","))))
+    for name in names:
+        if name not in schema.model_fields:
+            raise HTTPException(status_code=422, detail=f"Unknown field '{name}'")
+    return names
+
+
+def includes(mask: Any, *path: str) -> bool:
+    """Whether `mask` (from `field_mask` or `list_fields`) selects `path`."""
+    for name in path:
+        if mask is None or mask is True:
+            return True
+        if isinstance(mask, dict) and "__all__" in mask:
+            mask = mask["__all__"]
+        if name not in mask:
+            return False
+        mask = mask[name] if isinstance(mask, dict) else True
+    return True
+
+
+def _normalise(schema: type, mask: Any) -> tuple:
+    """`mask` as a tuple of (field, True or nested tuple) pairs in `schema`'s
+    field order, so equal selections share one cache entry."""
+    if isinstance(mask, dict) and "__all__" in mask:
+        mask = mask["__all__"]
+    pairs = []
+    for name, info in schema.model_fields.items():
+        if name not in mask:
+            continue
+        inner = mask[name] if isinstance(mask, dict) else True
+        item = _item_model(info.annotation)
+        if item is None or inner is None or inner is True:
+            pairs.append((name, True))
+        else:
+            pairs.append((name, _normalise(item, inner)))
+    return tuple(pairs)
+
+
+def _swap(annotation: Any, old: type, new: type) -> Any:
+    """`annotation` with the model `old` replaced by `new`, e.g. in
+    Optional[List[old]]."""
+    if annotation is old:
+        return new
+    args = get_args(annotation)
+    if not args:
+        return annotation
+    args = tuple(_swap(arg, old, new) for arg in args)
+    origin = get_origin(annotation)
+    return Union[args] if origin is Union else origin[args]
+
+
+def subset(schema: type, mask: Any) -> type:
+    """`schema` restricted to the fields selected by `mask`, recursively.
+
+    `fields=` comes from clients and has no bound on its combinations, so
+    only the SUBSET_CACHE_SIZE most recently used models are kept.
+    """
+    if mask is None or mask is True:
+        return schema
+    return _subset(schema, _normalise(schema, mask))
+
+
+@functools.lru_cache(maxsize=SUBSET_CACHE_SIZE)
+def _subset(schema: type, selection: tuple) -> type:
+    fields = {}
+    for name, inner in selection:
+        info = schema.model_fields[name]
+        annotation = info.annotation
+        if inner is not True:
+            item = _item_model(annotation)
+            annotation = _swap(annotation, item, _subset(item, inner))
+        default = ... if info.is_required() else info.default
+        fields[name] = (annotation, default)
+    return create_model(
+        schema.__name__, __config__=ConfigDict(from_attributes=True), **fields
+    )
+
+
+# ─── Loader options ──────────────────────────────────────────────────────────
+# What to eager-load for rows serialized with a mask: what it selects, and
+# nothing else.
+
+
+def appointment_options(mask: Any) -> list:
+    options = []
+    if includes(mask, "notes"):
+        options.append(undefer(models.Appointment.notes))
+    for relation in ("patient", "doctor"):
+        if includes(mask, relation):
+            options.append(selectinload(getattr(models.Appointment, relation)))
+    return options
+
+
+def record_options(mask: Any) -> list:
+    options = []
+    if includes(mask, "summary"):
+        options.append(undefer(models.MedicalRecord.summary))
+    if includes(mask, "reports"):
+        reports = selectinload(models.MedicalRecord.reports)
+        options += [
+            reports.undefer_group("text"),
+            reports.selectinload(models.Report.doctor),
+        ]
+    if includes(mask, "test_result_files"):
+        options.append(selectinload(models.MedicalRecord.test_result_files))
+    return options
@@ -0,0 +1,383 @@
+"""Where encrypted files are kept.
+
+Files are addressed by a relative key such as ``blobs/ab/<uuid>`` and stored by
+the backend chosen with ``STORAGE_BACKEND``:
+
+* ``local`` (default) – a directory on this host, ``UPLOAD_DIR``. Rows written
+  before keys were relative hold absolute paths, which are used as they are.
+* ``s3`` – a bucket on any S3-compatible store (AWS, MinIO, ...), so every
+  node sees the same files. Requires the ``boto3`` package; configured with
+  ``S3_BUCKET``, ``S3_ENDPOINT_URL``, ``S3_REGION``, ``S3_PREFIX`` and the
+  usual ``AWS_ACCESS_KEY_ID`` / ``AWS_SECRET_ACCESS_KEY``.
+
+Writers stream: the local backend writes a temporary file that is renamed on
+commit, the S3 backend sends a multipart upload one part at a time. Readers
+are seekable file objects; on S3 a seek starts a new ranged GET.
+"""
+
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from typing import BinaryIO, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+
+
+class StorageWriter(ABC):
+    """A file being written. Nothing is visible under the key until `commit()`.
+
+    Used as a context manager it commits on success and aborts on error.
+    """
+
+    @abstractmethod
+    def write(self, data: bytes) -> None: ...
+
+    @abstractmethod
+    def commit(self) -> None: ...
+
+    @abstractmethod
+    def abort(self) -> None: ...
+
+    def __enter__(self) -> "StorageWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+class StorageBackend(ABC):
+    @abstractmethod
+    def open_write(self, key: str) -> StorageWriter: ...
+
+    @abstractmethod
+    def open_read(self, key: str, start: int = 0) -> BinaryIO:
+        """A seekable binary file positioned at `start`; FileNotFoundError if missing."""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool: ...
+
+    @abstractmethod
+    def version(self, key: str) -> Optional[str]:
+        """A token that changes whenever the file does, or None if it is missing."""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove the file; a missing file is not an error."""
+
+    @abstractmethod
+    def clean_incomplete(self, older_than: timedelta) -> int:
+        """Remove writes started over `older_than` ago and never committed.
+
+        A worker killed mid-upload never aborts its writer. Returns how many
+        were removed.
+        """
+
+
+# ─── Local filesystem ────────────────────────────────────────────────────────
+
+
+class _LocalWriter(StorageWriter):
+    def __init__(self, path: str):
+        self.path = path
+        self.tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(self.tmp_path, "wb")
+
+    def write(self, data: bytes) -> None:
+        self._file.write(data)
+
+    def commit(self) -> None:
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self) -> None:
+        self._file.close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+class LocalStorage(StorageBackend):
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+
+    def path(self, key: str) -> str:
+        return key if os.path.isabs(key) else os.path.join(self.root, key)
+
+    def open_write(self, key: str) -> StorageWriter:
+        return _LocalWriter(self.path(key))
+
+    def open_read(self, key: str, start: int = 0) -> BinaryIO:
+        f = open(self.path(key), "rb")
+        if start:
+            f.seek(start)
+        return f
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def version(self, key: str) -> Optional[str]:
+        try:
+            st = os.stat(self.path(key))
+        except FileNotFoundError:
+            return None
+        return f"{st.st_mtime_ns}-{st.st_size}"
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def clean_incomplete(self, older_than: timedelta) -> int:
+        cutoff = time.time() - older_than.total_seconds()
+        removed = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if not name.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    if os.stat(path).st_mtime < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass  # committed or aborted meanwhile
+        return removed
+
+
+# ─── S3-compatible object store ──────────────────────────────────────────────
+
+# S3 wants parts of at least 5 MiB (except the last) and at most 10,000 of them
+S3_PART_SIZE = int(os.getenv("S3_PART_SIZE", str(8 * 1024 * 1024)))
+# forward seeks up to this far read through the open response
+S3_SEEK_READ_BYTES = 2 * 1024 * 1024
+
+
+class _S3Writer(StorageWriter):
+    """Multipart upload, started once the first full part is buffered.
+
+    Files smaller than one part are sent with a single PUT on commit.
+    """
+
+    def __init__(self, client, bucket: str, key: str, part_size: int):
+        self.client, self.bucket, self.key = client, bucket, key
+        self.part_size = part_size
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._parts: list[dict] = []
+
+    def _send_part(self, data: bytes) -> None:
+        if self._upload_id is None:
+            self._upload_id = self.client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key
+            )["UploadId"]
+        number = len(self._parts) + 1
+        resp = self.client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=number,
+            Body=data,
+        )
+        self._parts.append({"ETag": resp["ETag"], "PartNumber": number})
+
+    def write(self, data: bytes) -> None:
+        self._buffer += data
+        while len(self._buffer) >= self.part_size:
+            self._send_part(bytes(self._buffer[: self.part_size]))
+            del self._buffer[: self.part_size]
+
+    def commit(self) -> None:
+        if self._upload_id is None:
+            self.client.put_object(
+                Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer)
+            )
+            return
+        if self._buffer:
+            self._send_part(bytes(self._buffer))
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            MultipartUpload={"Parts": self._parts},
+        )
+
+    def abort(self) -> None:
+        if self._upload_id is not None:
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self._upload_id
+            )
+
+
+class _S3Reader:
+    """Read-only, seekable view of an object; seeks issue ranged GETs."""
+
+    def __init__(self, client, bucket: str, key: str, start: int = 0):
+        self.client, self.bucket, self.key = client, bucket, key
+        self.pos = start
+        self._body = None
+        self._eof = False
+        self._get()
+
+    def _get(self) -> None:
+        from botocore.exceptions import ClientError
+
+        kwargs = {"Range": f"bytes={self.pos}-"} if self.pos else {}
+        try:
+            resp = self.client.get_object(Bucket=self.bucket, Key=self.key, **kwargs)
+        except ClientError as e:
+            code = e.response["Error"]["Code"]
+            if code in ("NoSuchKey", "404"):
+                raise FileNotFoundError(self.key) from e
+            if code == "InvalidRange":  # positioned at or past the end
+                self._eof = True
+                return
+            raise
+        self._body = resp["Body"]
+
+    def read(self, n: int = -1) -> bytes:
+        if self._eof:
+            return b""
+        if self._body is None:
+            self._get()
+            if self._eof:
+                return b""
+        if n is None or n < 0:
+            data = self._body.read()
+        else:
+            # like a file, only return short at the end of the object
+            data = self._body.read(n)
+            while data and len(data) < n and (more := self._body.read(n - len(data))):
+                data += more
+        self.pos += len(data)
+        return data
+
+    def seek(self, pos: int, whence: int = 0) -> int:
+        if whence != 0:
+            raise OSError("only absolute seeks are supported")
+        if self._body is not None and 0 < pos - self.pos <= S3_SEEK_READ_BYTES:
+            # a short skip forward is cheaper to read through than a new GET
+            self.read(pos - self.pos)
+        if pos != self.pos:
+            self.close()
+            self.pos, self._eof = pos, False
+        return self.pos
+
+    def tell(self) -> int:
+        return self.pos
+
+    def close(self) -> None:
+        if self._body is not None:
+            self._body.close()
+            self._body = None
+
+    def __enter__(self) -> "_S3Reader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class S3Storage(StorageBackend):
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        part_size: int = S3_PART_SIZE,
+    ):
+        try:
+            import boto3
+        except ImportError as e:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires the boto3 package") from e
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.part_size = part_size
+        self.client = boto3.client(
+            "s3", endpoint_url=endpoint_url or None, region_name=region or None
+        )
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    def open_write(self, key: str) -> StorageWriter:
+        return _S3Writer(self.client, self.bucket, self._key(key), self.part_size)
+
+    def open_read(self, key: str, start: int = 0) -> BinaryIO:
+        return _S3Reader(self.client, self.bucket, self._key(key), start)
+
+    def exists(self, key: str) -> bool:
+        return self.version(key) is not None
+
+    def version(self, key: str) -> Optional[str]:
+        from botocore.exceptions import ClientError
+
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            raise
+        return head["ETag"].strip('"')
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def clean_incomplete(self, older_than: timedelta) -> int:
+        cutoff = datetime.now(timezone.utc) - older_than
+        removed = 0
+        paginator = self.client.get_paginator("list_multipart_uploads")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for upload in page.get("Uploads", []):
+                if upload["Initiated"] < cutoff:
+                    self.client.abort_multipart_upload(
+                        Bucket=self.bucket,
+                        Key=upload["Key"],
+                        UploadId=upload["UploadId"],
+                    )
+                    removed += 1
+        return removed
+
+
+# ─── Configuration ───────────────────────────────────────────────────────────
+
+
+def upload_base_dir() -> str:
+    return os.path.abspath(
+        os.getenv(
+            "UPLOAD_DIR", os.path.join(os.path.dirname(__file__), "..", "storage")
+        )
+    )
+
+
+_storage: Optional[StorageBackend] = None
+
+
+def get_storage() -> StorageBackend:
+    """The process-wide backend selected by STORAGE_BACKEND."""
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == "local":
+            _storage = LocalStorage(upload_base_dir())
+        elif STORAGE_BACKEND == "s3":
+            _storage = S3Storage(
+                os.environ["S3_BUCKET"],
+                prefix=os.getenv("S3_PREFIX", ""),
+                endpoint_url=os.getenv("S3_ENDPOINT_URL"),
+                region=os.getenv("S3_REGION"),
+            )
+        else:
+            raise RuntimeError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}")
+    return _storage
@@ -0,0 +1,128 @@
+"""Conditional and delta sync of the per-user appointment and assignment lists.
+
+Every user has a `sync_version`, bumped in the same transaction as any change
+to an appointment or lab assignment that appears in their lists: by a flush
+listener for ORM changes, and by `bump()` next to bulk UPDATE statements.
+The version is loaded with the user on authentication, so a list's ETag is
+known before any list query runs and an unchanged refresh costs a 304.
+
+`?updated_since=` returns only rows whose `updated_at` is later. Responses
+carry an `X-Sync-Watermark` to pass next time. It trails the request time by
+SYNC_OVERLAP, because a transaction may still commit rows with an earlier
+`updated_at`. Rows in that window are sent again, so clients must upsert them
+by id.
+"""
+
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable, Optional
+
+from dotenv import load_dotenv
+from fastapi import Request, Response
+from sqlalchemy import event, inspect, update
+from sqlalchemy.orm import Session
+
+from app import models
+from app.config.database import SessionLocal
+from app.utils import serialization
+
+load_dotenv()
+
+SYNC_OVERLAP = timedelta(seconds=float(os.getenv("SYNC_OVERLAP_SECONDS", "30")))
+
+# columns naming the users whose lists show a row
+_LIST_OWNERS = {
+    models.Appointment: ("patient_id", "doctor_id"),
+    models.LabUploadAssignment: ("lab_user_id", "claimed_by_user_id"),
+}
+
+
+def bump(db: Session, user_ids: Iterable[Optional[int]]) -> None:
+    """Invalidate the lists of `user_ids`, as part of the current transaction."""
+    # a fixed order, so concurrent bumps cannot deadlock on the user rows
+    ids = sorted({u for u in user_ids if u is not None})
+    if ids:
+        db.connection().execute(
+            update(models.User.__table__)
+            .where(models.User.__table__.c.id.in_(ids))
+            .values(sync_version=models.User.__table__.c.sync_version + 1)
+        )
+
+
+def _owners(obj: Any, columns: tuple[str, ...]) -> set[int]:
+    """Current and previous values of `columns`: a row moving out of a list
+    changes it too."""
+    state = inspect(obj)
+    owners = set()
+    for column in columns:
+        history = state.attrs[column].history
+        owners.update(history.added, history.unchanged, history.deleted)
+    return owners
+
+
+@event.listens_for(SessionLocal, "before_flush")
+def _collect(session: Session, flush_context, instances) -> None:
+    owners = session.info.setdefault("sync_owners", set())
+    for obj in (*session.new, *session.deleted):
+        columns = _LIST_OWNERS.get(type(obj))
+        if columns:
+            owners |= _owners(obj, columns)
+    for obj in session.dirty:
+        columns = _LIST_OWNERS.get(type(obj))
+        if columns and session.is_modified(obj):
+            owners |= _owners(obj, columns)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _bump_owners(session: Session, flush_context) -> None:
+    owners = session.info.pop("sync_owners", None)
+    if owners:
+        bump(session, owners)
+
+
+def etag(user: models.User, fields: Optional[frozenset] = None) -> str:
+    variant = f";{','.join(sorted(fields))}" if fields else ""
+    return f'W/"{user.id}.{user.sync_version}{variant}"'
+
+
+def not_modified(
+    request: Request, user: models.User, fields: Optional[frozenset] = None
+) -> Optional[Response]:
+    """A 304 if the client's copy of the list is current, else None."""
+    tag = etag(user, fields)
+    if tag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers={"ETag": tag})
+    return None
+
+
+def watermark() -> datetime:
+    """The `updated_since` to give the client for its next delta request.
+
+    Take it before querying the rows it covers.
+    """
+    return datetime.utcnow() - SYNC_OVERLAP
+
+
+def changed_since(query, column, updated_since: Optional[datetime]):
+    """Restrict `query` to rows whose `column` is later than `updated_since`."""
+    if updated_since is None:
+        return query
+    if updated_since.tzinfo is not None:
+        # timestamps are stored as naive UTC
+        updated_since = updated_since.astimezone(timezone.utc).replace(tzinfo=None)
+    return query.filter(column > updated_since)
+
+
+def list_response(
+    user: models.User,
+    schema: type,
+    rows: Iterable[Any],
+    next_since: datetime,
+    fields: Optional[frozenset] = None,
+) -> Response:
+    """`serialization.json_list` with the list's ETag and next watermark."""
+    response = serialization.json_list(schema, rows, fields=fields)
+    response.headers["ETag"] = etag(user, fields)
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.headers["X-Sync-Watermark"] = next_since.isoformat()
+    return response
@@ -0,0 +1,76 @@
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+from starlette.datastructures import MutableHeaders
+
+from app.utils import metrics
+from app.utils.profiling import PROFILE_SLOW_MS, profiler
+
+load_dotenv()
+
+# Span timings tell a client whether bcrypt ran, which is enough to
+# enumerate accounts on /auth/login; keep them out of production responses
+# unless explicitly requested.
+SERVER_TIMING = (
+    os.getenv("SERVER_TIMING") or str(os.getenv("ENV", "dev") != "production")
+).lower() == "true"
+
+logger = logging.getLogger(__name__)
+
+
+class TimingMiddleware:
+    """Record per-request spans, feed the route metrics and emit Server-Timing.
+
+    Written as plain ASGI (not BaseHTTPMiddleware) so streamed responses are
+    passed through untouched; the header is added to `http.response.start`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings, token = metrics.start_request()
+        if profiler is not None:
+            profiler.start(timings)
+        status_code = 500
+        total = None
+
+        async def send_wrapper(message):
+            nonlocal status_code, total
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                total = time.perf_counter() - timings.started
+                if SERVER_TIMING:
+                    headers = MutableHeaders(scope=message)
+                    headers.append(
+                        "Server-Timing", metrics.server_timing_header(timings, total)
+                    )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.end_request(token)
+            if total is None:
+                total = time.perf_counter() - timings.started
+            route = scope.get("route")
+            route_path = route.path if route is not None else "unmatched"
+            method = scope["method"]
+            metrics.observe_request(method, route_path, status_code, timings, total)
+            if profiler is not None:
+                samples = profiler.stop(timings)
+                if samples and total * 1000 >= PROFILE_SLOW_MS:
+                    path = profiler.dump(samples, method, route_path, total)
+                    logger.warning(
+                        "slow request %s %s took %.0f ms, profile written to %s",
+                        method,
+                        route_path,
+                        total * 1000,
+                        path,
+                    )
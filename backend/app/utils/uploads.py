@@ -0,0 +1,356 @@
+"""Streaming multipart uploads.
+
+`request.form()` spools every uploaded file to a temporary file (in plaintext)
+before the endpoint runs. `MultipartUpload` instead parses the request body as
+it arrives and hands out the bytes of a single file field, so an upload can be
+hashed, compressed, encrypted and written while it is still being received.
+`save_encrypted` does that, keeping the CPU and disk work off the event loop;
+`save_encrypted_many` does it for several files sent in one request.
+"""
+
+import asyncio
+import hashlib
+import os
+from typing import AsyncIterator, Optional
+
+import anyio
+import zstandard
+from dotenv import load_dotenv
+from fastapi import HTTPException, Request
+from multipart.multipart import parse_options_header
+
+from app.utils import crypto
+from app.utils.storage import get_storage
+
+load_dotenv()
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(256 * 1024 * 1024)))
+# "auto" compresses uploads that look compressible before encrypting them
+UPLOAD_COMPRESSION = os.getenv("UPLOAD_COMPRESSION", "auto")
+UPLOAD_COMPRESSION_LEVEL = int(os.getenv("UPLOAD_COMPRESSION_LEVEL", "3"))
+
+# already compressed formats, where zstd would only burn CPU
+_COMPRESSED_TYPES = (
+    "image/jpeg",
+    "image/png",
+    "image/gif",
+    "image/webp",
+    "video/",
+    "audio/",
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-bzip2",
+    "application/x-7z-compressed",
+    "application/x-rar-compressed",
+    "application/zstd",
+    "application/vnd.openxmlformats-officedocument.",
+)
+_SAMPLE_BYTES = 64 * 1024
+
+
+def _decode(value: bytes) -> str:
+    try:
+        return value.decode()
+    except UnicodeDecodeError:
+        return value.decode("latin-1")
+
+
+class MultipartUpload:
+    """One file field of a multipart/form-data request, read incrementally.
+
+    Call `start()` to read up to the field's headers (filename and content
+    type are then available), then iterate for its content. Other fields are
+    skipped.
+
+    The body is split with `bytes.find` on the part delimiter rather than with
+    python-multipart, whose per-byte state machine costs ~0.75 ms of event
+    loop time per 64 KiB received.
+    """
+
+    max_header_bytes = 16 * 1024
+
+    def __init__(self, request: Request, field_name: str = "file"):
+        self.request = request
+        self.field_name = field_name
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+        self._stream = request.stream()
+        self._buffer = bytearray()
+        self._delimiter = b""
+
+    async def _fill(self) -> bool:
+        """Append the next body chunk to the buffer; False at the end of the body."""
+        try:
+            self._buffer += await self._stream.__anext__()
+        except StopAsyncIteration:
+            return False
+        return True
+
+    async def _read_until(self, marker: bytes) -> bytes:
+        """Consume the buffer up to and including `marker`, return what preceded it."""
+        while (index := self._buffer.find(marker)) < 0:
+            if len(self._buffer) > self.max_header_bytes:
+                raise HTTPException(status_code=400, detail="Malformed multipart body")
+            if not await self._fill():
+                raise HTTPException(status_code=400, detail="Malformed multipart body")
+        data = bytes(self._buffer[:index])
+        del self._buffer[: index + len(marker)]
+        return data
+
+    async def _skip_until(self, marker: bytes) -> None:
+        """Consume the buffer up to and including `marker`, discarding it."""
+        while (index := self._buffer.find(marker)) < 0:
+            del self._buffer[: max(0, len(self._buffer) - len(marker) + 1)]
+            if not await self._fill():
+                raise HTTPException(status_code=400, detail="Malformed multipart body")
+        del self._buffer[: index + len(marker)]
+
+    async def start(self) -> None:
+        content_type = self.request.headers.get("content-type", "")
+        kind, params = parse_options_header(content_type)
+        if kind != b"multipart/form-data" or b"boundary" not in params:
+            raise HTTPException(
+                status_code=415, detail="Expected a multipart/form-data body"
+            )
+        self._delimiter = b"\r\n--" + params[b"boundary"]
+        # the first delimiter may open the body without a preceding CRLF
+        self._buffer += b"\r\n"
+        if not await self.next_file():
+            raise HTTPException(
+                status_code=422, detail=f"Missing file field '{self.field_name}'"
+            )
+
+    async def next_file(self) -> bool:
+        """Move to the field's next file; False if there are no more.
+
+        Whatever is left of the current file is skipped.
+        """
+        self.filename = self.content_type = None
+        await self._skip_until(self._delimiter)
+        while True:
+            while len(self._buffer) < 2:
+                if not await self._fill():
+                    raise HTTPException(
+                        status_code=400, detail="Malformed multipart body"
+                    )
+            if self._buffer.startswith(b"--"):
+                return False
+            # rest of the delimiter line, then the part's header lines
+            lines = (await self._read_until(b"\r\n\r\n")).split(b"\r\n")[1:]
+            headers = {}
+            for line in lines:
+                name, _, value = line.partition(b":")
+                headers[name.strip().lower()] = value.strip()
+            _, options = parse_options_header(headers.get(b"content-disposition", b""))
+            if options.get(b"name") == self.field_name.encode() and (
+                b"filename" in options
+            ):
+                self.filename = _decode(options[b"filename"]) or None
+                content_type = headers.get(b"content-type")
+                self.content_type = _decode(content_type) if content_type else None
+                return True
+            await self._skip_until(self._delimiter)
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        keep = len(self._delimiter) - 1
+        while True:
+            index = self._buffer.find(self._delimiter)
+            if index >= 0:
+                if index:
+                    yield bytes(self._buffer[:index])
+                del self._buffer[:index]
+                return
+            # hold back a possible partial delimiter at the end
+            if len(self._buffer) > keep:
+                yield bytes(self._buffer[:-keep])
+                del self._buffer[:-keep]
+            if not await self._fill():
+                raise HTTPException(status_code=400, detail="Upload ended early")
+
+
+def should_compress(content_type: Optional[str], sample: bytes) -> bool:
+    """Whether to compress an upload, from its type and its first bytes.
+
+    Known compressed types are skipped outright; anything else is compressed
+    if a sample shrinks by at least 10% at zstd's fastest level (~0.1 ms).
+    """
+    if UPLOAD_COMPRESSION != "auto":
+        return False
+    kind = (content_type or "").split(";")[0].strip().lower()
+    if kind.startswith(_COMPRESSED_TYPES):
+        return False
+    sample = sample[:_SAMPLE_BYTES]
+    if not sample:
+        return False
+    packed = zstandard.ZstdCompressor(level=1).compress(sample)
+    return len(packed) <= len(sample) * 0.9
+
+
+def _new_encryptor(
+    content_type: Optional[str], sample: bytes, key: Optional[bytes]
+) -> crypto.StreamEncryptor:
+    return crypto.StreamEncryptor(
+        key=key,
+        compress=should_compress(content_type, sample),
+        level=UPLOAD_COMPRESSION_LEVEL,
+    )
+
+
+def _write_chunk(out, encryptor, digest, data: bytes, final: bool) -> None:
+    digest.update(data)
+    out.write(encryptor.update(data))
+    if final:
+        out.write(encryptor.finalize())
+
+
+async def save_encrypted(
+    upload: MultipartUpload,
+    dest_key: str,
+    key: Optional[bytes] = None,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+) -> tuple[int, str]:
+    """Encrypt the upload into storage under dest_key while it streams in.
+
+    Data is hashed, encrypted and handed to the storage writer in worker
+    threads, one chunk of crypto.CHUNK_SIZE at a time; the file only appears
+    under dest_key once complete. Whether to compress is decided from the
+    content type and the first chunk. Returns (plaintext size, plaintext
+    SHA-256).
+    """
+    encryptor: Optional[crypto.StreamEncryptor] = None
+    digest = hashlib.sha256()
+    size = 0
+    buffer = bytearray()
+
+    async def write(chunk: bytes, final: bool) -> None:
+        nonlocal encryptor
+        if encryptor is None:
+            encryptor = await anyio.to_thread.run_sync(
+                _new_encryptor, upload.content_type, chunk, key
+            )
+        await anyio.to_thread.run_sync(
+            _write_chunk, out, encryptor, digest, chunk, final
+        )
+
+    out = await anyio.to_thread.run_sync(get_storage().open_write, dest_key)
+    try:
+        async for data in upload:
+            size += len(data)
+            if size > max_bytes:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"File larger than {max_bytes} bytes",
+                )
+            buffer += data
+            if len(buffer) >= crypto.CHUNK_SIZE:
+                chunk, buffer = bytes(buffer), bytearray()
+                await write(chunk, False)
+        await write(bytes(buffer), True)
+        await anyio.to_thread.run_sync(out.commit)
+    except BaseException:
+        with anyio.CancelScope(shield=True):
+            await anyio.to_thread.run_sync(out.abort)
+        raise
+    return size, digest.hexdigest()
+
+
+class _ReceivedFile:
+    """A file of a MultipartUpload handed to another task chunk by chunk."""
+
+    def __init__(self, content_type: Optional[str], receive):
+        self.content_type = content_type
+        self.receive = receive
+
+    def __aiter__(self):
+        return self.receive
+
+
+async def _save_received(
+    filename: Optional[str],
+    received: _ReceivedFile,
+    dest_key: str,
+    key: Optional[bytes],
+    max_bytes: int,
+) -> tuple[Optional[str], Optional[str], int, str]:
+    with received.receive:
+        size, sha256 = await save_encrypted(received, dest_key, key, max_bytes)
+    return filename, received.content_type, size, sha256
+
+
+async def save_encrypted_many(
+    upload: MultipartUpload,
+    files: list[tuple[str, Optional[bytes]]],
+    max_bytes: int = MAX_UPLOAD_BYTES,
+) -> list[tuple[Optional[str], Optional[str], int, str]]:
+    """`save_encrypted` for consecutive files of a started upload.
+
+    `files` holds a (dest_key, key) pair per expected file. The request body
+    is read in order, but each file is saved by its own task fed through a
+    short queue, so a file's last chunks and its storage commit overlap with
+    receiving the next one. Either every file is saved or, on any error,
+    none is kept. Returns (filename, content type, size, SHA-256) per file.
+    """
+    tasks: list[asyncio.Task] = []
+    try:
+        for i, (dest_key, key) in enumerate(files):
+            if i and not await upload.next_file():
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"Expected {len(files)} files, received {i}",
+                )
+            send, receive = anyio.create_memory_object_stream(4)
+            task = asyncio.create_task(
+                _save_received(
+                    upload.filename,
+                    _ReceivedFile(upload.content_type, receive),
+                    dest_key,
+                    key,
+                    max_bytes,
+                )
+            )
+            tasks.append(task)
+            with send:
+                async for data in upload:
+                    try:
+                        await send.send(data)
+                    except anyio.BrokenResourceError:
+                        # the task gave up on this file; raise its error
+                        await task
+                        raise
+        if await upload.next_file():
+            raise HTTPException(
+                status_code=422, detail=f"Expected {len(files)} files, received more"
+            )
+        return [await task for task in tasks]
+    except BaseException:
+        with anyio.CancelScope(shield=True):
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            storage = get_storage()
+            for task, (dest_key, _) in zip(tasks, files):
+                if not task.cancelled() and task.exception() is None:
+                    await anyio.to_thread.run_sync(storage.delete, dest_key)
+        raise
+
+
+async def hash_upload(
+    upload: MultipartUpload, max_bytes: int = MAX_UPLOAD_BYTES
+) -> tuple[int, str]:
+    """Read the upload without storing it. Returns (size, SHA-256)."""
+    digest = hashlib.sha256()
+    size = 0
+    buffer = bytearray()
+    async for data in upload:
+        size += len(data)
+        if size > max_bytes:
+            raise HTTPException(
+                status_code=413, detail=f"File larger than {max_bytes} bytes"
+            )
+        buffer += data
+        if len(buffer) >= crypto.CHUNK_SIZE:
+            chunk, buffer = bytes(buffer), bytearray()
+            await anyio.to_thread.run_sync(digest.update, chunk)
+    digest.update(buffer)
+    return size, digest.hexdigest()
@@ -0,0 +1,165 @@
+"""Lab work queue: lab users claim assignments to work on, under a lease.
+
+Open assignments are those still `assigned`, not expired, either routed to
+the claiming lab user or to no one (open to every lab user), and not held
+under a live lease. They are handed out highest priority first, then by due
+date (undated last), then oldest first.
+
+A claim sets `claimed_by_user_id` and `lease_expires_at`. The holder renews
+the lease while working and the upload consumes the assignment; if the
+holder disappears, the lease runs out and the assignment is handed out
+again.
+
+On PostgreSQL the candidates are selected with FOR UPDATE SKIP LOCKED, so
+concurrent claims each lock a different set of rows instead of queueing on
+the same ones. SQLite has no row locks; there each candidate is claimed with
+a conditional UPDATE that only succeeds while it is still open, and a
+candidate taken by someone else in between is skipped.
+"""
+
+import os
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.orm import Session
+
+from app import models
+from app.utils import sync
+
+load_dotenv()
+
+LEASE_SECONDS = int(os.getenv("LAB_LEASE_SECONDS", "1800"))
+
+Assignment = models.LabUploadAssignment
+
+
+def _open_for(lab_user_id: int, now: datetime):
+    return and_(
+        Assignment.status == models.LabUploadAssignmentStatus.assigned,
+        or_(Assignment.lab_user_id == lab_user_id, Assignment.lab_user_id.is_(None)),
+        or_(Assignment.lease_expires_at.is_(None), Assignment.lease_expires_at <= now),
+        or_(Assignment.expires_at.is_(None), Assignment.expires_at > now),
+    )
+
+
+_QUEUE_ORDER = (
+    Assignment.priority.desc(),
+    Assignment.due_at.is_(None),
+    Assignment.due_at,
+    Assignment.created_at,
+    Assignment.id,
+)
+
+
+def peek(db: Session, lab_user_id: int, limit: int) -> list[Assignment]:
+    """The next open assignments, in queue order, without claiming them."""
+    return list(
+        db.scalars(
+            select(Assignment)
+            .where(_open_for(lab_user_id, datetime.utcnow()))
+            .order_by(*_QUEUE_ORDER)
+            .limit(limit)
+        )
+    )
+
+
+def claim(
+    db: Session, lab_user_id: int, limit: int, lease_seconds: int = LEASE_SECONDS
+) -> list[Assignment]:
+    """Claim up to `limit` open assignments for `lab_user_id` and commit."""
+    now = datetime.utcnow()
+    lease = now + timedelta(seconds=lease_seconds)
+    candidates = (
+        select(Assignment.id, Assignment.claimed_by_user_id)
+        .where(_open_for(lab_user_id, now))
+        .order_by(*_QUEUE_ORDER)
+        .limit(limit)
+    )
+
+    ids = []
+    # whose lapsed leases are taken over, so their lists change too
+    previous = {lab_user_id}
+    if db.get_bind().dialect.name == "postgresql":
+        for assignment_id, claimed_by in db.execute(
+            candidates.with_for_update(skip_locked=True)
+        ):
+            ids.append(assignment_id)
+            previous.add(claimed_by)
+        if ids:
+            db.execute(
+                update(Assignment)
+                .where(Assignment.id.in_(ids))
+                .values(claimed_by_user_id=lab_user_id, lease_expires_at=lease)
+            )
+    else:
+        # over-fetch a little: some candidates may be taken before we get to them
+        for assignment_id, claimed_by in db.execute(candidates.limit(limit * 2)).all():
+            claimed = db.execute(
+                update(Assignment)
+                .where(Assignment.id == assignment_id, _open_for(lab_user_id, now))
+                .values(claimed_by_user_id=lab_user_id, lease_expires_at=lease)
+            ).rowcount
+            if claimed:
+                ids.append(assignment_id)
+                previous.add(claimed_by)
+                if len(ids) == limit:
+                    break
+    if ids:
+        sync.bump(db, previous)
+    db.commit()
+
+    if not ids:
+        return []
+    claimed = {
+        a.id: a for a in db.scalars(select(Assignment).where(Assignment.id.in_(ids)))
+    }
+    return [claimed[i] for i in ids]
+
+
+def renew(
+    db: Session,
+    assignment_id: int,
+    lab_user_id: int,
+    lease_seconds: int = LEASE_SECONDS,
+) -> bool:
+    """Extend a lease still held by `lab_user_id`; False if it was lost."""
+    now = datetime.utcnow()
+    renewed = db.execute(
+        update(Assignment)
+        .where(
+            Assignment.id == assignment_id,
+            Assignment.status == models.LabUploadAssignmentStatus.assigned,
+            Assignment.claimed_by_user_id == lab_user_id,
+            Assignment.lease_expires_at > now,
+        )
+        .values(lease_expires_at=now + timedelta(seconds=lease_seconds))
+    ).rowcount
+    if renewed:
+        sync.bump(db, [lab_user_id])
+    db.commit()
+    return bool(renewed)
+
+
+def release(db: Session, assignment_id: int, lab_user_id: int) -> bool:
+    """Give a claimed assignment back to the queue; False if not held."""
+    released = db.execute(
+        update(Assignment)
+        .where(
+            Assignment.id == assignment_id,
+            Assignment.status == models.LabUploadAssignmentStatus.assigned,
+            Assignment.claimed_by_user_id == lab_user_id,
+        )
+        .values(claimed_by_user_id=None, lease_expires_at=None)
+    ).rowcount
+    if released:
+        sync.bump(db, [lab_user_id])
+    db.commit()
+    return bool(released)
+
+
+def may_upload(assignment: Assignment, lab_user_id: int) -> bool:
+    """Routed assignments belong to their lab user; open ones to the claimant."""
+    if assignment.lab_user_id is not None:
+        return assignment.lab_user_id == lab_user_id
+    return assignment.claimed_by_user_id == lab_user_id
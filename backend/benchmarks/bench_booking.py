@@ -0,0 +1,177 @@
+"""
+Concurrent booking, confirming and cancelling: double bookings and lost updates.
+
+Run with: cd backend && python -m benchmarks.bench_booking [--patients 50 --slots 20]
+                                                       [--concurrency 10]
+
+Builds a throwaway SQLite database with one doctor and --patients patients,
+then runs two rounds in-process over httpx's ASGI transport (sync endpoints
+run on the threadpool, so up to --concurrency requests really overlap):
+
+  booking     every patient tries to book every one of --slots slots at once;
+              each slot must be booked exactly once
+  transitions for each appointment booked, the doctor confirms it while the
+              patient cancels it; an appointment whose cancel succeeded must
+              end up cancelled, and its version must count the transitions
+              that succeeded
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import tempfile
+import time
+from collections import Counter
+
+WORKDIR = tempfile.mkdtemp(prefix="bench_booking_")
+os.environ["DATABASE_URL"] = f"sqlite:///{WORKDIR}/bench.db"
+os.environ["UPLOAD_DIR"] = os.path.join(WORKDIR, "storage")
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+os.environ["CACHE_ENABLED"] = "false"
+os.environ["SCHEDULER_ENABLED"] = "false"
+os.environ.setdefault(
+    "ENCRYPTION_KEY", base64.urlsafe_b64encode(os.urandom(32)).decode()
+)
+
+import httpx  # noqa: E402
+
+from app import models  # noqa: E402
+from app.config.database import SessionLocal, run_migrations  # noqa: E402
+from app.main import app  # noqa: E402
+from app.utils import auth  # noqa: E402
+
+
+def setup(patients: int) -> tuple[int, str, list[str]]:
+    run_migrations()
+    db = SessionLocal()
+    try:
+        doctor = models.User(
+            name="doctor",
+            email="doctor@bench.medconnect.com",
+            hashed_password="-",
+            role=models.RoleEnum.doctor,
+        )
+        users = [
+            models.User(
+                name=f"patient {i}",
+                email=f"patient{i}@bench.medconnect.com",
+                hashed_password="-",
+                role=models.RoleEnum.patient,
+            )
+            for i in range(patients)
+        ]
+        db.add_all([doctor, *users])
+        db.commit()
+
+        def token(user: models.User) -> str:
+            jwt = auth.create_access_token(
+                {"sub": str(user.id), "role": user.role.value}
+            )
+            return f"Bearer {jwt}"
+
+        return doctor.id, token(doctor), [token(u) for u in users]
+    finally:
+        db.close()
+
+
+TIMES = ["09:00 AM", "10:00 AM", "11:00 AM", "02:00 PM", "03:00 PM", "04:00 PM"]
+
+
+def slot(i: int) -> tuple[str, str]:
+    return f"2030-01-{1 + i // len(TIMES):02d}", TIMES[i % len(TIMES)]
+
+
+async def run(args) -> None:
+    doctor_id, doctor, patients = setup(args.patients)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", timeout=None
+    ) as client:
+        # more requests in flight than pooled connections would time out
+        # waiting for one, rather than race
+        gate = asyncio.Semaphore(args.concurrency)
+
+        async def send(method: str, url: str, token: str, **kw) -> httpx.Response:
+            async with gate:
+                return await client.request(
+                    method, url, headers={"Authorization": token}, **kw
+                )
+
+        async def book(token: str, i: int) -> httpx.Response:
+            date, time_slot = slot(i)
+            return await send(
+                "POST",
+                "/patients/appointments",
+                token,
+                json={"doctor_id": doctor_id, "date": date, "time_slot": time_slot},
+            )
+
+        started = time.perf_counter()
+        booked = await asyncio.gather(
+            *(book(t, i) for i in range(args.slots) for t in patients)
+        )
+        elapsed = time.perf_counter() - started
+        codes = Counter(r.status_code for r in booked)
+        accepted = Counter(
+            (r.json()["date"], r.json()["time_slot"])
+            for r in booked
+            if r.status_code == 201
+        )
+        print(
+            f"booking      {len(booked)} requests in {elapsed:.1f}s  "
+            f"{dict(sorted(codes.items()))}"
+        )
+        print(f"  double bookings     {sum(accepted.values()) - len(accepted)}")
+
+        owners = {
+            r.json()["id"]: r.request.headers["Authorization"]
+            for r in booked
+            if r.status_code == 201
+        }
+
+        async def race(appt_id: int) -> tuple[int, int]:
+            confirm, cancel = await asyncio.gather(
+                send("PATCH", f"/doctors/appointments/{appt_id}/confirm", doctor),
+                send(
+                    "PATCH", f"/patients/appointments/{appt_id}/cancel", owners[appt_id]
+                ),
+            )
+            return confirm.status_code, cancel.status_code
+
+        started = time.perf_counter()
+        outcomes = dict(zip(owners, await asyncio.gather(*map(race, owners))))
+        elapsed = time.perf_counter() - started
+        codes = Counter(outcomes.values())
+        print(
+            f"transitions  {len(outcomes)} confirm/cancel pairs in {elapsed:.1f}s  "
+            f"(confirm, cancel): {dict(sorted(codes.items()))}"
+        )
+
+    db = SessionLocal()
+    try:
+        lost = 0
+        for appt in db.query(models.Appointment).filter(
+            models.Appointment.id.in_(outcomes)
+        ):
+            confirm, cancel = outcomes[appt.id]
+            succeeded = (confirm == 200) + (cancel == 200)
+            if (
+                cancel == 200 and appt.status != models.AppointmentStatus.cancelled
+            ) or appt.version != 1 + succeeded:
+                lost += 1
+    finally:
+        db.close()
+    print(f"  lost updates        {lost}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--patients", type=int, default=50)
+    parser.add_argument("--slots", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=10)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
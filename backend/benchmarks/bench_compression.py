@@ -0,0 +1,184 @@
+"""
+Disk savings and CPU cost of compressing lab results before encryption.
+
+Run with: cd backend && python -m benchmarks.bench_compression [--size-mb 8 --level 3]
+
+Builds a synthetic corpus shaped like what labs upload (CSV panels, HL7 v2
+result messages, PDFs with plain and with Flate-compressed content streams,
+JPEG scans, raw DICOM-like images), then for each file compares storing it
+the old way (encrypt only) with `save_encrypted`'s policy (`should_compress`
+on the content type and first chunk, then per-chunk zstd). Reports stored
+bytes and the CPU time to encrypt and to decrypt, per file type and overall.
+"""
+
+import argparse
+import base64
+import io
+import os
+import random
+import time
+import zlib
+
+os.environ.setdefault(
+    "ENCRYPTION_KEY", base64.urlsafe_b64encode(os.urandom(32)).decode()
+)
+
+from app.utils import crypto, uploads  # noqa: E402
+
+TESTS = [
+    ("HGB", "g/dL", 11.5, 17.5),
+    ("WBC", "10*3/uL", 4.0, 11.0),
+    ("PLT", "10*3/uL", 150, 450),
+    ("GLU", "mg/dL", 70, 140),
+    ("CREA", "mg/dL", 0.6, 1.3),
+    ("ALT", "U/L", 7, 56),
+    ("TSH", "mIU/L", 0.4, 4.0),
+    ("LDL", "mg/dL", 50, 190),
+]
+
+
+def _fill(size: int, line) -> bytes:
+    out, i = io.BytesIO(), 0
+    while out.tell() < size:
+        out.write(line(i))
+        i += 1
+    return out.getvalue()[:size]
+
+
+def csv_panel(size: int, rng: random.Random) -> bytes:
+    def line(i):
+        code, unit, lo, hi = rng.choice(TESTS)
+        value = rng.uniform(lo * 0.8, hi * 1.2)
+        flag = "H" if value > hi else "L" if value < lo else "N"
+        return (
+            f"{100000 + i},P{rng.randint(1, 5000):05d},2024-{rng.randint(1, 12):02d}-"
+            f"{rng.randint(1, 28):02d},{code},{value:.2f},{unit},{lo}-{hi},{flag}\n"
+        ).encode()
+
+    return b"sample_id,patient,date,test,value,unit,range,flag\n" + _fill(size, line)
+
+
+def hl7_messages(size: int, rng: random.Random) -> bytes:
+    def line(i):
+        segments = [
+            f"MSH|^~\\&|LIS|MEDCONNECT|EHR|HOSP|2024{rng.randint(1, 12):02d}"
+            f"{rng.randint(1, 28):02d}0930||ORU^R01|MSG{i:08d}|P|2.5.1",
+            f"PID|1||P{rng.randint(1, 5000):05d}^^^MRN||DOE^JOHN||19800101|M",
+            f"OBR|1||{i:08d}|CBC^Complete blood count^L",
+        ]
+        for n, (code, unit, lo, hi) in enumerate(rng.sample(TESTS, 5), 1):
+            segments.append(
+                f"OBX|{n}|NM|{code}^{code}^L||{rng.uniform(lo, hi):.1f}|{unit}|"
+                f"{lo}-{hi}|N|||F"
+            )
+        return ("\r".join(segments) + "\r\n").encode()
+
+    return _fill(size, line)
+
+
+def _pdf_text(size: int, rng: random.Random) -> bytes:
+    def line(i):
+        code, unit, lo, hi = rng.choice(TESTS)
+        return (
+            f"BT /F1 10 Tf 72 {720 - (i % 60) * 12} Td "
+            f"({code}  {rng.uniform(lo, hi):.2f} {unit}  ref {lo}-{hi}) Tj ET\n"
+        ).encode()
+
+    return _fill(size, line)
+
+
+def pdf_plain(size: int, rng: random.Random) -> bytes:
+    return b"%PDF-1.4\n1 0 obj << /Length 0 >> stream\n" + _pdf_text(size, rng)
+
+
+def pdf_flate(size: int, rng: random.Random) -> bytes:
+    # typical generator output: each page's content stream deflated
+    out = io.BytesIO(b"%PDF-1.7\n")
+    while out.tell() < size:
+        page = zlib.compress(_pdf_text(64 * 1024, rng))
+        out.write(b"obj << /Filter /FlateDecode >> stream\n" + page + b"\nendstream\n")
+    return out.getvalue()[:size]
+
+
+def jpeg_scan(size: int, rng: random.Random) -> bytes:
+    return b"\xff\xd8\xff\xe0" + rng.randbytes(size - 4)
+
+
+def dicom_raw(size: int, rng: random.Random) -> bytes:
+    # 16-bit pixels: a smooth gradient plus sensor noise in the low bits
+    pixels = bytearray()
+    for i in range(size // 2):
+        value = ((i % 512) * 4 + rng.randint(0, 15)) & 0xFFFF
+        pixels += value.to_bytes(2, "little")
+    return b"DICM" + bytes(pixels)[: size - 4]
+
+
+CORPUS = [
+    ("csv", "text/csv", csv_panel),
+    ("hl7", "application/hl7-v2", hl7_messages),
+    ("pdf (plain streams)", "application/pdf", pdf_plain),
+    ("pdf (flate streams)", "application/pdf", pdf_flate),
+    ("jpeg scan", "image/jpeg", jpeg_scan),
+    ("dicom (raw)", "application/dicom", dicom_raw),
+]
+
+
+def encrypt(data: bytes, compress: bool, level: int) -> tuple[bytes, float]:
+    started = time.process_time()
+    encryptor = crypto.StreamEncryptor(compress=compress, level=level)
+    out = bytearray()
+    for i in range(0, len(data), crypto.CHUNK_SIZE):
+        out += encryptor.update(data[i : i + crypto.CHUNK_SIZE])
+    out += encryptor.finalize()
+    return bytes(out), time.process_time() - started
+
+
+def decrypt(blob: bytes) -> float:
+    started = time.process_time()
+    for _ in crypto.iter_decrypt(io.BytesIO(blob)):
+        pass
+    return time.process_time() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size-mb", type=int, default=8)
+    parser.add_argument("--level", type=int, default=uploads.UPLOAD_COMPRESSION_LEVEL)
+    args = parser.parse_args()
+    size = args.size_mb * 1024 * 1024
+    rng = random.Random(42)
+
+    print(
+        f"{'file':<22}{'compress':>9}{'stored':>9}{'saved':>8}"
+        f"{'enc MB/s':>18}{'dec MB/s':>18}"
+    )
+    totals = {"plain": 0, "off": 0, "auto": 0, "enc_off": 0.0, "enc_auto": 0.0}
+    for name, content_type, make in CORPUS:
+        data = make(size, rng)
+        compress = uploads.should_compress(content_type, data[: crypto.CHUNK_SIZE])
+        stored_off, enc_off = encrypt(data, False, args.level)
+        stored_auto, enc_auto = encrypt(data, compress, args.level)
+        dec_off, dec_auto = decrypt(stored_off), decrypt(stored_auto)
+        mb = len(data) / 1e6
+        totals["plain"] += len(data)
+        totals["off"] += len(stored_off)
+        totals["auto"] += len(stored_auto)
+        totals["enc_off"] += enc_off
+        totals["enc_auto"] += enc_auto
+        print(
+            f"{name:<22}{'yes' if compress else 'no':>9}"
+            f"{len(stored_auto) / len(stored_off):>8.0%}"
+            f"{1 - len(stored_auto) / len(stored_off):>8.0%}"
+            f"{mb / enc_off:>9.0f} ->{mb / enc_auto:>6.0f}"
+            f"{mb / dec_off:>9.0f} ->{mb / dec_auto:>6.0f}"
+        )
+    print(
+        f"\ncorpus {totals['plain'] / 1e6:.0f} MB: stored {totals['off'] / 1e6:.1f} MB"
+        f" -> {totals['auto'] / 1e6:.1f} MB"
+        f" ({1 - totals['auto'] / totals['off']:.0%} saved),"
+        f" encrypt CPU {totals['enc_off']:.2f}s -> {totals['enc_auto']:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Per-request cost of the rate limiter.
+
+Run with: cd backend && python -m benchmarks.bench_ratelimit [--redis redis://...]
+
+1. limiter.hit() per storage backend, single-threaded, spread over --keys
+   distinct clients.
+2. A trivial FastAPI route with and without RateLimitMiddleware, so the number
+   includes key extraction and slowapi's own bookkeeping.
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import STRATEGIES
+from slowapi import Limiter, _rate_limit_exceeded_handler
+from slowapi.errors import RateLimitExceeded
+
+from app.utils import ratelimit
+
+
+def bench_hits(uri: str, iterations: int, keys: int) -> list[float]:
+    storage = storage_from_string(uri)
+    storage.reset()
+    limiter = STRATEGIES["token-bucket"](storage)
+    item = parse("1000000/minute")
+    samples = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        limiter.hit(item, f"ip:10.0.{i % keys // 256}.{i % 256}")
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def make_app(uri: str | None) -> FastAPI:
+    app = FastAPI()
+    if uri is not None:
+        limiter = Limiter(
+            key_func=ratelimit.principal_key,
+            strategy="token-bucket",
+            storage_uri=uri,
+        )
+        app.state.limiter = limiter
+        app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+        app.add_middleware(ratelimit.RateLimitMiddleware, limits="1000000/minute")
+
+    @app.get("/ping")
+    def ping(request: Request):
+        return {"ok": True}
+
+    return app
+
+
+def bench_requests(uri: str | None, iterations: int) -> list[float]:
+    samples = []
+    # entering the client keeps one event loop thread, as under uvicorn
+    with TestClient(make_app(uri)) as client:
+        for _ in range(50):
+            client.get("/ping")
+        for _ in range(iterations):
+            started = time.perf_counter()
+            client.get("/ping")
+            samples.append(time.perf_counter() - started)
+    return samples
+
+
+def summary(samples: list[float]) -> str:
+    samples = sorted(samples)
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    return (
+        f"mean {statistics.fmean(samples) * 1e6:8.1f} us   "
+        f"p50 {samples[len(samples) // 2] * 1e6:8.1f} us   p99 {p99 * 1e6:8.1f} us"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument("--keys", type=int, default=1000)
+    parser.add_argument("--redis", help="also benchmark this redis:// URI")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        uris = ["memory://", f"sqlite:///{tmp}/ratelimit.db"]
+        if args.redis:
+            uris.append(args.redis)
+
+        print(f"limiter.hit(), {args.iterations} hits over {args.keys} keys")
+        for uri in uris:
+            name = uri.split("://")[0]
+            print(f"  {name:<8}{summary(bench_hits(uri, args.iterations, args.keys))}")
+
+        print(f"\nGET /ping through the app, {args.iterations} requests")
+        baseline = bench_requests(None, args.iterations)
+        print(f"  {'none':<8}{summary(baseline)}")
+        for uri in uris:
+            name = uri.split("://")[0]
+            samples = bench_requests(uri, args.iterations)
+            overhead = statistics.fmean(samples) - statistics.fmean(baseline)
+            print(f"  {name:<8}{summary(samples)}   (+{overhead * 1e6:.1f} us)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Serialization cost of large list responses.
+
+Run with: cd backend && python -m benchmarks.bench_serialization [--sizes 1000 10000]
+
+Serves the same in-memory appointment rows (each with its patient and doctor,
+as GET /doctors/appointments returns them) three ways and times a full request
+through FastAPI, so the database is not part of the number:
+
+  response_model  return the ORM rows, response_model=List[AppointmentOut]
+                  (the old default: pydantic validation, jsonable_encoder,
+                  stdlib json)
+  orjson          the same, rendered by ORJSONResponse
+  json_list       serialization.json_list with a prebuilt TypeAdapter
+"""
+
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+from fastapi.testclient import TestClient
+
+from app import models, schemas
+from app.utils import serialization
+
+
+def make_rows(count: int) -> list[models.Appointment]:
+    created = datetime(2024, 1, 1, 9, 0)
+    doctors = [
+        models.User(
+            id=i + 1,
+            name=f"Dr. Doctor {i}",
+            email=f"doctor{i}@example.com",
+            role=models.RoleEnum.doctor,
+            specialty="Cardiology",
+            phone="+91 98765 43210",
+            created_at=created,
+        )
+        for i in range(50)
+    ]
+    rows = []
+    for i in range(count):
+        patient = models.User(
+            id=1000 + i,
+            name=f"Patient {i}",
+            email=f"patient{i}@example.com",
+            role=models.RoleEnum.patient,
+            phone="+91 91234 56789",
+            created_at=created,
+        )
+        doctor = doctors[i % len(doctors)]
+        rows.append(
+            models.Appointment(
+                id=i + 1,
+                patient_id=patient.id,
+                doctor_id=doctor.id,
+                date=(created + timedelta(days=i % 365)).strftime("%Y-%m-%d"),
+                time_slot="10:30 AM",
+                status=models.AppointmentStatus.confirmed,
+                notes="Follow-up visit, bring previous reports.",
+                created_at=created + timedelta(minutes=i),
+                patient=patient,
+                doctor=doctor,
+            )
+        )
+    return rows
+
+
+def make_app(rows: list[models.Appointment]) -> FastAPI:
+    app = FastAPI()  # default_response_class is the stdlib JSONResponse
+    response_model = List[schemas.AppointmentOut]
+
+    @app.get("/response_model", response_model=response_model)
+    def plain():
+        return rows
+
+    @app.get("/orjson", response_model=response_model, response_class=ORJSONResponse)
+    def orjson():
+        return rows
+
+    @app.get("/json_list", response_model=response_model)
+    def json_list():
+        return serialization.json_list(schemas.AppointmentOut, rows)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        rows = make_rows(size)
+        with TestClient(make_app(rows)) as client:
+            bodies = {}
+            print(f"{size} appointments")
+            for path in ("/response_model", "/orjson", "/json_list"):
+                bodies[path] = client.get(path).json()
+                samples = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    response = client.get(path)
+                    samples.append(time.perf_counter() - started)
+                print(
+                    f"  {path[1:]:<16}{statistics.median(samples) * 1000:9.1f} ms"
+                    f"  ({len(response.content) / 1024:.0f} KiB)"
+                )
+            assert bodies["/json_list"] == bodies["/response_model"]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Concurrent large uploads: throughput and event-loop lag.
+
+Run with: cd backend && python -m benchmarks.bench_upload [--concurrency 4 --size-mb 100]
+
+Builds a throwaway SQLite database and upload directory, then sends
+--concurrency uploads of --size-mb each to POST /lab/assignments/{id}/upload
+at the same time, in-process over httpx's ASGI transport. A probe task sleeps
+for 10 ms in a loop on the same event loop; how late it wakes up is the lag
+every other request on the worker would see while the uploads run.
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import statistics
+import tempfile
+import time
+
+WORKDIR = tempfile.mkdtemp(prefix="bench_upload_")
+os.environ["DATABASE_URL"] = f"sqlite:///{WORKDIR}/bench.db"
+os.environ["UPLOAD_DIR"] = os.path.join(WORKDIR, "storage")
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+os.environ["MAX_UPLOAD_BYTES"] = str(1 << 40)
+os.environ.setdefault(
+    "ENCRYPTION_KEY", base64.urlsafe_b64encode(os.urandom(32)).decode()
+)
+
+import httpx  # noqa: E402
+
+from app import models  # noqa: E402
+from app.config.database import SessionLocal, run_migrations  # noqa: E402
+from app.main import app  # noqa: E402
+from app.utils import auth  # noqa: E402
+
+
+class RandomFile:
+    """File-like object of `size` bytes, without holding them in memory."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.pos = 0
+        self.block = os.urandom(1024 * 1024)
+
+    def read(self, n: int = -1) -> bytes:
+        n = self.size - self.pos if n < 0 else min(n, self.size - self.pos)
+        offset = self.pos % len(self.block)
+        data = self.block[offset : offset + n]
+        self.pos += len(data)
+        return data
+
+    def seek(self, pos: int, whence: int = 0) -> int:
+        self.pos = {0: pos, 1: self.pos + pos, 2: self.size + pos}[whence]
+        return self.pos
+
+    def tell(self) -> int:
+        return self.pos
+
+
+def setup(count: int) -> tuple[str, list[int]]:
+    run_migrations()
+    db = SessionLocal()
+    try:
+        users = [
+            models.User(
+                name=role.value,
+                email=f"{role.value}@bench.medconnect.com",
+                hashed_password="-",
+                role=role,
+            )
+            for role in (
+                models.RoleEnum.patient,
+                models.RoleEnum.doctor,
+                models.RoleEnum.lab,
+            )
+        ]
+        db.add_all(users)
+        db.flush()
+        patient, doctor, lab = users
+        record = models.MedicalRecord(patient_id=patient.id, summary="bench")
+        db.add(record)
+        db.flush()
+        assignments = [
+            models.LabUploadAssignment(
+                record_id=record.id,
+                patient_id=patient.id,
+                doctor_id=doctor.id,
+                lab_user_id=lab.id,
+            )
+            for _ in range(count)
+        ]
+        db.add_all(assignments)
+        db.commit()
+        token = auth.create_access_token({"sub": str(lab.id), "role": "lab"})
+        return token, [a.id for a in assignments]
+    finally:
+        db.close()
+
+
+async def probe_lag(stop: asyncio.Event, lags: list[float]) -> None:
+    interval = 0.01
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+async def run(args) -> None:
+    token, assignment_ids = setup(args.concurrency)
+    size = args.size_mb * 1024 * 1024
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport,
+        base_url="http://bench",
+        headers={"Authorization": f"Bearer {token}"},
+        timeout=None,
+    ) as client:
+
+        async def upload(assignment_id: int) -> float:
+            started = time.perf_counter()
+            resp = await client.post(
+                f"/lab/assignments/{assignment_id}/upload",
+                files={"file": ("result.bin", RandomFile(size), "application/pdf")},
+            )
+            resp.raise_for_status()
+            return time.perf_counter() - started
+
+        stop, lags = asyncio.Event(), []
+        probe = asyncio.create_task(probe_lag(stop, lags))
+        started = time.perf_counter()
+        durations = await asyncio.gather(*(upload(i) for i in assignment_ids))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await probe
+
+    total_mb = args.size_mb * args.concurrency
+    lags.sort()
+    print(f"{args.concurrency} x {args.size_mb} MB uploads in {elapsed:.1f}s")
+    print(f"  throughput        {total_mb / elapsed:8.1f} MB/s")
+    print(f"  upload time p50   {statistics.median(durations):8.1f} s")
+    print(
+        f"  event-loop lag    p50 {lags[len(lags) // 2] * 1000:.1f} ms"
+        f"   p99 {lags[int(len(lags) * 0.99)] * 1000:.1f} ms"
+        f"   max {lags[-1] * 1000:.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--size-mb", type=int, default=100)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
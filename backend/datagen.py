@@ -0,0 +1,322 @@
+"""
+Synthetic data generator: builds a realistic dataset for load testing on top of
+the demo accounts from seed.py.
+
+Run with: cd backend && python datagen.py --patients 5000 --doctors 100
+
+Generated accounts:
+   patient{N}@loadtest.medconnect.com / doctor{N}@loadtest.medconnect.com / lab{N}@loadtest.medconnect.com
+All of them share the password given by --password (default "loadtest123"),
+hashed once up front. Rows are written with bulk INSERT ... RETURNING in
+batches instead of one ORM flush per object.
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from sqlalchemy import insert
+
+import app.models as models
+import seed
+from app.config.database import SessionLocal, run_migrations
+from app.utils import audit, crypto
+from app.utils.auth import hash_password
+from app.utils.storage import get_storage
+
+TIME_SLOTS = [
+    f"{h:02d}:{m:02d} {ampm}"
+    for h, ampm in [(9, "AM"), (10, "AM"), (11, "AM"), (12, "PM")]
+    + [(h, "PM") for h in range(1, 6)]
+    for m in (0, 30)
+]
+
+AUDIT_ACTIONS = [
+    "auth.login",
+    "records.viewed",
+    "appointment.booked",
+    "appointment.confirmed",
+    "file.downloaded",
+]
+
+FIRST_NAMES = ["Aarav", "Diya", "Ishaan", "Meera", "Kabir", "Anaya", "Vivaan"]
+LAST_NAMES = ["Sharma", "Iyer", "Khan", "Patel", "Reddy", "Das", "Nair", "Rao"]
+
+
+def _name(rng: random.Random) -> str:
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def _batches(rows: list[dict], size: int):
+    for i in range(0, len(rows), size):
+        yield rows[i : i + size]
+
+
+def bulk_insert(db, model, rows: list[dict], batch_size: int) -> list[int]:
+    """INSERT rows in batches, returning the new primary keys in input order."""
+    ids: list[int] = []
+    stmt = insert(model).returning(model.id, sort_by_parameter_order=True)
+    for batch in _batches(rows, batch_size):
+        ids.extend(db.scalars(stmt, batch).all())
+    return ids
+
+
+def generate_users(db, args, rng: random.Random, hashed: str) -> dict[str, list]:
+    rows = []
+    for role, count in (
+        ("patient", args.patients),
+        ("doctor", args.doctors),
+        ("lab", args.labs),
+    ):
+        for n in range(count):
+            rows.append(
+                {
+                    "name": _name(rng),
+                    "email": f"{role}{n}@loadtest.medconnect.com",
+                    "hashed_password": hashed,
+                    "role": role,
+                    "specialty": (
+                        rng.choice(seed.SPECIALTIES) if role == "doctor" else None
+                    ),
+                    "phone": f"+91 9{rng.randrange(10**9):09d}",
+                }
+            )
+    ids = bulk_insert(db, models.User, rows, args.batch_size)
+    by_role: dict[str, list] = {"patient": [], "doctor": [], "lab": []}
+    for row, user_id in zip(rows, ids):
+        by_role[row["role"]].append(user_id)
+    return by_role
+
+
+def generate_appointments(db, args, rng, patients, doctors) -> list[dict]:
+    today = date.today()
+    taken: set[tuple] = set()
+    rows = []
+    for patient_id in patients:
+        for _ in range(args.appointments_per_patient):
+            doctor_id = rng.choice(doctors)
+            day = (today + timedelta(days=rng.randint(-180, 60))).isoformat()
+            slot = rng.choice(TIME_SLOTS)
+            if (doctor_id, day, slot) in taken:
+                continue
+            taken.add((doctor_id, day, slot))
+            rows.append(
+                {
+                    "patient_id": patient_id,
+                    "doctor_id": doctor_id,
+                    "date": day,
+                    "time_slot": slot,
+                    "status": rng.choices(
+                        list(models.AppointmentStatus), weights=[3, 6, 1]
+                    )[0],
+                    "notes": "Follow-up visit" if rng.random() < 0.5 else None,
+                }
+            )
+    for row, appt_id in zip(
+        rows, bulk_insert(db, models.Appointment, rows, args.batch_size)
+    ):
+        row["id"] = appt_id
+    return rows
+
+
+def generate_records(db, args, rng, patients, appointments) -> list[dict]:
+    rows = [{"patient_id": p, "summary": "Initial record"} for p in patients]
+    for appt in appointments:
+        if appt["status"] == models.AppointmentStatus.confirmed and rng.random() < 0.5:
+            rows.append(
+                {
+                    "patient_id": appt["patient_id"],
+                    "appointment_id": appt["id"],
+                    "summary": "Consultation summary",
+                    "_doctor_id": appt["doctor_id"],
+                }
+            )
+    ids = bulk_insert(
+        db,
+        models.MedicalRecord,
+        [{k: v for k, v in r.items() if not k.startswith("_")} for r in rows],
+        args.batch_size,
+    )
+    for row, record_id in zip(rows, ids):
+        row["id"] = record_id
+    return [r for r in rows if "_doctor_id" in r]
+
+
+def generate_reports(db, args, rng, visit_records) -> int:
+    rows = [
+        {
+            "record_id": r["id"],
+            "doctor_id": r["_doctor_id"],
+            "content": "Patient examined; vitals within normal range.",
+            "diagnosis": rng.choice(["Hypertension", "Migraine", "Healthy", None]),
+            "prescription": rng.choice(["Paracetamol 500mg", None]),
+        }
+        for r in visit_records
+        for _ in range(args.reports_per_record)
+    ]
+    bulk_insert(db, models.Report, rows, args.batch_size)
+    return len(rows)
+
+
+def generate_lab_work(db, args, rng, visit_records, labs) -> tuple[int, int]:
+    """Create lab assignments; a share of them already carry an uploaded file.
+
+    The rest stay `assigned` so the load test has something to upload to.
+    """
+    now = datetime.utcnow()
+    assignments = []
+    for r in visit_records:
+        if rng.random() >= args.lab_fraction:
+            continue
+        assignments.append(
+            {
+                "record_id": r["id"],
+                "patient_id": r["patient_id"],
+                "doctor_id": r["_doctor_id"],
+                "lab_user_id": rng.choice(labs),
+                "status": models.LabUploadAssignmentStatus.assigned,
+                "expires_at": now + timedelta(days=30),
+            }
+        )
+    uploaded = assignments[: int(len(assignments) * args.uploaded_fraction)]
+    for a in uploaded:
+        a["status"] = models.LabUploadAssignmentStatus.uploaded
+        a["consumed_at"] = now
+    ids = bulk_insert(db, models.LabUploadAssignment, assignments, args.batch_size)
+
+    storage = get_storage()
+    files = []
+    for a, assignment_id in zip(uploaded, ids):
+        payload = os.urandom(args.file_size)
+        storage_key = "/".join(
+            (
+                f"patient_{a['patient_id']}",
+                f"record_{a['record_id']}",
+                f"test_{assignment_id}",
+                str(uuid.uuid4()),
+            )
+        )
+        encryptor = crypto.StreamEncryptor()
+        with storage.open_write(storage_key) as out:
+            out.write(encryptor.update(payload))
+            out.write(encryptor.finalize())
+        files.append(
+            {
+                "assignment_id": assignment_id,
+                "record_id": a["record_id"],
+                "patient_id": a["patient_id"],
+                "uploaded_by_user_id": a["lab_user_id"],
+                "original_filename": "result.bin",
+                "content_type": "application/octet-stream",
+                "size_bytes": len(payload),
+                "storage_path": storage_key,
+                "hash_algo": "sha256",
+                "hash_hex": hashlib.sha256(payload).hexdigest(),
+            }
+        )
+    bulk_insert(db, models.TestResultFile, files, args.batch_size)
+    return len(assignments), len(files)
+
+
+def generate_audit_rows(db, args, rng, user_ids: list[int]) -> int:
+    """Append `args.audit_rows` entries that extend the existing hash chain."""
+    last = db.query(models.AuditLog).order_by(models.AuditLog.id.desc()).first()
+    prev_hash = last.row_hash if last else None
+    start = datetime.utcnow() - timedelta(seconds=args.audit_rows)
+    rows = []
+    for i in range(args.audit_rows):
+        timestamp = start + timedelta(seconds=i)
+        user_id = rng.choice(user_ids)
+        action = rng.choice(AUDIT_ACTIONS)
+        row_hash = audit._compute_hash(
+            timestamp.isoformat(), user_id, action, "user", user_id, None, prev_hash
+        )
+        rows.append(
+            {
+                "user_id": user_id,
+                "action": action,
+                "resource_type": "user",
+                "resource_id": user_id,
+                "timestamp": timestamp,
+                "prev_hash": prev_hash,
+                "row_hash": row_hash,
+            }
+        )
+        prev_hash = row_hash
+    bulk_insert(db, models.AuditLog, rows, args.batch_size)
+    return len(rows)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--doctors", type=int, default=50)
+    parser.add_argument("--labs", type=int, default=5)
+    parser.add_argument("--appointments-per-patient", type=int, default=5)
+    parser.add_argument("--reports-per-record", type=int, default=2)
+    parser.add_argument(
+        "--lab-fraction",
+        type=float,
+        default=0.3,
+        help="share of visit records that get a lab assignment",
+    )
+    parser.add_argument(
+        "--uploaded-fraction",
+        type=float,
+        default=0.5,
+        help="share of lab assignments that already have a result file",
+    )
+    parser.add_argument("--file-size", type=int, default=64 * 1024)
+    parser.add_argument("--audit-rows", type=int, default=10000)
+    parser.add_argument("--password", default="loadtest123")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    rng = random.Random(args.seed)
+    run_migrations()
+    db = SessionLocal()
+    started = time.perf_counter()
+    try:
+        seed.seed_users(db, seed.users)
+        users = generate_users(db, args, rng, hash_password(args.password))
+        appointments = generate_appointments(
+            db, args, rng, users["patient"], users["doctor"]
+        )
+        visit_records = generate_records(db, args, rng, users["patient"], appointments)
+        reports = generate_reports(db, args, rng, visit_records)
+        assignments, files = generate_lab_work(
+            db, args, rng, visit_records, users["lab"]
+        )
+        audit_rows = generate_audit_rows(
+            db, args, rng, users["patient"] + users["doctor"]
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    print(f"✅ Generated dataset in {time.perf_counter() - started:.1f}s")
+    print(f"   users:        {sum(len(v) for v in users.values())}")
+    print(f"   appointments: {len(appointments)}")
+    print(f"   records:      {len(users['patient']) + len(visit_records)}")
+    print(f"   reports:      {reports}")
+    print(f"   assignments:  {assignments} ({files} with files)")
+    print(f"   audit rows:   {audit_rows}")
+    print(f"\nLogin: patient0@loadtest.medconnect.com / {args.password}")
+
+
+if __name__ == "__main__":
+    main()
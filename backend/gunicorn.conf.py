@@ -0,0 +1,84 @@
+"""
+Production server: gunicorn managing uvicorn workers.
+
+Run with: cd backend && gunicorn -c gunicorn.conf.py app.main:app
+
+The app is imported once by the gunicorn master and the workers are forked
+from it, so they share its code pages and start in a fraction of the time an
+import takes. What cannot be shared across a fork is reset in the child: the
+database pool (each worker opens its own connections at startup, see
+warm_pool) and the SQLite connections of the cache and rate limiter.
+
+State shared by the workers:
+  rate limits, cache   the files or Redis of RATE_LIMIT_STORAGE_URI and
+                       CACHE_URL (memory:// would give each worker its own)
+  metrics              METRICS_DIR, one memory-mapped file per worker that
+                       GET /metrics adds up
+  /events              EVENTS_FANOUT=postgres; with local, a subscriber only
+                       sees the events of writes handled by its own worker
+  scheduler            one worker is elected to run the jobs
+
+Settings (environment):
+  PORT                 default 8000
+  WEB_CONCURRENCY      worker processes, default one per CPU
+  METRICS_DIR          default a directory under the system temp dir
+  GUNICORN_TIMEOUT     seconds a worker may be silent before it is restarted
+  GUNICORN_MAX_REQUESTS  recycle a worker after about this many requests,
+                       0 never
+"""
+
+import os
+import tempfile
+
+port = os.getenv("PORT", "8000")
+bind = f"0.0.0.0:{port}"
+workers = int(os.getenv("WEB_CONCURRENCY", "0")) or os.cpu_count() or 1
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+
+accesslog = "-"
+
+# read by app.utils.metrics, which is imported after this file (preload_app)
+os.environ.setdefault(
+    "METRICS_DIR", os.path.join(tempfile.gettempdir(), f"medconnect-metrics-{port}")
+)
+
+
+def on_starting(server):
+    from app.utils import metrics
+
+    # counters restart with the server, as they do with a single process
+    metrics.clear_shared_dir()
+
+    if workers > 1:
+        from app.utils import cache, events, ratelimit
+
+        for name, uri in [
+            ("RATE_LIMIT_STORAGE_URI", ratelimit.RATE_LIMIT_STORAGE_URI),
+            ("CACHE_URL", cache.CACHE_URL),
+        ]:
+            if uri.startswith("memory://"):
+                server.log.warning(
+                    "%s=%s is per worker; %d workers will not share it",
+                    name,
+                    uri,
+                    workers,
+                )
+        if events.EVENTS_FANOUT == "local":
+            server.log.warning(
+                "EVENTS_FANOUT=local: /events subscribers only see writes "
+                "handled by their own worker"
+            )
+
+
+def when_ready(server):
+    from app.main import preload
+
+    preload()
+    server.log.info("%d workers, metrics in %s", workers, os.environ["METRICS_DIR"])
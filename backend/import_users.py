@@ -0,0 +1,75 @@
+"""
+Bulk account import: creates patient, doctor and lab accounts from a file.
+
+Run with: cd backend && python import_users.py users.csv [--format ndjson]
+                                               [--workers 8] [--batch-size 500]
+
+The file is CSV with a header row, or NDJSON (one JSON object per line), with
+the fields of /auth/register: name, email, password and optionally role
+(patient, doctor or lab; default patient), specialty and phone. Patients get
+an initial medical record. Rows that are invalid or whose email is taken are
+skipped and listed at the end; rerunning an interrupted import skips the
+accounts it already created. POST /admin/users/import does the same over HTTP.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app.config.database import SessionLocal
+from app.utils import provisioning
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("path")
+    parser.add_argument(
+        "--format",
+        choices=["csv", "ndjson"],
+        help="default: from the file extension (.csv, otherwise ndjson)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=provisioning.IMPORT_HASH_WORKERS,
+        help="password hashing processes",
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=provisioning.IMPORT_BATCH_SIZE
+    )
+    args = parser.parse_args()
+    fmt = args.format or ("csv" if args.path.lower().endswith(".csv") else "ndjson")
+
+    with open(args.path, "rb") as f:
+        try:
+            rows, errors = provisioning.parse(f.read(), fmt)
+        except (UnicodeDecodeError, ValueError) as exc:
+            sys.exit(f"{args.path}: {exc}")
+
+    started = time.monotonic()
+    db = SessionLocal()
+    try:
+        for item in provisioning.import_users(
+            db, rows, errors, batch_size=args.batch_size, workers=args.workers
+        ):
+            if "errors" not in item:
+                print(
+                    f"{item['done']}/{item['total']} rows, "
+                    f"{item['created']} created, {time.monotonic() - started:.1f}s"
+                )
+    finally:
+        db.close()
+
+    for error in item["errors"]:
+        print(f"{args.path}:{error['line']}: {error['error']}", file=sys.stderr)
+    print(
+        f"created {item['created']} of {item['total']} accounts, "
+        f"skipped {item['skipped']}, in {time.monotonic() - started:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
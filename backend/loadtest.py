@@ -0,0 +1,259 @@
+"""
+Scripted load test for the main user journeys. Expects a running API with a
+dataset from datagen.py.
+
+Run with: cd backend && python loadtest.py --base-url http://localhost:8000 \\
+    --concurrency 20 --duration 60
+
+Journeys (picked at random per iteration, weighted by --mix):
+   patient: search doctors → book appointment → view records → download file
+   doctor:  list appointments → view a patient's records
+   lab:     list assignments → upload a result file
+Every virtual user logs in once at start-up (timed as "POST /auth/login") and
+then reuses its bearer token. Reports count, errors, RPS and p50/p95/p99
+latency per endpoint.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+import httpx
+
+TIME_SLOTS = [
+    f"{h:02d}:{m:02d} {ampm}"
+    for h, ampm in [(9, "AM"), (10, "AM"), (11, "AM"), (12, "PM")]
+    + [(h, "PM") for h in range(1, 6)]
+    for m in (0, 30)
+]
+
+
+class Stats:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    def record(self, name: str, seconds: float, ok: bool) -> None:
+        self.latencies[name].append(seconds)
+        if not ok:
+            self.errors[name] += 1
+
+    @staticmethod
+    def percentile(sorted_values: list[float], pct: float) -> float:
+        if not sorted_values:
+            return 0.0
+        k = max(
+            0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1)
+        )
+        return sorted_values[k]
+
+    def report(self, elapsed: float) -> str:
+        header = f"{'endpoint':<42}{'count':>8}{'err':>6}{'rps':>9}" + "".join(
+            f"{f'p{p} ms':>9}" for p in (50, 95, 99)
+        )
+        lines = [header, "-" * len(header)]
+        total = 0
+        for name in sorted(self.latencies):
+            values = sorted(self.latencies[name])
+            total += len(values)
+            lines.append(
+                f"{name:<42}{len(values):>8}{self.errors[name]:>6}"
+                f"{len(values) / elapsed:>9.1f}"
+                + "".join(
+                    f"{self.percentile(values, p) * 1000:>9.1f}" for p in (50, 95, 99)
+                )
+            )
+        lines.append("-" * len(header))
+        errors = sum(self.errors.values())
+        lines.append(f"{'total':<42}{total:>8}{errors:>6}{total / elapsed:>9.1f}")
+        return "\n".join(lines)
+
+
+class VirtualUser:
+    def __init__(
+        self, client: httpx.AsyncClient, stats: Stats, email: str, password: str
+    ):
+        self.client = client
+        self.stats = stats
+        self.email = email
+        self.password = password
+        self.headers: dict[str, str] = {}
+
+    async def call(self, name: str, method: str, url: str, ok=(200, 201), **kw):
+        started = time.perf_counter()
+        try:
+            resp = await self.client.request(method, url, headers=self.headers, **kw)
+        except httpx.HTTPError:
+            self.stats.record(name, time.perf_counter() - started, False)
+            return None
+        self.stats.record(name, time.perf_counter() - started, resp.status_code in ok)
+        return resp
+
+    async def login(self) -> bool:
+        resp = await self.call(
+            "POST /auth/login",
+            "POST",
+            "/auth/login",
+            json={"email": self.email, "password": self.password},
+        )
+        if resp is None or resp.status_code != 200:
+            return False
+        self.headers = {"Authorization": f"Bearer {resp.json()['token']}"}
+        return True
+
+
+class PatientUser(VirtualUser):
+    async def journey(self, rng: random.Random) -> None:
+        resp = await self.call(
+            "GET /patients/doctors/search",
+            "GET",
+            "/patients/doctors/search",
+            params={"specialty": rng.choice(["Cardio", "Derma", "Neuro", ""])},
+        )
+        doctors = resp.json() if resp is not None and resp.status_code == 200 else []
+        if doctors:
+            day = date.today() + timedelta(days=rng.randint(1, 90))
+            await self.call(
+                "POST /patients/appointments",
+                "POST",
+                "/patients/appointments",
+                # a taken slot is an expected outcome, not a failure
+                ok=(201, 409),
+                json={
+                    "doctor_id": rng.choice(doctors)["id"],
+                    "date": day.isoformat(),
+                    "time_slot": rng.choice(TIME_SLOTS),
+                },
+            )
+        resp = await self.call("GET /patients/records", "GET", "/patients/records")
+        records = resp.json() if resp is not None and resp.status_code == 200 else []
+        file_ids = [f["id"] for r in records for f in r.get("test_result_files", [])]
+        if file_ids:
+            await self.call(
+                "GET /files/{id}/download",
+                "GET",
+                f"/files/{rng.choice(file_ids)}/download",
+            )
+
+
+class DoctorUser(VirtualUser):
+    async def journey(self, rng: random.Random) -> None:
+        resp = await self.call(
+            "GET /doctors/appointments", "GET", "/doctors/appointments"
+        )
+        appts = resp.json() if resp is not None and resp.status_code == 200 else []
+        # records are only visible through a non-cancelled appointment
+        appts = [a for a in appts if a["status"] != "cancelled"]
+        if appts:
+            patient_id = rng.choice(appts)["patient_id"]
+            await self.call(
+                "GET /doctors/patients/{id}/records",
+                "GET",
+                f"/doctors/patients/{patient_id}/records",
+            )
+
+
+class LabUser(VirtualUser):
+    file_size = 256 * 1024
+
+    async def journey(self, rng: random.Random) -> None:
+        resp = await self.call("GET /lab/assignments", "GET", "/lab/assignments")
+        assignments = (
+            resp.json() if resp is not None and resp.status_code == 200 else []
+        )
+        open_ids = [a["id"] for a in assignments if a["status"] == "assigned"]
+        if open_ids:
+            await self.call(
+                "POST /lab/assignments/{id}/upload",
+                "POST",
+                f"/lab/assignments/{rng.choice(open_ids)}/upload",
+                # another virtual user may have taken the same assignment
+                ok=(201, 409),
+                files={
+                    "file": (
+                        "result.bin",
+                        os.urandom(self.file_size),
+                        "application/octet-stream",
+                    )
+                },
+            )
+
+
+ROLES = {"patient": PatientUser, "doctor": DoctorUser, "lab": LabUser}
+
+
+async def run(args) -> None:
+    setup_stats, stats = Stats(), Stats()
+    mix = {}
+    for part in args.mix.split(","):
+        role, weight = part.split("=")
+        mix[role] = float(weight)
+    roles = list(mix)
+    rng = random.Random(args.seed)
+    LabUser.file_size = args.upload_size
+
+    # One client per virtual user: the API sets an auth cookie on login, and a
+    # shared cookie jar would make every user act as whoever logged in last.
+    users = []
+    for _ in range(args.concurrency):
+        role = rng.choices(roles, weights=[mix[r] for r in roles])[0]
+        count = {"patient": args.patients, "doctor": args.doctors, "lab": args.labs}
+        email = f"{role}{rng.randrange(count[role])}@loadtest.medconnect.com"
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout)
+        users.append(ROLES[role](client, setup_stats, email, args.password))
+    try:
+        started = time.perf_counter()
+        logged_in = await asyncio.gather(*(u.login() for u in users))
+        setup_elapsed = time.perf_counter() - started
+        active = [u for u, ok in zip(users, logged_in) if ok]
+        if not active:
+            sys.exit("No virtual user could log in; did you run datagen.py?")
+        for user in active:
+            user.stats = stats
+
+        deadline = time.perf_counter() + args.duration
+
+        async def worker(user: VirtualUser, seed: int) -> None:
+            user_rng = random.Random(seed)
+            while time.perf_counter() < deadline:
+                await user.journey(user_rng)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(u, rng.randrange(2**32)) for u in active))
+        elapsed = time.perf_counter() - started
+    finally:
+        await asyncio.gather(*(u.client.aclose() for u in users))
+
+    print(f"Login ({len(logged_in)} concurrent, {setup_elapsed:.1f}s)\n")
+    print(setup_stats.report(setup_elapsed))
+    print(f"\nJourneys ({len(active)} virtual users, {elapsed:.1f}s)\n")
+    print(stats.report(elapsed))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="MedConnect load test")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds")
+    parser.add_argument("--mix", default="patient=6,doctor=3,lab=1")
+    parser.add_argument(
+        "--patients", type=int, default=1000, help="as given to datagen.py"
+    )
+    parser.add_argument(
+        "--doctors", type=int, default=50, help="as given to datagen.py"
+    )
+    parser.add_argument("--labs", type=int, default=5, help="as given to datagen.py")
+    parser.add_argument("--password", default="loadtest123")
+    parser.add_argument("--upload-size", type=int, default=256 * 1024)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
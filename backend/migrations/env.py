@@ -0,0 +1,48 @@
+from logging.config import fileConfig
+
+from alembic import context
+
+from app.config.database import DATABASE_URL, engine
+from app.models import Base
+
+config = context.config
+# Skip logging setup when invoked from the app (DB_AUTO_MIGRATE) so the
+# server's own log configuration is left alone.
+if config.config_file_name is not None and config.attributes.get(
+    "configure_logger", True
+):
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+# SQLite cannot ALTER most things in place; batch mode rebuilds the table.
+render_as_batch = DATABASE_URL.startswith("sqlite")
+
+
+def run_migrations_offline() -> None:
+    context.configure(
+        url=DATABASE_URL,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        render_as_batch=render_as_batch,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    with engine.connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            render_as_batch=render_as_batch,
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
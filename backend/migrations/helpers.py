@@ -0,0 +1,38 @@
+"""Shared helpers for migration scripts."""
+
+from alembic import op
+
+
+def _is_postgres() -> bool:
+    return op.get_bind().dialect.name == "postgresql"
+
+
+def create_index_online(name: str, table: str, columns: list[str], **kw) -> None:
+    """Create an index without blocking writes.
+
+    PostgreSQL refuses ``CREATE INDEX CONCURRENTLY`` inside a transaction, so
+    the statement runs in an autocommit block. Other backends (SQLite in dev)
+    get a plain ``CREATE INDEX``.
+    """
+    if _is_postgres():
+        with op.get_context().autocommit_block():
+            op.create_index(
+                name,
+                table,
+                columns,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+                **kw,
+            )
+    else:
+        op.create_index(name, table, columns, **kw)
+
+
+def drop_index_online(name: str, table: str) -> None:
+    if _is_postgres():
+        with op.get_context().autocommit_block():
+            op.drop_index(
+                name, table_name=table, postgresql_concurrently=True, if_exists=True
+            )
+    else:
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,293 @@
+"""initial schema
+
+Mirrors the tables previously created by ``Base.metadata.create_all``.
+Existing databases created that way should be stamped rather than upgraded:
+``alembic stamp 0001``.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("email", sa.String(), nullable=False),
+        sa.Column("hashed_password", sa.String(), nullable=False),
+        sa.Column(
+            "role",
+            sa.Enum("patient", "doctor", "lab", "admin", name="roleenum"),
+            nullable=False,
+        ),
+        sa.Column("specialty", sa.String(), nullable=True),
+        sa.Column("phone", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+    op.create_index("ix_users_id", "users", ["id"], unique=False)
+
+    op.create_table(
+        "appointments",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("patient_id", sa.Integer(), nullable=False),
+        sa.Column("doctor_id", sa.Integer(), nullable=False),
+        sa.Column("date", sa.String(), nullable=False),
+        sa.Column("time_slot", sa.String(), nullable=False),
+        sa.Column(
+            "status",
+            sa.Enum("pending", "confirmed", "cancelled", name="appointmentstatus"),
+            nullable=True,
+        ),
+        sa.Column("notes", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["doctor_id"],
+            ["users.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["patient_id"],
+            ["users.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_appointments_id", "appointments", ["id"], unique=False)
+
+    op.create_table(
+        "audit_logs",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("action", sa.String(), nullable=False),
+        sa.Column("resource_type", sa.String(), nullable=True),
+        sa.Column("resource_id", sa.Integer(), nullable=True),
+        sa.Column("details", sa.Text(), nullable=True),
+        sa.Column("ip_address", sa.String(), nullable=True),
+        sa.Column("user_agent", sa.String(), nullable=True),
+        sa.Column("timestamp", sa.DateTime(), nullable=False),
+        sa.Column("prev_hash", sa.String(), nullable=True),
+        sa.Column("row_hash", sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["user_id"],
+            ["users.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_audit_logs_action", "audit_logs", ["action"], unique=False)
+    op.create_index("ix_audit_logs_id", "audit_logs", ["id"], unique=False)
+    op.create_index("ix_audit_logs_row_hash", "audit_logs", ["row_hash"], unique=False)
+    op.create_index(
+        "ix_audit_logs_timestamp", "audit_logs", ["timestamp"], unique=False
+    )
+    op.create_index("ix_audit_logs_user_id", "audit_logs", ["user_id"], unique=False)
+
+    op.create_table(
+        "medical_records",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("patient_id", sa.Integer(), nullable=False),
+        sa.Column("appointment_id", sa.Integer(), nullable=True),
+        sa.Column("summary", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["appointment_id"],
+            ["appointments.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["patient_id"],
+            ["users.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("appointment_id"),
+    )
+    op.create_index("ix_medical_records_id", "medical_records", ["id"], unique=False)
+
+    op.create_table(
+        "lab_upload_assignments",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("record_id", sa.Integer(), nullable=False),
+        sa.Column("patient_id", sa.Integer(), nullable=False),
+        sa.Column("doctor_id", sa.Integer(), nullable=False),
+        sa.Column("lab_user_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "status",
+            sa.Enum(
+                "assigned",
+                "uploaded",
+                "cancelled",
+                "expired",
+                name="labuploadassignmentstatus",
+            ),
+            nullable=False,
+        ),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("expires_at", sa.DateTime(), nullable=True),
+        sa.Column("consumed_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["doctor_id"],
+            ["users.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["lab_user_id"],
+            ["users.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["patient_id"],
+            ["users.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["record_id"],
+            ["medical_records.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_lab_upload_assignments_doctor_id",
+        "lab_upload_assignments",
+        ["doctor_id"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_lab_upload_assignments_id", "lab_upload_assignments", ["id"], unique=False
+    )
+    op.create_index(
+        "ix_lab_upload_assignments_lab_user_id",
+        "lab_upload_assignments",
+        ["lab_user_id"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_lab_upload_assignments_patient_id",
+        "lab_upload_assignments",
+        ["patient_id"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_lab_upload_assignments_record_id",
+        "lab_upload_assignments",
+        ["record_id"],
+        unique=False,
+    )
+
+    op.create_table(
+        "reports",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("record_id", sa.Integer(), nullable=False),
+        sa.Column("doctor_id", sa.Integer(), nullable=False),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("diagnosis", sa.Text(), nullable=True),
+        sa.Column("prescription", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["doctor_id"],
+            ["users.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["record_id"],
+            ["medical_records.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_reports_id", "reports", ["id"], unique=False)
+
+    op.create_table(
+        "test_result_files",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("assignment_id", sa.Integer(), nullable=False),
+        sa.Column("record_id", sa.Integer(), nullable=False),
+        sa.Column("patient_id", sa.Integer(), nullable=False),
+        sa.Column("uploaded_by_user_id", sa.Integer(), nullable=False),
+        sa.Column("original_filename", sa.String(), nullable=False),
+        sa.Column("content_type", sa.String(), nullable=True),
+        sa.Column("size_bytes", sa.Integer(), nullable=False),
+        sa.Column("storage_path", sa.String(), nullable=False),
+        sa.Column("hash_algo", sa.String(), nullable=False),
+        sa.Column("hash_hex", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["assignment_id"],
+            ["lab_upload_assignments.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["patient_id"],
+            ["users.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["record_id"],
+            ["medical_records.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["uploaded_by_user_id"],
+            ["users.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("assignment_id"),
+    )
+    op.create_index(
+        "ix_test_result_files_id", "test_result_files", ["id"], unique=False
+    )
+    op.create_index(
+        "ix_test_result_files_patient_id",
+        "test_result_files",
+        ["patient_id"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_test_result_files_record_id",
+        "test_result_files",
+        ["record_id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_test_result_files_record_id", table_name="test_result_files")
+    op.drop_index("ix_test_result_files_patient_id", table_name="test_result_files")
+    op.drop_index("ix_test_result_files_id", table_name="test_result_files")
+
+    op.drop_table("test_result_files")
+    op.drop_index("ix_reports_id", table_name="reports")
+
+    op.drop_table("reports")
+    op.drop_index(
+        "ix_lab_upload_assignments_record_id", table_name="lab_upload_assignments"
+    )
+    op.drop_index(
+        "ix_lab_upload_assignments_patient_id", table_name="lab_upload_assignments"
+    )
+    op.drop_index(
+        "ix_lab_upload_assignments_lab_user_id", table_name="lab_upload_assignments"
+    )
+    op.drop_index("ix_lab_upload_assignments_id", table_name="lab_upload_assignments")
+    op.drop_index(
+        "ix_lab_upload_assignments_doctor_id", table_name="lab_upload_assignments"
+    )
+
+    op.drop_table("lab_upload_assignments")
+    op.drop_index("ix_medical_records_id", table_name="medical_records")
+
+    op.drop_table("medical_records")
+    op.drop_index("ix_audit_logs_user_id", table_name="audit_logs")
+    op.drop_index("ix_audit_logs_timestamp", table_name="audit_logs")
+    op.drop_index("ix_audit_logs_row_hash", table_name="audit_logs")
+    op.drop_index("ix_audit_logs_id", table_name="audit_logs")
+    op.drop_index("ix_audit_logs_action", table_name="audit_logs")
+
+    op.drop_table("audit_logs")
+    op.drop_index("ix_appointments_id", table_name="appointments")
+
+    op.drop_table("appointments")
+    op.drop_index("ix_users_id", table_name="users")
+    op.drop_index("ix_users_email", table_name="users")
+
+    op.drop_table("users")
@@ -0,0 +1,35 @@
+"""hot path indexes
+
+Indexes for the doctor/patient lookups the routers run on every request.
+On PostgreSQL they are built with ``CREATE INDEX CONCURRENTLY`` outside the
+migration transaction so the tables stay writable while the index builds.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 00:00:00
+"""
+
+from migrations.helpers import create_index_online, drop_index_online
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    create_index_online(
+        "ix_appointments_doctor_id_date", "appointments", ["doctor_id", "date"]
+    )
+    create_index_online("ix_appointments_patient_id", "appointments", ["patient_id"])
+    create_index_online(
+        "ix_medical_records_patient_id", "medical_records", ["patient_id"]
+    )
+    create_index_online("ix_reports_record_id", "reports", ["record_id"])
+
+
+def downgrade() -> None:
+    drop_index_online("ix_reports_record_id", "reports")
+    drop_index_online("ix_medical_records_patient_id", "medical_records")
+    drop_index_online("ix_appointments_patient_id", "appointments")
+    drop_index_online("ix_appointments_doctor_id_date", "appointments")
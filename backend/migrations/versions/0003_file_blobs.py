@@ -0,0 +1,66 @@
+"""file blobs
+
+Content-addressed storage for test result files: one encrypted blob per
+distinct plaintext, with its data key wrapped per patient in blob_keys.
+Existing files keep their own storage_path and a NULL blob_id.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 00:00:00
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+from migrations.helpers import create_index_online, drop_index_online
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "file_blobs",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("sha256", sa.String(length=64), nullable=False),
+        sa.Column("size_bytes", sa.Integer(), nullable=False),
+        sa.Column("storage_path", sa.String(), nullable=False),
+        sa.Column("ref_count", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("sha256"),
+    )
+    op.create_index("ix_file_blobs_id", "file_blobs", ["id"], unique=False)
+
+    op.create_table(
+        "blob_keys",
+        sa.Column("blob_id", sa.Integer(), nullable=False),
+        sa.Column("patient_id", sa.Integer(), nullable=False),
+        sa.Column("wrapped_key", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["blob_id"], ["file_blobs.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["patient_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("blob_id", "patient_id"),
+    )
+
+    with op.batch_alter_table("test_result_files") as batch_op:
+        batch_op.add_column(sa.Column("blob_id", sa.Integer(), nullable=True))
+        batch_op.create_foreign_key(
+            "fk_test_result_files_blob_id", "file_blobs", ["blob_id"], ["id"]
+        )
+    create_index_online(
+        "ix_test_result_files_blob_id", "test_result_files", ["blob_id"]
+    )
+
+
+def downgrade() -> None:
+    drop_index_online("ix_test_result_files_blob_id", "test_result_files")
+    with op.batch_alter_table("test_result_files") as batch_op:
+        batch_op.drop_constraint("fk_test_result_files_blob_id", type_="foreignkey")
+        batch_op.drop_column("blob_id")
+    op.drop_table("blob_keys")
+    op.drop_index("ix_file_blobs_id", table_name="file_blobs")
+    op.drop_table("file_blobs")
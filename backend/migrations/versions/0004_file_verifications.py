@@ -0,0 +1,39 @@
+"""file verifications
+
+Results of the last full integrity check of each stored file, used to skip
+rehashing on download and to drive the scrubber.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 00:00:00
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "file_verifications",
+        sa.Column("storage_path", sa.String(), nullable=False),
+        sa.Column("version", sa.String(), nullable=False),
+        sa.Column("ok", sa.Boolean(), nullable=False),
+        sa.Column("verified_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("storage_path"),
+    )
+    op.create_index(
+        "ix_file_verifications_verified_at",
+        "file_verifications",
+        ["verified_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_file_verifications_verified_at", table_name="file_verifications")
+    op.drop_table("file_verifications")
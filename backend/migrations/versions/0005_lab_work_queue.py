@@ -0,0 +1,63 @@
+"""lab work queue
+
+Priority, due date and a claim lease on lab upload assignments, and
+assignments open to every lab user (lab_user_id NULL), dispatched through
+the work queue.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 00:00:00
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+from migrations.helpers import create_index_online, drop_index_online
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("lab_upload_assignments") as batch_op:
+        batch_op.alter_column("lab_user_id", existing_type=sa.Integer(), nullable=True)
+        batch_op.add_column(
+            sa.Column("priority", sa.Integer(), server_default="0", nullable=False)
+        )
+        batch_op.add_column(sa.Column("due_at", sa.DateTime(), nullable=True))
+        batch_op.add_column(
+            sa.Column("claimed_by_user_id", sa.Integer(), nullable=True)
+        )
+        batch_op.add_column(sa.Column("lease_expires_at", sa.DateTime(), nullable=True))
+        batch_op.create_foreign_key(
+            "fk_lab_upload_assignments_claimed_by_user_id",
+            "users",
+            ["claimed_by_user_id"],
+            ["id"],
+        )
+    create_index_online(
+        "ix_lab_upload_assignments_queue",
+        "lab_upload_assignments",
+        ["status", "priority", "due_at", "created_at"],
+    )
+
+
+def downgrade() -> None:
+    drop_index_online("ix_lab_upload_assignments_queue", "lab_upload_assignments")
+    # open assignments go to whoever claimed them; unclaimed ones block the
+    # downgrade until they are assigned or removed
+    op.execute(
+        "UPDATE lab_upload_assignments SET lab_user_id = claimed_by_user_id "
+        "WHERE lab_user_id IS NULL"
+    )
+    with op.batch_alter_table("lab_upload_assignments") as batch_op:
+        batch_op.drop_constraint(
+            "fk_lab_upload_assignments_claimed_by_user_id", type_="foreignkey"
+        )
+        batch_op.drop_column("lease_expires_at")
+        batch_op.drop_column("claimed_by_user_id")
+        batch_op.drop_column("due_at")
+        batch_op.drop_column("priority")
+        batch_op.alter_column("lab_user_id", existing_type=sa.Integer(), nullable=False)
@@ -0,0 +1,59 @@
+"""sync versions
+
+Per-user list version counters and updated_at columns on appointments and
+lab upload assignments, for ETag and `updated_since` delta sync. Existing
+rows get updated_at = created_at.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 00:00:00
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+from migrations.helpers import create_index_online, drop_index_online
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "users",
+        sa.Column("sync_version", sa.Integer(), server_default="0", nullable=False),
+    )
+    for table in ("appointments", "lab_upload_assignments"):
+        op.add_column(table, sa.Column("updated_at", sa.DateTime(), nullable=True))
+        op.execute(f"UPDATE {table} SET updated_at = created_at")
+
+    create_index_online(
+        "ix_appointments_patient_id_updated_at",
+        "appointments",
+        ["patient_id", "updated_at"],
+    )
+    create_index_online(
+        "ix_appointments_doctor_id_updated_at",
+        "appointments",
+        ["doctor_id", "updated_at"],
+    )
+    create_index_online(
+        "ix_lab_upload_assignments_lab_user_id_updated_at",
+        "lab_upload_assignments",
+        ["lab_user_id", "updated_at"],
+    )
+
+
+def downgrade() -> None:
+    drop_index_online(
+        "ix_lab_upload_assignments_lab_user_id_updated_at", "lab_upload_assignments"
+    )
+    drop_index_online("ix_appointments_doctor_id_updated_at", "appointments")
+    drop_index_online("ix_appointments_patient_id_updated_at", "appointments")
+    for table in ("lab_upload_assignments", "appointments"):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column("updated_at")
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.drop_column("sync_version")
@@ -0,0 +1,50 @@
+"""appointment versions
+
+A version column on appointments for optimistic concurrency, and a partial
+unique index allowing one appointment that is not cancelled per doctor, date
+and slot. Double bookings that slipped through the old check are resolved
+first: all but the earliest booking of a slot are cancelled.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19 00:00:00
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+from migrations.helpers import create_index_online, drop_index_online
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+LIVE = "status != 'cancelled'"
+
+
+def upgrade() -> None:
+    op.add_column(
+        "appointments",
+        sa.Column("version", sa.Integer(), server_default="1", nullable=False),
+    )
+    op.execute(
+        "UPDATE appointments SET status = 'cancelled', version = version + 1 "
+        f"WHERE {LIVE} AND id NOT IN ("
+        "SELECT min(id) FROM appointments "
+        f"WHERE {LIVE} GROUP BY doctor_id, date, time_slot)"
+    )
+    create_index_online(
+        "uq_appointments_doctor_id_date_time_slot",
+        "appointments",
+        ["doctor_id", "date", "time_slot"],
+        unique=True,
+        postgresql_where=sa.text(LIVE),
+        sqlite_where=sa.text(LIVE),
+    )
+
+
+def downgrade() -> None:
+    drop_index_online("uq_appointments_doctor_id_date_time_slot", "appointments")
+    with op.batch_alter_table("appointments") as batch_op:
+        batch_op.drop_column("version")
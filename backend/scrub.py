@@ -0,0 +1,55 @@
+"""
+Integrity scrubber: re-verifies stored lab result files in the background.
+
+Run with: cd backend && python scrub.py [--bytes-per-sec 8388608] [--interval 3600] [--once]
+
+Each pass decrypts and hashes every file not verified within
+VERIFY_MAX_AGE_HOURS, least recently verified first, reading at most
+--bytes-per-sec so it does not compete with downloads for disk or bucket
+bandwidth. Results go to file_verifications; failures are logged.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app.config.database import SessionLocal
+from app.utils import integrity
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--bytes-per-sec", type=int, default=integrity.SCRUB_BYTES_PER_SEC
+    )
+    parser.add_argument(
+        "--interval", type=float, default=3600, help="seconds between passes"
+    )
+    parser.add_argument("--once", action="store_true", help="run a single pass")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    while True:
+        started = time.monotonic()
+        db = SessionLocal()
+        try:
+            checked, failed = integrity.scrub(db, args.bytes_per_sec)
+        finally:
+            db.close()
+        logging.info(
+            "scrubbed %d files in %.1fs, %d failed",
+            checked,
+            time.monotonic() - started,
+            failed,
+        )
+        if args.once:
+            return
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
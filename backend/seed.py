@@ -9,13 +9,9 @@ import sys
 sys.path.insert(0, os.path.dirname(__file__))
 
 import app.models as models
-from app.config.database import SessionLocal, engine
+from app.config.database import SessionLocal, run_migrations
 from app.utils.auth import hash_password
 
-# Create tables
-models.Base.metadata.create_all(bind=engine)
-db = SessionLocal()
-
 SPECIALTIES = [
     "General Practitioner",
     "Dentist",
@@ -99,38 +95,67 @@ for i, specialty in enumerate(SPECIALTIES):
         }
     )
 
-# Insert users if not exists
-for u in users:
-    existing = db.query(models.User).filter(models.User.email == u["email"]).first()
-
-    if not existing:
-        user = models.User(
-            name=u["name"],
-            email=u["email"],
-            hashed_password=hash_password(u["password"]),
-            role=u["role"],
-            specialty=u.get("specialty"),
-            phone=u.get("phone"),
+
+def seed_users(db, users: list[dict]) -> int:
+    """Insert `users` that don't exist yet; returns how many were created.
+
+    Existing emails are fetched with one query and each distinct password is
+    hashed once, so the cost no longer grows with a bcrypt round per user.
+    """
+    emails = [u["email"] for u in users]
+    existing = {
+        email
+        for (email,) in db.query(models.User.email).filter(
+            models.User.email.in_(emails)
         )
+    }
+    hashes: dict[str, str] = {}
+    created = 0
+    for u in users:
+        if u["email"] in existing:
+            continue
+        if u["password"] not in hashes:
+            hashes[u["password"]] = hash_password(u["password"])
+        db.add(
+            models.User(
+                name=u["name"],
+                email=u["email"],
+                hashed_password=hashes[u["password"]],
+                role=u["role"],
+                specialty=u.get("specialty"),
+                phone=u.get("phone"),
+            )
+        )
+        created += 1
+    db.commit()
+    return created
+
+
+def main() -> None:
+    # Bring the schema up to date
+    run_migrations()
+    db = SessionLocal()
+    try:
+        seed_users(db, users)
+    finally:
+        db.close()
 
-        db.add(user)
-        db.flush()
+    print("✅ Seed data created successfully!")
+    print("\nAdmin Login:")
+    print("   admin@medconnect.com / admin123")
 
-db.commit()
-db.close()
+    print("\nDoctor Login:")
+    print("   doctor1@medconnect.com / doctor123")
+    print("   ...")
+    print("   doctor15@medconnect.com / doctor123")
 
-print("✅ Seed data created successfully!")
-print("\nAdmin Login:")
-print("   admin@medconnect.com / admin123")
+    print("\nLab Login:")
+    print("   lab@medconnect.com / lab123")
 
-print("\nDoctor Login:")
-print("   doctor1@medconnect.com / doctor123")
-print("   ...")
-print("   doctor15@medconnect.com / doctor123")
+    print("\nPatient Login:")
+    print("   ravi@medconnect.com / patient123")
+    print("   anita@medconnect.com / patient123")
 
-print("\nLab Login:")
-print("   lab@medconnect.com / lab123")
 
-print("\nPatient Login:")
-print("   ravi@medconnect.com / patient123")
-print("   anita@medconnect.com / patient123")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmarks of the hot paths, with pytest-benchmark.
+
+With the rest of the suite each runs once, as a plain test. Timed runs
+compare against a saved baseline and fail when a median is more than 20%
+slower (the threshold is in pytest.ini):
+
+    python -m pytest tests/benchmarks --benchmark-enable --benchmark-save=baseline
+    ... change ...
+    python -m pytest tests/benchmarks --benchmark-enable --benchmark-compare
+
+Baselines are only comparable on the machine that recorded them.
+"""
+
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from app import models
+from app.utils import audit, auth
+
+SUMMARY = "Blood pressure 120/80, fasting glucose normal; review in 6 weeks. " * 16
+UPLOAD_BYTES = 256 * 1024
+
+
+def test_audit_log(benchmark, db, make_user):
+    user = make_user()
+
+    def log_and_commit():
+        audit.log(
+            db,
+            "record.viewed",
+            user_id=user.id,
+            resource_type="medical_record",
+            resource_id=1,
+            details="benchmark",
+        )
+        db.commit()
+
+    benchmark(log_and_commit)
+
+
+def test_encrypted_text_encrypt(benchmark):
+    column = models.EncryptedText()
+    benchmark(column.process_bind_param, SUMMARY, None)
+
+
+def test_encrypted_text_decrypt(benchmark):
+    column = models.EncryptedText()
+    stored = column.process_bind_param(SUMMARY, None)
+    assert benchmark(column.process_result_value, stored, None) == SUMMARY
+
+
+def test_get_current_user(benchmark, db, make_user, headers):
+    user = make_user()
+    authorization = headers(user)["Authorization"]
+    assert benchmark(auth.get_current_user, None, authorization, db) is user
+
+
+@pytest.fixture
+def lab_work(db, make_user, headers):
+    doctor, patient, lab = make_user("doctor"), make_user("patient"), make_user("lab")
+    record = models.MedicalRecord(patient_id=patient.id, summary="Initial record")
+    db.add(record)
+    db.commit()
+
+    def assignment() -> int:
+        item = models.LabUploadAssignment(
+            record_id=record.id,
+            patient_id=patient.id,
+            doctor_id=doctor.id,
+            lab_user_id=lab.id,
+        )
+        db.add(item)
+        db.commit()
+        return item.id
+
+    return SimpleNamespace(
+        assignment=assignment, lab=headers(lab), patient=headers(patient)
+    )
+
+
+def upload(client, lab_work, assignment_id: int, data: bytes) -> dict:
+    response = client.post(
+        f"/lab/assignments/{assignment_id}/upload",
+        files={"file": ("result.pdf", data, "application/pdf")},
+        headers=lab_work.lab,
+    )
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+def test_upload(benchmark, client, lab_work):
+    def new_upload():
+        return (client, lab_work, lab_work.assignment(), os.urandom(UPLOAD_BYTES)), {}
+
+    benchmark.pedantic(upload, setup=new_upload, rounds=20, warmup_rounds=2)
+
+
+def test_download(benchmark, client, lab_work):
+    data = os.urandom(UPLOAD_BYTES)
+    file_id = upload(client, lab_work, lab_work.assignment(), data)["id"]
+
+    def download():
+        response = client.get(f"/files/{file_id}/download", headers=lab_work.patient)
+        assert response.status_code == 200
+        return response.content
+
+    assert benchmark(download) == data
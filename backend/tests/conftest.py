@@ -0,0 +1,137 @@
+"""
+Shared fixtures.
+
+Each test process (each pytest-xdist worker included) gets a temporary
+directory with its own SQLite database, migrated once. Every test then runs
+in a transaction on a single connection that is rolled back when the test
+ends: the app's sessions, get_db's as well as those opened outside requests,
+join it as savepoints, so their commits and rollbacks behave as usual and
+nothing outlives the test. No test creates tables.
+
+Passwords are hashed at bcrypt's minimum cost, and the cache, rate limits
+and scheduler are off.
+"""
+
+import base64
+import itertools
+import os
+import shutil
+import tempfile
+
+WORKDIR = tempfile.mkdtemp(prefix="medconnect-tests-")
+
+# the app reads its settings when imported, so they are set first
+os.environ.update(
+    {
+        "DATABASE_URL": f"sqlite:///{WORKDIR}/test.db",
+        "DB_AUTO_MIGRATE": "false",
+        "ENCRYPTION_KEY": base64.urlsafe_b64encode(os.urandom(32)).decode(),
+        "SECRET_KEY": "test-secret",
+        "BCRYPT_ROUNDS": "4",
+        "STORAGE_BACKEND": "local",
+        "UPLOAD_DIR": os.path.join(WORKDIR, "storage"),
+        "CACHE_ENABLED": "false",
+        "CACHE_URL": "memory://",
+        "RATE_LIMIT_ENABLED": "false",
+        "RATE_LIMIT_STORAGE_URI": "memory://",
+        "SCHEDULER_ENABLED": "false",
+        "METRICS_DIR": "",
+    }
+)
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from app import models  # noqa: E402
+from app.config.database import SessionLocal, engine, run_migrations  # noqa: E402
+from app.main import app  # noqa: E402
+from app.utils import auth  # noqa: E402
+
+PASSWORD = "password123"
+
+
+# pysqlite starts transactions itself, late and without savepoint support;
+# let SQLAlchemy emit BEGIN so the per-test transaction holds everything
+@event.listens_for(engine, "connect")
+def _sqlite_autocommit(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+
+
+@event.listens_for(engine, "begin")
+def _sqlite_begin(conn):
+    conn.exec_driver_sql("BEGIN")
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def schema():
+    run_migrations()
+
+
+@pytest.fixture
+def connection(schema):
+    """The connection every session of the test uses, rolled back at the end."""
+    conn = engine.connect()
+    transaction = conn.begin()
+    SessionLocal.configure(bind=conn, join_transaction_mode="create_savepoint")
+    try:
+        yield conn
+    finally:
+        SessionLocal.configure(
+            bind=engine, join_transaction_mode="conservative_savepoint"
+        )
+        transaction.rollback()
+        conn.close()
+
+
+@pytest.fixture
+def db(connection):
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def client(connection):
+    """A client for the app; its startup (schema check, warm-up) is skipped."""
+    return TestClient(app)
+
+
+_emails = itertools.count()
+
+
+@pytest.fixture
+def make_user(db):
+    """Create a user with password PASSWORD: make_user("doctor", name=...)."""
+
+    def make(role: str = "patient", **fields) -> models.User:
+        n = next(_emails)
+        user = models.User(
+            name=fields.pop("name", f"{role} {n}"),
+            email=fields.pop("email", f"{role}{n}@tests.medconnect.com"),
+            hashed_password=auth.hash_password(PASSWORD),
+            role=models.RoleEnum(role),
+            **fields,
+        )
+        db.add(user)
+        db.commit()
+        return user
+
+    return make
+
+
+@pytest.fixture
+def headers():
+    """Authorization headers for a user: headers(user)."""
+
+    def make(user: models.User) -> dict[str, str]:
+        token = auth.create_access_token({"sub": str(user.id), "role": user.role.value})
+        return {"Authorization": f"Bearer {token}"}
+
+    return make
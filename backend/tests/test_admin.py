@@ -0,0 +1,34 @@
+import orjson
+import pytest
+
+from app.utils import provisioning
+
+from conftest import PASSWORD
+
+CSV = b"name,email,password\n" + b"".join(
+    f"Imported {n},imported{n}@tests.medconnect.com,{PASSWORD}\n".encode()
+    for n in range(3)
+)
+
+
+@pytest.fixture
+def admin_headers(make_user, headers):
+    return {**headers(make_user("admin")), "Content-Type": "text/csv"}
+
+
+def test_import_users(client, admin_headers):
+    response = client.post("/admin/users/import", content=CSV, headers=admin_headers)
+    assert response.status_code == 200
+    *_, summary = map(orjson.loads, response.text.splitlines())
+    assert summary["created"] == 3
+
+
+def test_import_refuses_large_bodies(client, admin_headers, monkeypatch):
+    monkeypatch.setattr(provisioning, "IMPORT_MAX_BYTES", len(CSV) - 1)
+    response = client.post("/admin/users/import", content=CSV, headers=admin_headers)
+    assert response.status_code == 413
+
+    # without a Content-Length, reading stops once the limit is passed
+    chunks = iter([CSV[:10], CSV[10:]])
+    response = client.post("/admin/users/import", content=chunks, headers=admin_headers)
+    assert response.status_code == 413
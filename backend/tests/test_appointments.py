@@ -0,0 +1,64 @@
+import pytest
+
+from app import models
+
+
+@pytest.fixture
+def booking(client, make_user, headers):
+    doctor, patient = make_user("doctor"), make_user("patient")
+
+    def book(who=patient, **fields):
+        payload = {
+            "doctor_id": doctor.id,
+            "date": "2030-01-02",
+            "time_slot": "09:00 AM",
+        }
+        return client.post(
+            "/patients/appointments", json={**payload, **fields}, headers=headers(who)
+        )
+
+    book.doctor, book.patient = doctor, patient
+    return book
+
+
+def test_book(booking):
+    response = booking()
+    assert response.status_code == 201
+    assert response.json()["status"] == "pending"
+    assert response.json()["version"] == 1
+
+
+def test_slot_taken(booking, make_user):
+    assert booking().status_code == 201
+    response = booking(make_user("patient"))
+    assert response.status_code == 409
+
+
+def test_cancelled_slot_can_be_rebooked(client, booking, headers):
+    appt = booking().json()
+    response = client.patch(
+        f"/patients/appointments/{appt['id']}/cancel", headers=headers(booking.patient)
+    )
+    assert response.json()["status"] == "cancelled"
+    assert booking().status_code == 201
+
+
+def test_transition_conflicts(client, db, booking, headers):
+    appt = booking().json()
+    confirm = f"/doctors/appointments/{appt['id']}/confirm"
+    response = client.patch(confirm, headers=headers(booking.doctor))
+    assert response.json()["version"] == 2
+
+    response = client.patch(confirm, headers=headers(booking.doctor))
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Appointment is already confirmed"
+
+    response = client.patch(
+        f"/patients/appointments/{appt['id']}/cancel",
+        params={"version": 1},
+        headers=headers(booking.patient),
+    )
+    assert response.status_code == 409
+    assert db.get(models.Appointment, appt["id"]).status == (
+        models.AppointmentStatus.confirmed
+    )
@@ -0,0 +1,39 @@
+from sqlalchemy.orm import Session
+
+from app import models
+from app.utils import audit
+
+
+def test_failed_login_is_audited(client, db, make_user):
+    user = make_user()
+    response = client.post(
+        "/auth/login", json={"email": user.email, "password": "not-the-password"}
+    )
+    assert response.status_code == 401
+    entry = db.query(models.AuditLog).filter_by(action="auth.login_failed").one()
+    assert entry.details == f"email={user.email}"
+    assert entry.row_hash is not None
+
+
+def test_entries_are_chained(db, make_user):
+    user = make_user()
+    audit.log(db, "record.viewed", user_id=user.id)
+    audit.log(db, "record.viewed", user_id=user.id, commit=True)
+    first, second = db.query(models.AuditLog).order_by(models.AuditLog.id).all()[-2:]
+    assert second.prev_hash == first.row_hash
+    assert audit.verify_chain(db) == (True, None)
+
+
+def test_any_session_chains_its_entries(connection):
+    # not from SessionLocal, so none of its listeners apply
+    session = Session(bind=connection, join_transaction_mode="create_savepoint")
+    entry = audit.log(session, "admin.maintenance", commit=True)
+    assert entry.id is not None and entry.row_hash is not None
+    session.close()
+
+
+def test_rolled_back_entries_are_dropped(db):
+    audit.log(db, "record.viewed")
+    db.rollback()
+    db.commit()
+    assert db.query(models.AuditLog).filter_by(action="record.viewed").count() == 0
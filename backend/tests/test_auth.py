@@ -0,0 +1,65 @@
+from app import models
+
+from conftest import PASSWORD
+
+
+def test_register_and_login(client, db):
+    response = client.post(
+        "/auth/register",
+        json={
+            "name": "Ravi",
+            "email": "ravi@tests.medconnect.com",
+            "password": PASSWORD,
+        },
+    )
+    assert response.status_code == 201
+    user = db.query(models.User).filter_by(email="ravi@tests.medconnect.com").one()
+    assert user.role == models.RoleEnum.patient
+    assert len(user.records) == 1
+
+    response = client.post(
+        "/auth/login",
+        json={"email": "ravi@tests.medconnect.com", "password": PASSWORD},
+    )
+    assert response.status_code == 200
+    assert client.get("/auth/me").json()["id"] == user.id
+
+
+def test_register_rolls_back_between_tests(client):
+    # the same account as above: the previous test's commit was rolled back
+    response = client.post(
+        "/auth/register",
+        json={
+            "name": "Ravi",
+            "email": "ravi@tests.medconnect.com",
+            "password": PASSWORD,
+        },
+    )
+    assert response.status_code == 201
+
+
+def test_register_rejects_admin(client):
+    response = client.post(
+        "/auth/register",
+        json={
+            "name": "Mallory",
+            "email": "mallory@tests.medconnect.com",
+            "password": PASSWORD,
+            "role": "admin",
+        },
+    )
+    assert response.status_code == 422
+
+
+def test_login_wrong_password(client, make_user):
+    user = make_user("doctor")
+    response = client.post(
+        "/auth/login", json={"email": user.email, "password": "not-the-password"}
+    )
+    assert response.status_code == 401
+
+
+def test_bearer_token(client, make_user, headers):
+    user = make_user("lab")
+    assert client.get("/auth/me").status_code == 401
+    assert client.get("/auth/me", headers=headers(user)).json()["role"] == "lab"
@@ -0,0 +1,96 @@
+import hashlib
+
+import pytest
+from sqlalchemy import delete, select
+
+from app import models
+from app.config.database import SessionLocal
+from app.utils import blobstore
+
+CONTENT = b"%PDF-1.4 haemoglobin 13.5 g/dL"
+
+
+@pytest.fixture
+def uploads(client, db, make_user, headers):
+    """upload(data) uploads a lab file into a new assignment of one record."""
+    doctor, patient, lab = make_user("doctor"), make_user("patient"), make_user("lab")
+    record = models.MedicalRecord(patient_id=patient.id)
+    db.add(record)
+    db.commit()
+
+    def upload(data: bytes = CONTENT) -> models.TestResultFile:
+        assignment = models.LabUploadAssignment(
+            record_id=record.id,
+            patient_id=patient.id,
+            doctor_id=doctor.id,
+            lab_user_id=lab.id,
+        )
+        db.add(assignment)
+        db.commit()
+        response = client.post(
+            f"/lab/assignments/{assignment.id}/upload",
+            files={"file": ("cbc.pdf", data, "application/pdf")},
+            headers=headers(lab),
+        )
+        assert response.status_code == 201, response.text
+        return db.get(models.TestResultFile, response.json()["id"])
+
+    upload.record, upload.patient = record, patient
+    return upload
+
+
+def ref_count(db, blob_id: int) -> int:
+    db.expire_all()
+    return db.get(models.FileBlob, blob_id).ref_count
+
+
+def test_duplicates_share_a_blob(db, uploads):
+    first, second = uploads(), uploads()
+    assert first.blob_id == second.blob_id
+    assert ref_count(db, first.blob_id) == 2
+    assert uploads(b"other content").blob_id != first.blob_id
+
+
+def test_store_leaves_callers_transaction_alone(db, uploads):
+    patient = uploads.patient
+    patient.name = "not committed yet"
+    db.flush()
+    transaction = db.get_transaction()
+    sha256 = hashlib.sha256(b"new content").hexdigest()
+    blob = blobstore.store(db, sha256, 11, patient.id, b"k" * 32, blobstore.new_key())
+
+    assert db.get_transaction() is transaction and transaction.is_active
+    with SessionLocal() as other:
+        assert blobstore.find_blob(other, sha256).id == blob.id
+
+
+def test_session_delete_releases(db, uploads):
+    test_file = uploads()
+    uploads()
+    db.delete(test_file)
+    db.commit()
+    assert ref_count(db, test_file.blob_id) == 1
+
+
+def test_cascade_delete_releases(db, uploads):
+    blob_id = uploads().blob_id
+    uploads()
+    db.delete(uploads.record)
+    db.commit()
+    assert ref_count(db, blob_id) == 0
+
+
+def test_bulk_delete_releases(db, uploads):
+    kept = uploads()
+    blob_id = uploads().blob_id
+    uploads()
+    other = uploads(b"other content")
+    db.execute(delete(models.TestResultFile).where(models.TestResultFile.id != kept.id))
+    db.commit()
+    assert ref_count(db, blob_id) == 1
+    assert ref_count(db, other.blob_id) == 0
+
+    db.query(models.TestResultFile).delete()
+    db.commit()
+    assert ref_count(db, blob_id) == 0
+    assert db.scalars(select(models.TestResultFile)).all() == []
@@ -0,0 +1,18 @@
+import pytest
+
+
+@pytest.mark.parametrize(
+    "params, status",
+    [
+        ({}, 200),
+        ({"skip": 10, "limit": 200}, 200),
+        ({"skip": -1}, 422),
+        ({"limit": 0}, 422),
+        ({"limit": 201}, 422),
+    ],
+)
+def test_my_patients_paging(client, make_user, headers, params, status):
+    response = client.get(
+        "/doctors/patients", params=params, headers=headers(make_user("doctor"))
+    )
+    assert response.status_code == status
@@ -0,0 +1,104 @@
+"""
+Import-time budget of the app.
+
+`import app.main` runs in every worker, test process and tool before anything
+else, so it must not touch the database or the disk, must leave the modules
+only requests need (password hashing, JWT, AES-GCM, migrations) for later,
+and must stay under IMPORT_TIME_BUDGET_MS as measured by `-X importtime`
+(best of three runs, in a fresh interpreter each).
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_TIME_BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", "2000"))
+
+# imported on first use, not with the app
+DEFERRED = [
+    "passlib",
+    "jose",
+    "cryptography.hazmat.primitives.ciphers.aead",
+    "cryptography.x509",
+    "alembic",
+    "boto3",
+]
+
+
+def import_app(
+    workdir, database_url: str = ""
+) -> tuple[list[str], dict[str, tuple[int, int]]]:
+    """Import the app in a fresh interpreter inside `workdir`.
+
+    Returns the modules it loaded and, per module, the (self, cumulative)
+    microseconds reported by -X importtime.
+    """
+    env = {
+        **os.environ,
+        "PYTHONPATH": BACKEND,
+        "DATABASE_URL": database_url or f"sqlite:///{workdir}/app.db",
+        "CACHE_URL": f"sqlite:///{workdir}/cache.db",
+        "RATE_LIMIT_STORAGE_URI": f"sqlite:///{workdir}/ratelimit.db",
+        "METRICS_DIR": "",
+    }
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            "import sys, app.main; print(*sys.modules, sep='\\n')",
+        ],
+        cwd=workdir,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            own, cumulative, name = line[len("import time:") :].split("|")
+            if own.strip().isdigit():
+                times[name.strip()] = (int(own), int(cumulative))
+    return result.stdout.split(), times
+
+
+@pytest.fixture(scope="module")
+def imported(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp("import")
+    modules, times = import_app(workdir)
+    return workdir, modules, times
+
+
+def test_import_does_no_io(imported):
+    workdir, _, _ = imported
+    # no database connection, cache or rate-limit file until they are used
+    assert os.listdir(workdir) == []
+
+
+def test_import_with_in_memory_sqlite(tmp_path):
+    # no pool size settings for its SingletonThreadPool
+    modules, _ = import_app(tmp_path, "sqlite://")
+    assert "app.main" in modules
+
+
+@pytest.mark.parametrize("name", DEFERRED)
+def test_import_defers(imported, name):
+    _, modules, _ = imported
+    assert not [m for m in modules if m == name or m.startswith(name + ".")]
+
+
+def test_import_time_budget(tmp_path):
+    runs = [import_app(tmp_path)[1] for _ in range(3)]
+    best = min(runs, key=lambda times: times["app.main"][1])
+    total_ms = best["app.main"][1] / 1000
+    slowest = sorted(best.items(), key=lambda item: -item[1][0])[:10]
+    assert total_ms <= IMPORT_TIME_BUDGET_MS, (
+        f"import app.main took {total_ms:.0f} ms "
+        f"(budget {IMPORT_TIME_BUDGET_MS:.0f} ms); slowest modules: "
+        + ", ".join(f"{name} {own / 1000:.0f} ms" for name, (own, _) in slowest)
+    )
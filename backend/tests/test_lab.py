@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app import models
+from app.config.database import engine
+from app.utils import audit
+
+
+@pytest.fixture
+def assignment(db, make_user):
+    """new(**fields) creates an open assignment for one lab user."""
+    doctor, patient, lab = make_user("doctor"), make_user("patient"), make_user("lab")
+    record = models.MedicalRecord(patient_id=patient.id)
+    db.add(record)
+    db.commit()
+
+    def new(**fields) -> models.LabUploadAssignment:
+        row = models.LabUploadAssignment(
+            record_id=record.id,
+            patient_id=patient.id,
+            doctor_id=doctor.id,
+            lab_user_id=lab.id,
+            **fields,
+        )
+        db.add(row)
+        db.commit()
+        return row
+
+    new.lab = lab
+    return new
+
+
+def upload(client, headers, assignment, lab):
+    return client.post(
+        f"/lab/assignments/{assignment.id}/upload",
+        files={"file": ("cbc.pdf", b"%PDF-1.4 cbc", "application/pdf")},
+        headers=headers(lab),
+    )
+
+
+def test_upload(client, db, headers, assignment):
+    row = assignment()
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        response = upload(client, headers, row, assignment.lab)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    # the response is built from the flushed row, not read back
+    assert not [
+        s
+        for s in statements
+        if s.startswith("SELECT") and "FROM test_result_files" in s
+    ]
+    assert response.status_code == 201
+    body = response.json()
+    assert body["created_at"] and body["assignment_id"] == row.id
+    db.expire_all()
+    assert row.status == models.LabUploadAssignmentStatus.uploaded
+    assert upload(client, headers, row, assignment.lab).status_code == 409
+
+
+def test_upload_is_one_unit_of_work(client, db, headers, assignment, monkeypatch):
+    row = assignment()
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("audit unavailable")
+
+    monkeypatch.setattr(audit, "log", fail)
+    with pytest.raises(RuntimeError):
+        upload(client, headers, row, assignment.lab)
+    db.expire_all()
+    assert db.query(models.TestResultFile).filter_by(assignment_id=row.id).count() == 0
+    assert row.status == models.LabUploadAssignmentStatus.assigned
+
+
+def test_expired_assignment(client, headers, assignment):
+    row = assignment(expires_at=datetime.utcnow() - timedelta(minutes=1))
+    response = upload(client, headers, row, assignment.lab)
+    assert response.status_code == 409
+    assert response.json()["detail"] == f"Assignment {row.id} expired"
@@ -0,0 +1,24 @@
+import time
+
+import pytest
+from sqlalchemy import create_engine, exc, text
+
+from app.utils import metrics
+
+
+def test_failed_queries_are_not_timed():
+    engine = create_engine("sqlite://")
+    metrics.instrument_engine(engine)
+    timings, token = metrics.start_request()
+    try:
+        with engine.connect() as conn:
+            for _ in range(3):
+                with pytest.raises(exc.OperationalError):
+                    conn.execute(text("SELECT * FROM missing"))
+            time.sleep(0.05)
+            assert conn.execute(text("SELECT 1")).scalar() == 1
+            assert conn.info == {}  # nothing left behind by the failures
+    finally:
+        metrics.end_request(token)
+    assert timings.queries == 1
+    assert timings.spans["db"] < 0.05
@@ -0,0 +1,59 @@
+import threading
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from slowapi import Limiter
+
+from app.utils import ratelimit
+
+
+@pytest.fixture(params=["memory://", "sqlite"])
+def storage_uri(request, tmp_path):
+    if request.param == "sqlite":
+        return f"sqlite:///{tmp_path}/ratelimit.db"
+    return request.param
+
+
+def make_app(storage_uri: str, limits: str = "2/minute") -> FastAPI:
+    app = FastAPI()
+    app.state.limiter = Limiter(
+        key_func=ratelimit.principal_key,
+        strategy="token-bucket",
+        storage_uri=storage_uri,
+    )
+    app.add_middleware(ratelimit.RateLimitMiddleware, limits=limits)
+
+    @app.get("/ping")
+    async def ping():
+        return {"thread": threading.get_ident()}
+
+    @app.get("/health")
+    @app.state.limiter.exempt
+    async def health():
+        return {}
+
+    return app
+
+
+def test_application_limit(storage_uri):
+    client = TestClient(make_app(storage_uri))
+    assert [client.get("/ping").status_code for _ in range(3)] == [200, 200, 429]
+    assert client.get("/ping").json() == {
+        "error": "Rate limit exceeded: 2 per 1 minute"
+    }
+    assert client.get("/health").status_code == 200
+
+
+def test_sqlite_buckets_are_taken_off_the_event_loop(tmp_path, monkeypatch):
+    threads = []
+    acquire = ratelimit.SQLiteStorage.acquire_tokens
+
+    def recording(self, *args):
+        threads.append(threading.get_ident())
+        return acquire(self, *args)
+
+    monkeypatch.setattr(ratelimit.SQLiteStorage, "acquire_tokens", recording)
+    client = TestClient(make_app(f"sqlite:///{tmp_path}/ratelimit.db"))
+    loop_thread = client.get("/ping").json()["thread"]
+    assert threads and loop_thread not in threads
@@ -0,0 +1,28 @@
+import asyncio
+
+import anyio
+
+from app.utils import scheduler
+
+
+def test_jobs_do_not_use_the_request_threadpool(connection, monkeypatch):
+    borrowed = []
+
+    async def main():
+        requests = anyio.to_thread.current_default_thread_limiter()
+        done = asyncio.Event()
+        loop = asyncio.get_running_loop()
+
+        def probe(db):
+            borrowed.append(requests.borrowed_tokens)
+            loop.call_soon_threadsafe(done.set)
+
+        monkeypatch.setattr(scheduler, "JOBS", [scheduler.Job("probe", 60, probe)])
+        task = asyncio.create_task(scheduler.run_scheduler())
+        try:
+            await asyncio.wait_for(done.wait(), timeout=10)
+        finally:
+            task.cancel()
+
+    asyncio.run(main())
+    assert borrowed == [0]
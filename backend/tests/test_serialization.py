@@ -0,0 +1,30 @@
+from app import schemas
+from app.utils import serialization
+
+
+def test_subset_cache_key_is_normalised():
+    model = serialization.subset(schemas.AppointmentOut, frozenset({"status", "id"}))
+    assert list(model.model_fields) == ["id", "status"]
+    assert (
+        serialization.subset(schemas.AppointmentOut, {"id": True, "status": True})
+        is model
+    )
+    assert (
+        serialization.subset(schemas.AppointmentOut, {"__all__": {"status", "id"}})
+        is model
+    )
+
+
+def test_subset_cache_is_bounded():
+    names = list(schemas.AppointmentOut.model_fields)
+    for i in range(serialization.SUBSET_CACHE_SIZE + 10):
+        mask = {name for bit, name in enumerate(names) if (i + 1) >> bit & 1}
+        model = serialization.subset(schemas.AppointmentOut, mask)
+        serialization.list_adapter(model)
+    assert (
+        serialization._subset.cache_info().currsize <= serialization.SUBSET_CACHE_SIZE
+    )
+    assert (
+        serialization._subset_adapter.cache_info().currsize
+        <= serialization.SUBSET_CACHE_SIZE
+    )
@@ -0,0 +1,153 @@
+"""Both storage backends, the S3 one against moto's in-process S3."""
+
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.utils import storage
+
+PART = 5 * 1024 * 1024  # S3's smallest part
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    moto = pytest.importorskip("moto")
+    for name, value in {
+        "AWS_ACCESS_KEY_ID": "testing",
+        "AWS_SECRET_ACCESS_KEY": "testing",
+        "AWS_DEFAULT_REGION": "us-east-1",
+    }.items():
+        monkeypatch.setenv(name, value)
+    with moto.mock_aws():
+        backend = storage.S3Storage("medconnect-tests", prefix="files", part_size=PART)
+        backend.client.create_bucket(Bucket="medconnect-tests")
+        yield backend
+
+
+@pytest.fixture(params=["local", "s3"])
+def backend(request, tmp_path):
+    if request.param == "s3":
+        return request.getfixturevalue("s3")
+    return storage.LocalStorage(str(tmp_path))
+
+
+def pending_writes(backend) -> int:
+    """Started but neither committed nor aborted."""
+    if isinstance(backend, storage.S3Storage):
+        uploads = backend.client.list_multipart_uploads(Bucket=backend.bucket)
+        return len(uploads.get("Uploads", []))
+    return sum(
+        name.endswith(".tmp") for _, _, names in os.walk(backend.root) for name in names
+    )
+
+
+def pending_age(backend) -> timedelta:
+    """How long ago the oldest pending write started, as the backend reports it.
+
+    moto dates every multipart upload in 2010.
+    """
+    if isinstance(backend, storage.S3Storage):
+        uploads = backend.client.list_multipart_uploads(Bucket=backend.bucket)
+        started = min(u["Initiated"] for u in uploads["Uploads"])
+        return datetime.now(timezone.utc) - started
+    started = min(
+        os.stat(os.path.join(dirpath, name)).st_mtime
+        for dirpath, _, names in os.walk(backend.root)
+        for name in names
+        if name.endswith(".tmp")
+    )
+    return timedelta(seconds=time.time() - started)
+
+
+def test_write_commit(backend):
+    with backend.open_write("blobs/ab/small") as w:
+        w.write(b"hello ")
+        assert not backend.exists("blobs/ab/small")
+        w.write(b"world")
+    assert backend.exists("blobs/ab/small")
+    with backend.open_read("blobs/ab/small") as f:
+        assert f.read() == b"hello world"
+
+
+def test_multipart_write(backend):
+    data = os.urandom(2 * PART + 1000)
+    with backend.open_write("blobs/ab/large") as w:
+        for i in range(0, len(data), 1024 * 1024):
+            w.write(data[i : i + 1024 * 1024])
+        if isinstance(backend, storage.S3Storage):
+            assert len(w._parts) == 2  # full parts are sent as they fill up
+    with backend.open_read("blobs/ab/large") as f:
+        assert f.read() == data
+    assert pending_writes(backend) == 0
+
+
+def test_write_aborts_on_error(backend):
+    with pytest.raises(RuntimeError):
+        with backend.open_write("blobs/ab/failed") as w:
+            w.write(os.urandom(PART + 1))
+            assert pending_writes(backend) == 1
+            raise RuntimeError("client went away")
+    assert not backend.exists("blobs/ab/failed")
+    assert pending_writes(backend) == 0
+
+
+def test_ranged_reads(backend, monkeypatch):
+    monkeypatch.setattr(storage, "S3_SEEK_READ_BYTES", 100)
+    data = bytes(range(256)) * 4
+    with backend.open_write("blobs/ab/ranged") as w:
+        w.write(data)
+
+    with backend.open_read("blobs/ab/ranged", start=1000) as f:
+        assert f.read() == data[1000:]
+
+    with backend.open_read("blobs/ab/ranged") as f:
+        assert f.read(10) == data[:10]
+        f.seek(50)  # read through
+        assert f.read(10) == data[50:60]
+        f.seek(500)  # new ranged GET
+        assert f.tell() == 500
+        assert f.read(10) == data[500:510]
+        f.seek(5)  # backwards
+        assert f.read(5) == data[5:10]
+        f.seek(len(data))
+        assert f.read(10) == b""
+
+    with backend.open_read("blobs/ab/ranged", start=len(data)) as f:
+        assert f.read() == b""
+
+
+def test_read_missing(backend):
+    with pytest.raises(FileNotFoundError):
+        backend.open_read("blobs/ab/missing")
+    assert backend.version("blobs/ab/missing") is None
+
+
+def test_version_and_delete(backend):
+    with backend.open_write("blobs/ab/versioned") as w:
+        w.write(b"one")
+    first = backend.version("blobs/ab/versioned")
+    with backend.open_write("blobs/ab/versioned") as w:
+        w.write(b"two, longer")
+    assert backend.version("blobs/ab/versioned") not in (None, first)
+    backend.delete("blobs/ab/versioned")
+    backend.delete("blobs/ab/versioned")
+    assert not backend.exists("blobs/ab/versioned")
+
+
+def test_clean_incomplete(backend):
+    with backend.open_write("blobs/ab/kept") as w:
+        w.write(b"committed")
+    # a worker killed mid-upload never commits nor aborts
+    w = backend.open_write("blobs/ab/orphan")
+    w.write(os.urandom(PART + 1))
+    assert pending_writes(backend) == 1
+
+    assert backend.clean_incomplete(pending_age(backend) + timedelta(hours=1)) == 0
+    assert pending_writes(backend) == 1
+    assert backend.clean_incomplete(timedelta(0)) == 1
+    assert pending_writes(backend) == 0
+    assert not backend.exists("blobs/ab/orphan")
+    with backend.open_read("blobs/ab/kept") as f:
+        assert f.read() == b"committed"
@@ -1,7 +1,7 @@
 "use client";
 import { useEffect, useState } from "react";
 import Navbar from "@/components/Navbar";
-import { getDoctorAppointments, confirmAppointment } from "@/lib/api";
+import { getDoctorDashboard, confirmAppointment } from "@/lib/api";
 import { Calendar, CheckCircle, Clock, Users } from "lucide-react";
 import Link from "next/link";
 import { useAuth } from "@/context/AuthContext";
@@ -13,15 +13,20 @@ interface Appointment {
   patient: { id: number; name: string; email: string; phone?: string };
 }
 
+// only what this page shows, in one request
+const DASHBOARD_FIELDS = "appointments.id,appointments.date,appointments.time_slot,appointments.status,appointments.notes,appointments.patient,patients";
+
 export default function DoctorDashboard() {
   const { user } = useAuth();
   const [appointments, setAppointments] = useState<Appointment[]>([]);
+  const [patientCount, setPatientCount] = useState(0);
   const [loading, setLoading] = useState(true);
 
   const fetchAppts = async () => {
     try {
-      const res = await getDoctorAppointments();
-      setAppointments(res.data);
+      const res = await getDoctorDashboard(DASHBOARD_FIELDS);
+      setAppointments(res.data.appointments);
+      setPatientCount(res.data.patients.length);
     } finally {
       setLoading(false);
     }
@@ -52,7 +57,7 @@ export default function DoctorDashboard() {
           {[
             { label: "Today's Appointments", value: todayAppts.length, icon: Calendar, color: "#3b82f6" },
             { label: "Pending Confirmation", value: pending.length, icon: Clock, color: "#f59e0b" },
-            { label: "Total Patients", value: new Set(appointments.map((a) => a.patient?.id)).size, icon: Users, color: "#a78bfa" },
+            { label: "Total Patients", value: patientCount, icon: Users, color: "#a78bfa" },
           ].map(({ label, value, icon: Icon, color }) => (
             <div key={label} className="stat-card flex items-center gap-4">
               <div className="p-3 rounded-xl" style={{ background: `${color}20` }}>
@@ -5,14 +5,28 @@ import { getMyPatients } from "@/lib/api";
 import { Users, User } from "lucide-react";
 import Link from "next/link";
 
-interface Patient { id: number; name: string; email: string; phone?: string; }
+interface Patient {
+  id: number; name: string; email: string; phone?: string;
+  visit_count: number; last_visit?: string; next_appointment?: string;
+}
+
+const PAGE_SIZE = 50;
 
 export default function DoctorPatientsPage() {
   const [patients, setPatients] = useState<Patient[]>([]);
+  const [total, setTotal] = useState(0);
   const [loading, setLoading] = useState(true);
 
+  const load = (skip: number) =>
+    getMyPatients({ skip, limit: PAGE_SIZE })
+      .then((r) => {
+        setPatients((prev) => (skip ? [...prev, ...r.data.items] : r.data.items));
+        setTotal(r.data.total);
+      })
+      .finally(() => setLoading(false));
+
   useEffect(() => {
-    getMyPatients().then((r) => setPatients(r.data)).finally(() => setLoading(false));
+    load(0);
   }, []);
 
   return (
@@ -45,12 +59,22 @@ export default function DoctorPatientsPage() {
                   <p className="font-semibold" style={{ color: "var(--text-primary)" }}>{p.name}</p>
                   <p className="text-sm" style={{ color: "var(--text-secondary)" }}>{p.email}</p>
                   {p.phone && <p className="text-sm" style={{ color: "var(--text-secondary)" }}>{p.phone}</p>}
+                  <p className="text-xs mt-1" style={{ color: "var(--text-secondary)" }}>
+                    {p.visit_count} visit{p.visit_count === 1 ? "" : "s"}
+                    {p.last_visit && ` · last ${p.last_visit}`}
+                    {p.next_appointment && ` · next ${p.next_appointment}`}
+                  </p>
                 </div>
                 <User size={16} style={{ color: "var(--accent)" }} />
               </Link>
             ))}
           </div>
         )}
+        {patients.length < total && (
+          <button className="btn-primary mt-6" onClick={() => load(patients.length)}>
+            Load more
+          </button>
+        )}
       </main>
     </div>
   );
@@ -2,7 +2,7 @@
 
 import { useEffect, useState } from "react";
 import Navbar from "@/components/Navbar";
-import { getMyLabAssignments } from "@/lib/api";
+import { getLabDashboard } from "@/lib/api";
 import Link from "next/link";
 import { FileText } from "lucide-react";
 
@@ -10,8 +10,8 @@ export default function LabDashboard() {
   const [count, setCount] = useState<number | null>(null);
 
   useEffect(() => {
-    getMyLabAssignments()
-      .then((res) => setCount(res.data.filter((a: { status: string }) => a.status === "assigned").length))
+    getLabDashboard("status_counts")
+      .then((res) => setCount(res.data.status_counts.assigned ?? 0))
       .catch(() => setCount(0));
   }, []);
 
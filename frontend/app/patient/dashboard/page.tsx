@@ -2,7 +2,7 @@
 import { useEffect, useState } from "react";
 import { useAuth } from "@/context/AuthContext";
 import Navbar from "@/components/Navbar";
-import { getMyAppointments, cancelAppointment } from "@/lib/api";
+import { getPatientDashboard, cancelAppointment } from "@/lib/api";
 import { Calendar, Clock, UserCheck, XCircle, Activity } from "lucide-react";
 import Link from "next/link";
 
@@ -11,10 +11,12 @@ interface Appointment {
   date: string;
   time_slot: string;
   status: "pending" | "confirmed" | "cancelled";
-  notes?: string;
   doctor: { id: number; name: string; specialty?: string };
 }
 
+// only what this page shows, in one request
+const DASHBOARD_FIELDS = "appointments.id,appointments.date,appointments.time_slot,appointments.status,appointments.doctor";
+
 export default function PatientDashboard() {
   const { user } = useAuth();
   const [appointments, setAppointments] = useState<Appointment[]>([]);
@@ -22,8 +24,8 @@ export default function PatientDashboard() {
 
   const fetchAppts = async () => {
     try {
-      const res = await getMyAppointments();
-      setAppointments(res.data);
+      const res = await getPatientDashboard(DASHBOARD_FIELDS);
+      setAppointments(res.data.appointments);
     } finally {
       setLoading(false);
     }
@@ -39,6 +39,8 @@ export const cancelAppointment = (id: number) =>
 export const getMyRecords = () => api.get("/patients/records");
 export const getMyRecordTestFiles = (recordId: number) =>
     api.get(`/patients/records/${recordId}/test-files`);
+export const getPatientDashboard = (fields?: string) =>
+    api.get("/patients/dashboard", { params: { fields } });
 
 // DOCTOR
 export const getDoctorAppointments = () => api.get("/doctors/appointments");
@@ -52,8 +54,14 @@ export const appendReport = (
     recordId: number,
     data: { content: string; diagnosis?: string; prescription?: string }
 ) => api.post(`/doctors/records/${recordId}/reports`, data);
-export const getMyPatients = () => api.get("/doctors/patients");
+// { total, items }; items carry visit_count, last_visit and next_appointment
+export const getMyPatients = (params?: { skip?: number; limit?: number; sort?: "last_visit" | "name" }) =>
+    api.get("/doctors/patients", { params });
 export const getLabUsers = () => api.get("/doctors/lab-users");
+// appointments, patients, records (with reports and files) and lab assignments
+// in one request; `fields` e.g. "appointments.id,appointments.status,patients"
+export const getDoctorDashboard = (fields?: string) =>
+    api.get("/doctors/dashboard", { params: { fields } });
 
 export const createLabAssignment = (
     recordId: number,
@@ -66,6 +74,8 @@ export const getRecordTestFilesAsDoctor = (recordId: number) =>
 
 // LAB
 export const getMyLabAssignments = () => api.get("/lab/assignments");
+export const getLabDashboard = (fields?: string) =>
+    api.get("/lab/dashboard", { params: { fields } });
 export const uploadLabTestResult = (assignmentId: number, file: File) => {
     const form = new FormData();
     form.append("file", file);